@@ -2,16 +2,19 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from app.models.user import User
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
-from app.models.database import get_db
+from app.models.database import get_async_db, get_db
 from app.utils.authentication import decode_access_token
-from app.models.revoked_token import RevokedToken
+from app.services.auth_cache import cache_user, get_cached_user, token_cache
+from app.services.revoked_tokens import is_token_revoked, is_token_revoked_async
 
 # OAuth2 auth scheme configuration
 oauth2 = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-def get_current_user(token: str = Depends(oauth2), db: Session = Depends(get_db)):
-    """Retrieves the current user based on the JWT token."""
+
+def _decode_token_subject(token: str) -> tuple[int, dict]:
+    """Decodes an access token and returns its user id ("sub") and payload."""
     payload = decode_access_token(token, expected_type="access")
 
     # Validate that the token contains the "sub" field
@@ -20,11 +23,40 @@ def get_current_user(token: str = Depends(oauth2), db: Session = Depends(get_db)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token."
         )
-    
-    # Check if the token has been revoked by looking up its jti in the RevokedToken table.
+    return int(user_id_str), payload
+
+
+def _ensure_active_user(user: User | None) -> User:
+    """Rejects tokens of deleted or inactive users."""
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found or deleted.",
+        )
+    if not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User is inactive. Please contact an administrator to activate your account.",
+        )
+    return user
+
+
+def get_current_user(token: str = Depends(oauth2), db: Session = Depends(get_db)):
+    """Retrieves the current user based on the JWT token.
+
+    Tokens verified in the last AUTH_CACHE_TTL_SECONDS are served from the auth cache
+    (app/services/auth_cache.py) without touching the database.
+    """
+    user = get_cached_user(token)
+    if user is not None:
+        return user
+    generation = token_cache.generation()
+    user_id, payload = _decode_token_subject(token)
     jti = payload.get("jti")
+
+    # Check if the token has been revoked (in-memory set, RevokedToken table as a fallback).
     try:
-        if jti and db.get(RevokedToken, jti):
+        if jti and is_token_revoked(db, jti):
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has been revoked.")
     except HTTPException:
         raise
@@ -34,8 +66,6 @@ def get_current_user(token: str = Depends(oauth2), db: Session = Depends(get_db)
             detail="Database connection error.",
         )
 
-    user_id = int(user_id_str) 
-
     # Check if the user still exists in the database
     try:
         statement = select(User).where(User.id == user_id)
@@ -46,17 +76,36 @@ def get_current_user(token: str = Depends(oauth2), db: Session = Depends(get_db)
             detail="Database connection error.",
         )
 
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found or deleted.",
-        )
-    if not user.is_active:
+    user = _ensure_active_user(user)
+    cache_user(token, payload, user, generation)
+    return user
+
+
+async def get_current_user_async(
+    token: str = Depends(oauth2), db: AsyncSession = Depends(get_async_db)
+):
+    """Same checks as get_current_user, on the async session (for `async def` routes)."""
+    user = get_cached_user(token)
+    if user is not None:
+        return user
+    generation = token_cache.generation()
+    user_id, payload = _decode_token_subject(token)
+    jti = payload.get("jti")
+
+    try:
+        if jti and await is_token_revoked_async(db, jti):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has been revoked.")
+        user = (await db.exec(select(User).where(User.id == user_id))).first()
+    except HTTPException:
+        raise
+    except SQLAlchemyError:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User is inactive. Please contact an administrator to activate your account.",
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database connection error.",
         )
 
+    user = _ensure_active_user(user)
+    cache_user(token, payload, user, generation)
     return user
 
 
@@ -67,4 +116,4 @@ def require_admin(user: User = Depends(get_current_user)) -> User:
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You do not have permission to perform this action."
         )
-    return user 
\ No newline at end of file
+    return user 
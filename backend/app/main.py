@@ -1,6 +1,10 @@
+import asyncio
+import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.models.database import create_db_and_tables
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session
+from app.models.database import async_engine, create_db_and_tables, engine, replica_async_engine
 from app.routers import (
     auth,
     product_categories,
@@ -9,21 +13,153 @@ from app.routers import (
     stock,
     warehouses,
     stock_moves,
+    metrics,
     websocket
 )
 from fastapi.middleware.cors import CORSMiddleware  
 from app.routers import stock_moves
 from dotenv import load_dotenv  # To load environment variables from a .env file (local development)
 from app.utils.getenv import get_required_env  
+from app.services.auth_cache import clear_all as clear_auth_cache, on_tokens_revoked, on_user_changed
+from app.services.dashboard_cache import clear_all as clear_dashboard_caches, on_stock_changed
+from app.services.notification_bus import (
+    MOVEMENTS_RECORDED,
+    STOCK_CHANGED,
+    TOKENS_REVOKED,
+    USER_CHANGED,
+    notification_listener,
+)
+from app.services.revoked_tokens import (
+    REVOKED_TOKENS_PURGE_INTERVAL,
+    REVOKED_TOKENS_RELOAD_INTERVAL,
+    load_revoked_tokens,
+    on_tokens_revoked as remember_revoked_tokens,
+    purge_expired_revoked_tokens,
+    revoked_tokens,
+)
+from app.services.stock_move_service import purge_expired_idempotency_keys
+from app.utils.password_hashing import password_hash_pool
+from app.utils.query_log import RequestContextMiddleware
 
 # Load environment variables from a .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Seconds between two purges of expired Idempotency-Keys
+IDEMPOTENCY_PURGE_INTERVAL = int(get_required_env("IDEMPOTENCY_PURGE_INTERVAL_SECONDS", fallback="3600"))
+
+
+def _purge_idempotency_keys() -> int:
+    with Session(engine) as db:
+        return purge_expired_idempotency_keys(db)
+
+
+async def _purge_idempotency_keys_periodically():
+    """Removes expired Idempotency-Keys in the background for the lifetime of the app."""
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_PURGE_INTERVAL)
+        try:
+            purged = await run_in_threadpool(_purge_idempotency_keys)
+            logger.info("Purged %d expired idempotency keys", purged)
+        except Exception as e:
+            logger.warning("Idempotency key purge failed: %s", str(e))
+
+
+def _reload_revoked_tokens() -> int:
+    with Session(engine) as db:
+        return load_revoked_tokens(db)
+
+
+async def _reload_revoked_tokens_once():
+    try:
+        loaded = await run_in_threadpool(_reload_revoked_tokens)
+        logger.info("Loaded %d revoked tokens", loaded)
+    except Exception as e:
+        logger.warning("Revoked token reload failed: %s", str(e))
+        return
+    if not notification_listener.connected.is_set():
+        # Lost while loading: revocations from other workers may be missed from now on.
+        revoked_tokens.reset()
+
+
+async def _reload_revoked_tokens_periodically():
+    """Keeps this worker's revoked token set in step with `revoked_tokens`, dropping expired tokens.
+
+    Skipped while the LISTEN connection is down: the set would miss the revocations
+    announced meanwhile, so checks go to the database until it is back.
+    """
+    while True:
+        await asyncio.sleep(REVOKED_TOKENS_RELOAD_INTERVAL)
+        if notification_listener.connected.is_set():
+            await _reload_revoked_tokens_once()
+
+
+def _purge_revoked_tokens() -> int:
+    with Session(engine) as db:
+        return purge_expired_revoked_tokens(db)
+
+
+async def _purge_revoked_tokens_periodically():
+    """Deletes expired rows of `revoked_tokens` in the background for the lifetime of the app."""
+    while True:
+        await asyncio.sleep(REVOKED_TOKENS_PURGE_INTERVAL)
+        try:
+            purged = await run_in_threadpool(_purge_revoked_tokens)
+            logger.info("Purged %d expired revoked tokens", purged)
+        except Exception as e:
+            logger.warning("Revoked token purge failed: %s", str(e))
+
+
+def _forget_revoked_tokens():
+    """Revocations announced while the LISTEN connection is down are lost: ask the database until reloaded."""
+    revoked_tokens.reset()
+
+
+def _resync_revoked_tokens():
+    """Reloads the set once the LISTEN connection is back."""
+    asyncio.ensure_future(_reload_revoked_tokens_once())
+
+
+# Events from every worker (NOTIFY tabulae_stock). Invalidations missed while the
+# LISTEN connection was down can't be replayed, so the caches are dropped instead.
+notification_listener.subscribe(STOCK_CHANGED, on_stock_changed)
+notification_listener.subscribe(MOVEMENTS_RECORDED, websocket.on_movements_recorded)
+notification_listener.subscribe(USER_CHANGED, on_user_changed)
+notification_listener.subscribe(TOKENS_REVOKED, on_tokens_revoked)
+notification_listener.subscribe(TOKENS_REVOKED, remember_revoked_tokens)
+notification_listener.on_reconnect(clear_dashboard_caches)
+notification_listener.on_reconnect(clear_auth_cache)
+notification_listener.on_reconnect(_resync_revoked_tokens)
+notification_listener.on_disconnect(clear_auth_cache)
+notification_listener.on_disconnect(_forget_revoked_tokens)
+
+
 # Create the database and tables when the app starts
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_db_and_tables()
+    password_hash_pool.start()
+    purge_task = asyncio.create_task(_purge_idempotency_keys_periodically())
+    notification_listener.start()
+    # Loaded once the listener is connected, so revocations announced meanwhile are not missed.
+    try:
+        await asyncio.wait_for(notification_listener.connected.wait(), timeout=5)
+    except asyncio.TimeoutError:
+        logger.warning("LISTEN connection not up yet, checking revoked tokens in the database")
+    else:
+        await _reload_revoked_tokens_once()
+    revoked_tokens_task = asyncio.create_task(_reload_revoked_tokens_periodically())
+    revoked_tokens_purge_task = asyncio.create_task(_purge_revoked_tokens_periodically())
     yield  # This is where connections or other resources can be closed
+    purge_task.cancel()
+    revoked_tokens_task.cancel()
+    revoked_tokens_purge_task.cancel()
+    password_hash_pool.shutdown()
+    await notification_listener.stop()
+    await async_engine.dispose()
+    if replica_async_engine is not None:
+        await replica_async_engine.dispose()
 
 
 app = FastAPI(
@@ -44,9 +180,13 @@ app.add_middleware(
     allow_origins=origins,
     allow_credentials=True,  # Allow cookies (e.g., refresh_token)
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["Authorization", "Content-Type"],
+    allow_headers=["Authorization", "Content-Type", "Idempotency-Key"],
+    expose_headers=["Idempotent-Replayed"],
 )
 
+# Exposes the current route to the slow-query log
+app.add_middleware(RequestContextMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(users.router)
@@ -55,6 +195,7 @@ app.include_router(stock_moves.router)
 app.include_router(warehouses.router)
 app.include_router(stock.router)
 app.include_router(product_categories.router)
+app.include_router(metrics.router)
 
 # WebSocket
 app.include_router(websocket.router)
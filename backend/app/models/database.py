@@ -1,12 +1,210 @@
+import asyncio
+import logging
+import time
+import uuid
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.utils.getenv import get_required_env
-import os
+from app.utils.metrics import pool_checkout_wait
+from app.utils.query_log import SlowQueryLog
+
+logger = logging.getLogger(__name__)
 
 # Connect to the existing database
 DATABASE_URL = get_required_env("DATABASE_URL")
 
-echo = get_required_env("ENVIRONMENT", fallback="development") != "production"
-engine = create_engine(DATABASE_URL, echo=echo)
+# SQL echo is opt-in: formatting every statement costs more CPU than many of the queries.
+echo = get_required_env("DB_ECHO", fallback="false").lower() == "true"
+
+# Statements slower than this are logged by app.utils.query_log (0 = disabled).
+SLOW_QUERY_MS = float(get_required_env("DB_SLOW_QUERY_MS", fallback="500"))
+
+# Connection pool, per engine and per worker process (Gunicorn workers x 2 engines x
+# (DB_POOL_SIZE + DB_MAX_OVERFLOW) must stay below the server's max_connections).
+POOL_SIZE = int(get_required_env("DB_POOL_SIZE", fallback="5"))
+MAX_OVERFLOW = int(get_required_env("DB_MAX_OVERFLOW", fallback="10"))
+POOL_TIMEOUT = float(get_required_env("DB_POOL_TIMEOUT", fallback="30"))  # seconds waiting for a connection
+POOL_RECYCLE = int(get_required_env("DB_POOL_RECYCLE", fallback="1800"))  # seconds, -1 = never
+POOL_PRE_PING = get_required_env("DB_POOL_PRE_PING", fallback="true").lower() == "true"
+STATEMENT_TIMEOUT_MS = int(get_required_env("DB_STATEMENT_TIMEOUT_MS", fallback="0"))  # 0 = no limit
+
+# Optional read replica for the heavy reporting endpoints (see get_read_db).
+DATABASE_REPLICA_URL = get_required_env("DATABASE_REPLICA_URL", fallback="")
+REPLICA_MAX_STALENESS = float(get_required_env("DB_REPLICA_MAX_STALENESS_SECONDS", fallback="30"))
+REPLICA_CHECK_INTERVAL = float(get_required_env("DB_REPLICA_CHECK_INTERVAL_SECONDS", fallback="5"))
+
+# PgBouncer (transaction pooling) mode: no startup parameters and no named server-side
+# prepared statements, which PgBouncer cannot route between server connections.
+PGBOUNCER_MODE = get_required_env("DB_PGBOUNCER_MODE", fallback="false").lower() == "true"
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a free connection."""
+
+    metric_name = "sync"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_checkout_wait.observe(self.metric_name, time.perf_counter() - start, timed_out=True)
+            raise
+        pool_checkout_wait.observe(self.metric_name, time.perf_counter() - start)
+        return connection
+
+
+class TimedAsyncQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    metric_name = "async"
+
+
+class TimedReplicaQueuePool(TimedAsyncQueuePool):
+    metric_name = "replica"
+
+
+def _pool_options(poolclass) -> dict:
+    return {
+        "poolclass": poolclass,
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_pre_ping": POOL_PRE_PING,
+    }
+
+
+def _sync_connect_args() -> dict:
+    if STATEMENT_TIMEOUT_MS and not PGBOUNCER_MODE:
+        return {"options": f"-c statement_timeout={STATEMENT_TIMEOUT_MS}"}
+    return {}
+
+
+def _async_connect_args() -> dict:
+    connect_args = {}
+    if STATEMENT_TIMEOUT_MS and not PGBOUNCER_MODE:
+        connect_args["server_settings"] = {"statement_timeout": str(STATEMENT_TIMEOUT_MS)}
+    if PGBOUNCER_MODE:
+        connect_args.update(
+            statement_cache_size=0,
+            prepared_statement_cache_size=0,
+            prepared_statement_name_func=lambda: f"__asyncpg_{uuid.uuid4()}__",
+        )
+    return connect_args
+
+
+def _set_local_statement_timeout(connection):
+    """Per-transaction statement timeout, for PgBouncer where startup options are not forwarded."""
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {STATEMENT_TIMEOUT_MS}")
+
+
+engine = create_engine(
+    DATABASE_URL, echo=echo, connect_args=_sync_connect_args(), **_pool_options(TimedQueuePool)
+)
+
+# Async engine (asyncpg) on the same database, used by the read-heavy async routes.
+# Requests waiting on it don't occupy a threadpool slot.
+ASYNC_DATABASE_URL = make_url(DATABASE_URL).set(drivername="postgresql+asyncpg")
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=echo,
+    connect_args=_async_connect_args(),
+    **_pool_options(TimedAsyncQueuePool),
+)
+
+replica_async_engine = None
+if DATABASE_REPLICA_URL:
+    replica_async_engine = create_async_engine(
+        make_url(DATABASE_REPLICA_URL).set(drivername="postgresql+asyncpg"),
+        echo=echo,
+        connect_args=_async_connect_args(),
+        **_pool_options(TimedReplicaQueuePool),
+    )
+
+_sync_engines = [engine, async_engine.sync_engine]
+if replica_async_engine is not None:
+    _sync_engines.append(replica_async_engine.sync_engine)
+
+if SLOW_QUERY_MS > 0:
+    slow_query_log = SlowQueryLog(SLOW_QUERY_MS)
+    for _engine in _sync_engines:
+        slow_query_log.attach(_engine)
+
+if PGBOUNCER_MODE and STATEMENT_TIMEOUT_MS:
+    for _engine in _sync_engines:
+        event.listen(_engine, "begin", _set_local_statement_timeout)
+
+
+# Replication delay in seconds: 0 on a primary or on a replica that has replayed everything
+# it received (an idle primary does not make the replica look stale).
+REPLICA_LAG_SQL = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+
+
+class ReadEngineRouter:
+    """Chooses the engine for read-only reporting queries.
+
+    The replica is used while its replication lag is at most `max_staleness` seconds.
+    The lag is measured at most once every `check_interval` seconds. If the replica
+    is missing, unreachable or too far behind, reads go to the primary.
+    """
+
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        replica: AsyncEngine | None,
+        max_staleness: float,
+        check_interval: float,
+    ):
+        self.primary = primary
+        self.replica = replica
+        self.max_staleness = max_staleness
+        self.check_interval = check_interval
+        self._replica_usable = False
+        self._checked_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    async def replica_lag(self) -> float:
+        async with self.replica.connect() as connection:
+            return float((await connection.execute(REPLICA_LAG_SQL)).scalar())
+
+    async def engine(self) -> AsyncEngine:
+        if self.replica is None:
+            return self.primary
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            async with self._lock:
+                # Another request may have refreshed the state while we waited.
+                if time.monotonic() - self._checked_at >= self.check_interval:
+                    await self._refresh()
+        return self.replica if self._replica_usable else self.primary
+
+    async def _refresh(self) -> None:
+        try:
+            lag = await self.replica_lag()
+            usable = lag <= self.max_staleness
+            if not usable:
+                logger.warning("Read replica is %.1fs behind, reading from the primary", lag)
+        except Exception as e:
+            usable = False
+            logger.warning("Read replica unavailable, reading from the primary: %s", str(e))
+        self._replica_usable = usable
+        self._checked_at = time.monotonic()
+
+
+read_engine_router = ReadEngineRouter(
+    async_engine, replica_async_engine, REPLICA_MAX_STALENESS, REPLICA_CHECK_INTERVAL
+)
 
 
 def get_db():
@@ -15,6 +213,22 @@ def get_db():
         yield session
 
 
+async def get_async_db():
+    """Yields an async database session."""
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+async def get_read_db():
+    """Yields an async session for read-only reporting queries.
+
+    Uses the read replica (DATABASE_REPLICA_URL) when configured and fresh enough,
+    the primary otherwise. Never write through this session.
+    """
+    async with AsyncSession(await read_engine_router.engine(), expire_on_commit=False) as session:
+        yield session
+
+
 def create_db_and_tables():
     """Creates the database tables if they don't exist."""
     SQLModel.metadata.create_all(engine)
@@ -5,5 +5,5 @@ class RevokedToken(SQLModel, table=True):
     __tablename__ = "revoked_tokens"
 
     jti: str = Field(primary_key=True, description="JWT ID")
-    expires_at: datetime = Field(description="Expiration date and time of the token") 
-    #expires_at is used to automatically remove expired tokens from the database, if needed.
\ No newline at end of file
+    expires_at: datetime = Field(index=True, description="Expiration date and time of the token") 
+    #expires_at is used by the background purge of expired tokens (see app/services/revoked_tokens.py).
\ No newline at end of file
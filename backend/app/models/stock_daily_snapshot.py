@@ -0,0 +1,19 @@
+from sqlmodel import SQLModel, Field
+from datetime import date
+
+
+class StockDailySnapshot(SQLModel, table=True):
+    """Quantity of a (warehouse, product, lot) at the end of a day (UTC) on which it moved.
+
+    Rows only exist for days with movements; the quantity on any other day is the
+    one of the latest earlier snapshot. Written by the trg_update_stock_daily_snapshot
+    trigger on each INSERT of movement lines (see GET /stock/as-of).
+    """
+
+    __tablename__ = "stock_daily_snapshot"
+
+    warehouse_id: int = Field(foreign_key="warehouse.id", primary_key=True)
+    product_id: int = Field(foreign_key="product.id", primary_key=True)
+    lot: str = Field(primary_key=True, default="NO_LOT", max_length=50)
+    snapshot_date: date = Field(primary_key=True, description="Day (UTC) the quantity applies to")
+    quantity: int = Field(nullable=False, description="Quantity at the end of snapshot_date")
@@ -1,4 +1,5 @@
 from sqlmodel import SQLModel, Field
+from sqlalchemy import DateTime
 from datetime import datetime, timezone
 
 
@@ -6,6 +7,11 @@ class StockMove(SQLModel, table=True):
     __tablename__ = "stock_move"
 
     id: int = Field(default=None, primary_key=True, nullable=False,index=True)
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True)
+    # TIMESTAMPTZ, as in db_init: asyncpg refuses aware datetimes for a naive TIMESTAMP parameter.
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        index=True,
+        sa_type=DateTime(timezone=True),
+    )
     move_type: str = Field(nullable=False,index=True)  
     user_id: int = Field(foreign_key="user.id", nullable=False)
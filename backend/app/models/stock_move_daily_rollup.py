@@ -0,0 +1,19 @@
+from sqlmodel import SQLModel, Field
+from datetime import date
+
+
+class StockMoveDailyRollup(SQLModel, table=True):
+    """Movements recorded per UTC day, user and move type.
+
+    Incremented by the trg_rollup_stock_moves and trg_rollup_stock_move_lines
+    triggers; the movement graph (GET /stock-movements/last-year) is served from it.
+    """
+
+    __tablename__ = "stock_move_daily_rollup"
+
+    day: date = Field(primary_key=True, description="Day (UTC) the movements were created")
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    move_type: str = Field(primary_key=True, max_length=10)
+    move_count: int = Field(default=0, nullable=False, description="Movements")
+    line_count: int = Field(default=0, nullable=False, description="Movement lines")
+    units: int = Field(default=0, nullable=False, description="Sum of the line quantities")
@@ -0,0 +1,14 @@
+from sqlmodel import SQLModel, Field
+from datetime import datetime
+
+
+class StockMoveIdempotencyKey(SQLModel, table=True):
+    """Idempotency-Key sent with POST /stock-movements/ and the movement it created."""
+
+    __tablename__ = "stock_move_idempotency_key"
+
+    user_id: int = Field(foreign_key="user.id", primary_key=True, description="Owner of the key")
+    key: str = Field(primary_key=True, max_length=255, description="Client-generated key")
+    request_hash: str = Field(max_length=64, description="SHA-256 of the original request body")
+    move_id: int = Field(foreign_key="stock_move.id", nullable=False, description="Created movement")
+    expires_at: datetime = Field(index=True, description="The key can be reused (and is purged) after this time")
@@ -1,7 +1,7 @@
 from datetime import timedelta, datetime, timezone
 import os
 from fastapi import Request, Response
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from app.dependencies import get_current_user, oauth2
@@ -13,10 +13,15 @@ from app.models.database import get_db
 from app.models.user import User
 from app.models.revoked_token import RevokedToken
 from app.schemas.user import UserSelfRegister, UserResponse
+from app.services.auth_cache import invalidate_tokens
+from app.services.notification_bus import publish_tokens_revoked
+from app.services.password_rehash import rehash_password
+from app.services.revoked_tokens import is_token_revoked, remember_revoked
 from app.utils.authentication import (
     ACCESS_TOKEN_DURATION,
     REFRESH_TOKEN_DURATION,
     hash_password,
+    needs_rehash,
     verify_password,
     create_access_token,
     create_refresh_token,
@@ -64,15 +69,18 @@ def register(user_data: UserSelfRegister, db: Session = Depends(get_db)):
 @router.post("/login")
 def login(
     response: Response,
+    background_tasks: BackgroundTasks,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db),
 ):
     """Authenticates the user and generates a JWT token."""
     try:
-        statement = select(User).where(
+        statement = select(User.id, User.password, User.role, User.is_active).where(
             User.email == form_data.username
         )  # OAuth2PasswordRequestForm expects 'username' and 'password' — we treat 'username' as email
         user = db.exec(statement).first()
+        # Hand the connection back to the pool while bcrypt runs (it can queue for a while).
+        db.commit()
     except SQLAlchemyError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -89,7 +97,10 @@ def login(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="User is inactive. Please contact an administrator to activate your account.",
         )
-    
+    if needs_rehash(user.password):
+        # Migrate the hash to BCRYPT_ROUNDS once the response is sent.
+        background_tasks.add_task(rehash_password, user.id, form_data.password, user.password)
+
     access_token = create_access_token(
         {"sub": str(user.id), "role": user.role},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_DURATION),
@@ -151,7 +162,7 @@ def refresh_token(request: Request, db: Session = Depends(get_db)):
 
     jti = payload.get("jti")
     try:
-        if jti and db.get(RevokedToken, jti):
+        if jti and is_token_revoked(db, jti):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Refresh token has been revoked.",
@@ -200,10 +211,20 @@ def refresh_token(request: Request, db: Session = Depends(get_db)):
 
 @router.post("/verify-password")
 def verify_user_password(
-    data: PasswordCheckRequest, current_user: User = Depends(get_current_user)
+    data: PasswordCheckRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
 ):
     """Verifies that the provided password matches the one stored for the authenticated user."""
-    if not verify_password(data.password, current_user.password):
+    # The cached current user carries no password hash: read it from the database.
+    try:
+        user = db.get(User, current_user.id)
+    except SQLAlchemyError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database connection error",
+        )
+    if user is None or not verify_password(data.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect password"
         )
@@ -230,6 +251,7 @@ def logout(
     )
 
     # Revoke both the access token and the refresh token by storing their JTIs.
+    revoked = {}  # jti -> expiry timestamp
     try:
         access_payload = decode_access_token(token)
         access_jti = access_payload.get("jti")
@@ -239,6 +261,7 @@ def logout(
                 jti=access_jti,
                 expires_at=datetime.fromtimestamp(access_exp, timezone.utc),
             ))
+            revoked[access_jti] = access_exp
 
         refresh_token_value = request.cookies.get("refresh_token")
         if refresh_token_value:
@@ -251,9 +274,13 @@ def logout(
                         jti=refresh_jti,
                         expires_at=datetime.fromtimestamp(refresh_exp, timezone.utc),
                     ))
+                    revoked[refresh_jti] = refresh_exp
             except HTTPException:
                 pass  # If the refresh token is invalid or expired, we can ignore it since it's already unusable.
 
+        if revoked:
+            # Other workers add the tokens to their revoked set when this commits.
+            publish_tokens_revoked(db, revoked)
         db.commit()
     except HTTPException:
         pass  
@@ -265,4 +292,6 @@ def logout(
             detail="Database connection error while revoking token.",
         )
 
+    remember_revoked(revoked)
+    invalidate_tokens(revoked)
     return {"message": "Logged out successfully"}
@@ -0,0 +1,101 @@
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session
+from app.dependencies import require_admin
+from app.models.database import async_engine, engine, get_db, replica_async_engine
+from app.models.user import User
+from app.schemas.metrics import CacheMetrics, PoolMetrics, RevokedTokenMetrics
+from app.services.auth_cache import token_cache
+from app.services.dashboard_cache import caches
+from app.services.revoked_tokens import get_revoked_token_table_stats, purge_stats, revoked_tokens
+from app.utils.metrics import pool_checkout_wait
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+
+@router.get("/db-pool", response_model=List[PoolMetrics])
+def get_db_pool_metrics(current_user: User = Depends(require_admin)):
+    """
+    Returns the state of the database connection pools of the worker that serves the request.
+    - A growing `wait_max_ms` or any `timeouts` mean the pool is too small for the load
+      (see `DB_POOL_SIZE` / `DB_MAX_OVERFLOW`).
+    """
+    pools = [("sync", engine.pool), ("async", async_engine.sync_engine.pool)]
+    if replica_async_engine is not None:
+        pools.append(("replica", replica_async_engine.sync_engine.pool))
+
+    metrics = []
+    for name, pool in pools:
+        wait = pool_checkout_wait.snapshot(name)
+        metrics.append(
+            PoolMetrics(
+                engine=name,
+                pool_size=pool.size(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+                checkouts=wait["count"],
+                timeouts=wait["timeouts"],
+                wait_avg_ms=wait["avg_seconds"] * 1000,
+                wait_max_ms=wait["max_seconds"] * 1000,
+            )
+        )
+    return metrics
+
+
+@router.get("/cache", response_model=List[CacheMetrics])
+def get_cache_metrics(current_user: User = Depends(require_admin)):
+    """
+    Returns the dashboard aggregate caches and the auth cache of the worker that serves the request.
+    - A low `hit_ratio` with a full cache means `DASHBOARD_CACHE_MAX_ENTRIES`
+      (`AUTH_CACHE_MAX_ENTRIES` for `auth`) is too small.
+    """
+    metrics = []
+    for name, cache in {**caches, "auth": token_cache}.items():
+        stats = cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        metrics.append(
+            CacheMetrics(
+                cache=name,
+                size=stats["size"],
+                max_entries=stats["maxsize"],
+                ttl_seconds=stats["ttl_seconds"],
+                hits=stats["hits"],
+                misses=stats["misses"],
+                evictions=stats["evictions"],
+                hit_ratio=stats["hits"] / lookups if lookups else 0.0,
+            )
+        )
+    return metrics
+
+
+@router.get("/revoked-tokens", response_model=RevokedTokenMetrics)
+def get_revoked_token_metrics(
+    db: Session = Depends(get_db), current_user: User = Depends(require_admin)
+):
+    """
+    Returns the size of `revoked_tokens` and the purges run by the worker that serves the request.
+    - `expired_rows` growing across runs means the purge can't keep up
+      (see `REVOKED_TOKENS_PURGE_INTERVAL_SECONDS` / `REVOKED_TOKENS_PURGE_BATCH_SIZE`).
+    """
+    try:
+        table = get_revoked_token_table_stats(db)
+    except SQLAlchemyError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database connection error",
+        )
+    purges = purge_stats.snapshot()
+    return RevokedTokenMetrics(
+        **table,
+        in_memory=revoked_tokens.stats()["size"],
+        purge_runs=purges["runs"],
+        total_purged=purges["total_purged"],
+        last_purged=purges["last_purged"],
+        last_purge_at=purges["last_run_at"],
+        last_purge_ms=(
+            purges["last_duration_seconds"] * 1000
+            if purges["last_duration_seconds"] is not None
+            else None
+        ),
+    )
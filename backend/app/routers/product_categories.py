@@ -2,7 +2,7 @@ from app.utils.validation import normalize_category
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from app.dependencies import get_current_user
 from app.models.user import User
-from sqlmodel import Session, select, func
+from sqlmodel import Session, select
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from typing import Optional
 
@@ -16,6 +16,7 @@ from app.schemas.product_category import (
     PaginatedProductCategoryResponse,
 )
 from app.dependencies import require_admin
+from app.utils.pagination import paginate
 
 router = APIRouter(prefix="/categories", tags=["Product Categories"])
 
@@ -31,8 +32,7 @@ def list_categories(
 
     try:
         statement = select(ProductCategory).order_by(ProductCategory.name)
-        total = db.exec(select(func.count()).select_from(statement.subquery())).first()
-        categories = db.exec(statement.limit(limit).offset(offset)).all()
+        categories, total = paginate(db, statement, limit, offset)
     except SQLAlchemyError:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error retrieving product categories")
     return {"data": categories, "total": total, "limit": limit, "offset": offset}
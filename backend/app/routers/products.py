@@ -9,6 +9,7 @@ from app.models.product import Product
 from app.models.stock import Stock
 from app.models.user import User
 from app.dependencies import get_current_user
+from app.utils.pagination import paginate
 from app.schemas.product import (
     BulkStatusUpdateRequest,
     PaginatedProductResponse,
@@ -28,6 +29,8 @@ def get_products(
     search: Optional[str] = Query(None),
     category_id: Optional[int] = Query(None),
     is_active: Optional[bool] = Query(None),
+    include_total: bool = Query(True, description="Set to false to skip counting the total"),
+    estimate_total: bool = Query(False, description="Return an approximate total from planner statistics"),
 ):
     """Returns a paginated list of products.
     - An **admin** can see all products (active and inactive).
@@ -57,14 +60,14 @@ def get_products(
         elif is_active is not None:
             statement = statement.where(Product.is_active == is_active)
 
-        # Paginated and ordered query
-        products_raw = db.exec(
-            statement.order_by(Product.short_name).limit(limit).offset(offset)
-        ).all()
-
-        # Total count (without pagination)
-        total_records = (
-            db.exec(select(func.count()).select_from(statement.subquery())).first() or 0
+        # Paginated and ordered query, with the total count (without pagination)
+        products_raw, total_records = paginate(
+            db,
+            statement.order_by(Product.short_name),
+            limit,
+            offset,
+            include_total,
+            estimate_total,
         )
 
     except SQLAlchemyError:
@@ -1,20 +1,35 @@
-from datetime import date, datetime, timezone
-from typing import List
+from datetime import date, datetime, time, timedelta, timezone
+from typing import List, Literal
 from dateutil.relativedelta import relativedelta
+import pyarrow as pa
 from app.models.product_category import ProductCategory
 from app.models.warehouse import Warehouse
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlmodel import Session, case, func, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlmodel import case, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import and_, or_, tuple_
 from sqlalchemy.exc import SQLAlchemyError
-from app.models.database import get_db
+from app.models.database import get_async_db, get_read_db
 from app.models.stock_move import StockMove
 from app.models.stock_move_line import StockMoveLine
 from app.models.product import Product
 from app.models.stock import Stock
+from app.models.stock_daily_snapshot import StockDailySnapshot
 from app.models.user import User
-from app.dependencies import get_current_user
+from app.dependencies import get_current_user_async
+from app.services.dashboard_cache import STOCK_TAG, dashboard_cache, semaphore_cache
+from app.utils.export import ColumnarFormat, TextFormat, accepts_gzip, columnar_export, open_cursor, text_export
+from app.utils.pagination import (
+    count_rows,
+    decode_history_cursor,
+    encode_history_cursor,
+    estimate_rows,
+    paginate,
+)
 from app.schemas.stock import (
     AvailableLotResponse,
+    StockAsOf,
     PaginatedStockHistory,
     PaginatedStockResponse,
     PaginatedStockSummary,
@@ -24,12 +39,41 @@ from app.schemas.stock import (
     StockByWarehousePieChart,
     StockResponse,
     StockSemaphore,
+    StockSemaphoreGroup,
     StockSummary,
     StockHistory,
 )
 
 router = APIRouter(prefix="/stock", tags=["Stock"])
 
+# Columns of the Arrow/Parquet exports, in the order the export queries select them.
+STOCK_EXPORT_SCHEMA = pa.schema(
+    [
+        ("warehouse_id", pa.int32()),
+        ("warehouse_name", pa.string()),
+        ("product_id", pa.int32()),
+        ("product_name", pa.string()),
+        ("sku", pa.string()),
+        ("lot", pa.string()),
+        ("expiration_date", pa.date32()),
+        ("quantity", pa.int32()),
+    ]
+)
+STOCK_HISTORY_EXPORT_SCHEMA = pa.schema(
+    [
+        ("move_id", pa.int32()),
+        ("created_at", pa.timestamp("us", tz="UTC")),
+        ("move_type", pa.string()),
+        ("line_id", pa.int32()),
+        ("warehouse_id", pa.int32()),
+        ("product_id", pa.int32()),
+        ("sku", pa.string()),
+        ("lot", pa.string()),
+        ("quantity", pa.int32()),
+        ("user_name", pa.string()),
+    ]
+)
+
 
 def _row_to_stock_response(item) -> StockResponse:
     return StockResponse(
@@ -59,11 +103,13 @@ def _row_to_stock_history(item) -> StockHistory:
 
 
 @router.get("/", response_model=PaginatedStockResponse)
-def get_all_stock(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+async def get_all_stock(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
     limit: int = Query(10, ge=1, le=1000),
     offset: int = Query(0, ge=0),
+    include_total: bool = Query(True, description="Set to false to skip counting the total"),
+    estimate_total: bool = Query(False, description="Return an approximate total from planner statistics"),
 ):
     """Lists all stock across all warehouses."""
     try:
@@ -82,10 +128,9 @@ def get_all_stock(
             .join(Product, Product.id == Stock.product_id)
             .order_by(Stock.warehouse_id, Stock.product_id, Stock.lot)
         )
-        stock = db.exec(statement.limit(limit).offset(offset)).all()
-        total_records = db.exec(
-            select(func.count()).select_from(statement.subquery())
-        ).first()
+        stock, total_records = await db.run_sync(
+            paginate, statement, limit, offset, include_total, estimate_total
+        )
 
     except SQLAlchemyError:
         raise HTTPException(
@@ -95,17 +140,64 @@ def get_all_stock(
 
     return PaginatedStockResponse(
         data=[_row_to_stock_response(item) for item in stock],
-        total=total_records or 0,
+        total=total_records,
         limit=limit,
         offset=offset,
     )
 
 
+@router.get("/export", response_class=StreamingResponse)
+async def export_stock(
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_async),
+    export_format: ColumnarFormat | TextFormat = Query("arrow", alias="format"),
+    warehouse_id: int | None = Query(None, gt=0),
+):
+    """Downloads all stock (or one warehouse's) as Arrow IPC, Parquet, CSV or NDJSON.
+    - Rows are read from a server-side cursor and sent batch by batch, in one response.
+    - CSV and NDJSON are gzipped on the fly when the client accepts it.
+    """
+    statement = (
+        select(
+            Stock.warehouse_id,
+            Warehouse.name.label("warehouse_name"),
+            Stock.product_id,
+            Product.short_name.label("product_name"),
+            Product.sku,
+            Stock.lot,
+            Stock.expiration_date,
+            Stock.quantity,
+        )
+        .join(Warehouse, Warehouse.id == Stock.warehouse_id)
+        .join(Product, Product.id == Stock.product_id)
+        .order_by(Stock.warehouse_id, Stock.product_id, Stock.lot)
+    )
+    if warehouse_id is not None:
+        statement = statement.where(Stock.warehouse_id == warehouse_id)
+    try:
+        result = await open_cursor(db, statement)
+    except SQLAlchemyError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database connection error",
+        )
+    if export_format in ("csv", "ndjson"):
+        return text_export(
+            result,
+            export_format,
+            "stock",
+            fieldnames=STOCK_EXPORT_SCHEMA.names,
+            compress=accepts_gzip(request),
+        )
+    return columnar_export(result, STOCK_EXPORT_SCHEMA, export_format, "stock")
+
+
 @router.get("/warehouse/{warehouse_id}", response_model=PaginatedStockResponse)
-def get_stock_by_warehouse(
+async def get_stock_by_warehouse(
     warehouse_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
     limit: int = Query(10, ge=1, le=1000),
     offset: int = Query(0, ge=0),
 ):
@@ -127,10 +219,7 @@ def get_stock_by_warehouse(
             .where(Stock.warehouse_id == warehouse_id)
             .order_by(Stock.warehouse_id, Stock.product_id, Stock.lot)
         )
-        stock = db.exec(statement.limit(limit).offset(offset)).all()
-        total_records = db.exec(
-            select(func.count()).select_from(statement.subquery())
-        ).first()
+        stock, total_records = await db.run_sync(paginate, statement, limit, offset)
 
     except SQLAlchemyError:
         raise HTTPException(
@@ -139,7 +228,7 @@ def get_stock_by_warehouse(
         )
     return PaginatedStockResponse(
         data=[_row_to_stock_response(item) for item in stock],
-        total=total_records or 0,
+        total=total_records,
         limit=limit,
         offset=offset,
     )
@@ -148,12 +237,18 @@ def get_stock_by_warehouse(
 @router.get(
     "/warehouse/{warehouse_id}/detail", response_model=List[StockByWarehousePieChart]
 )
-def get_stock_by_warehouse_pie_chart(
+async def get_stock_by_warehouse_pie_chart(
     warehouse_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
 ):
-    """Total stock quantity per product in a specific warehouse."""
+    """Total stock quantity per product in a specific warehouse (cached, see dashboard_cache)."""
+    cache_key = ("warehouse_detail", warehouse_id)
+    cached = dashboard_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    generation = dashboard_cache.generation()
     try:
         statement = (
             select(
@@ -165,7 +260,7 @@ def get_stock_by_warehouse_pie_chart(
             .where(Stock.warehouse_id == warehouse_id)
             .group_by(Stock.product_id, Product.short_name)
         )
-        stock = db.exec(statement).all()
+        stock = (await db.exec(statement)).all()
 
     except SQLAlchemyError:
         raise HTTPException(
@@ -173,7 +268,7 @@ def get_stock_by_warehouse_pie_chart(
             detail="Database connection error",
         )
 
-    return [
+    result = [
         StockByWarehousePieChart(
             product_id=row.product_id,
             product_name=row.short_name,
@@ -181,13 +276,17 @@ def get_stock_by_warehouse_pie_chart(
         )
         for row in stock
     ]
+    dashboard_cache.set(
+        cache_key, result, tags=[("warehouse", warehouse_id)], generation=generation
+    )
+    return result
 
 
 @router.get(
     "/product/expiration",
     response_model=PaginatedStockResponse,
 )
-def get_stock_by_expiration(
+async def get_stock_by_expiration(
     preset: str | None = Query(
         None,
         description="Preset filter: expired, expiring_soon, no_expiration"
@@ -200,8 +299,8 @@ def get_stock_by_expiration(
         None, 
         description="End of expiration window (exclusive)"
     ),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
     limit: int = Query(10, ge=1, le=1000),
     offset: int = Query(0, ge=0),
 ):
@@ -286,10 +385,7 @@ def get_stock_by_expiration(
             .where(*filters)
         )
 
-        stock = db.exec(statement.limit(limit).offset(offset)).all()
-        total_records = db.exec(
-            select(func.count()).select_from(statement.subquery())
-        ).first()
+        stock, total_records = await db.run_sync(paginate, statement, limit, offset)
 
     except SQLAlchemyError:
         raise HTTPException(
@@ -299,7 +395,7 @@ def get_stock_by_expiration(
 
     return PaginatedStockResponse(
         data=[_row_to_stock_response(item) for item in stock],
-        total=total_records or 0,
+        total=total_records,
         limit=limit,
         offset=offset,
     )
@@ -309,10 +405,10 @@ def get_stock_by_expiration(
     "/product/{product_id}",
     response_model=PaginatedStockSummary,
 )
-def get_stock_by_product(
+async def get_stock_by_product(
     product_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
     limit: int = Query(10, ge=1, le=1000),
     offset: int = Query(0, ge=0),
 ):
@@ -331,10 +427,9 @@ def get_stock_by_product(
             .group_by(Stock.product_id, Stock.warehouse_id, Warehouse.name)
         )
 
-        stock_summary = db.exec(statement.limit(limit).offset(offset)).all()
-        total_records = db.exec(
-            select(func.count()).select_from(statement.subquery())
-        ).first()
+        stock_summary, total_records = await db.run_sync(
+            paginate, statement, limit, offset
+        )
 
     except SQLAlchemyError:
         raise HTTPException(
@@ -352,7 +447,7 @@ def get_stock_by_product(
             )
             for item in stock_summary
         ],
-        total=total_records or 0,
+        total=total_records,
         limit=limit,
         offset=offset,
     )
@@ -362,11 +457,11 @@ def get_stock_by_product(
     "/warehouse/{warehouse_id}/product/{product_id}",
     response_model=PaginatedStockResponse,
 )
-def get_stock_by_warehouse_and_product(
+async def get_stock_by_warehouse_and_product(
     warehouse_id: int,
     product_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
     limit: int = Query(10, ge=1, le=1000),
     offset: int = Query(0, ge=0),
 ):
@@ -391,10 +486,7 @@ def get_stock_by_warehouse_and_product(
                 Stock.product_id == product_id,
             )
         )
-        stock = db.exec(statement.limit(limit).offset(offset)).all()
-        total_records = db.exec(
-            select(func.count()).select_from(statement.subquery())
-        ).first()
+        stock, total_records = await db.run_sync(paginate, statement, limit, offset)
 
     except SQLAlchemyError:
         raise HTTPException(
@@ -404,42 +496,84 @@ def get_stock_by_warehouse_and_product(
 
     return PaginatedStockResponse(
         data=[_row_to_stock_response(item) for item in stock],
-        total=total_records or 0,
+        total=total_records,
         limit=limit,
         offset=offset,
     )
 
 
-@router.get("/history", response_model=PaginatedStockHistory)
-def get_stock_history(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-    limit: int = Query(10, ge=1, le=1000),
-    offset: int = Query(0, ge=0),
-):
-    """Returns the stock movement history (all movement lines)."""
+def _stock_history_statement():
+    """Base query for stock history listings: one row per movement line."""
+    return (
+        select(
+            StockMove.id,
+            StockMove.created_at,
+            StockMove.move_type,
+            StockMoveLine.line_id,
+            StockMoveLine.warehouse_id,
+            StockMoveLine.product_id,
+            Product.sku,
+            StockMoveLine.lot,
+            StockMoveLine.quantity,
+            User.name.label("user_name"),
+        )
+        .join(StockMoveLine, StockMove.id == StockMoveLine.move_id)
+        .join(User, StockMove.user_id == User.id)
+        .join(Product, Product.id == StockMoveLine.product_id)
+    )
+
+
+async def _paginate_stock_history(
+    db: AsyncSession,
+    statement,
+    limit: int,
+    offset: int,
+    cursor: str | None,
+    include_total: bool | None,
+    estimate_total: bool,
+) -> PaginatedStockHistory:
+    """Runs a stock history query in offset or keyset (cursor) mode.
+
+    Rows are ordered newest first by (created_at, move_id, line_id), which is a
+    total order, so a cursor always resumes exactly after the last row returned.
+    With a cursor, the database seeks straight to that position instead of
+    scanning and discarding every row before the offset. Counting the total
+    still visits every row, so unless `include_total` is given it is only
+    counted in offset mode: cursor pages return a null total.
+    """
+    if cursor and offset:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either 'cursor' OR 'offset', not both.",
+        )
+    if include_total is None:
+        include_total = not cursor
+
+    page = statement.order_by(
+        StockMove.created_at.desc(), StockMove.id.desc(), StockMoveLine.line_id.desc()
+    )
+    if cursor:
+        created_at, move_id, line_id = decode_history_cursor(cursor)
+        page = page.where(
+            tuple_(StockMove.created_at, StockMove.id, StockMoveLine.line_id)
+            < tuple_(created_at, move_id, line_id)
+        )
+
     try:
-        statement = (
-            select(
-                StockMove.id,
-                StockMove.created_at,
-                StockMove.move_type,
-                StockMoveLine.warehouse_id,
-                StockMoveLine.product_id,
-                Product.sku,
-                StockMoveLine.lot,
-                StockMoveLine.quantity,
-                User.name.label("user_name"),
+        # Fetch one extra row to know whether there is a next page.
+        if cursor:
+            # The window count would only see rows after the cursor, so the
+            # total (if requested) is taken from the full listing instead.
+            history, _ = await db.run_sync(paginate, page, limit + 1, 0, include_total=False)
+            total_records = None
+            if include_total:
+                total_records = await db.run_sync(
+                    estimate_rows if estimate_total else count_rows, statement
+                )
+        else:
+            history, total_records = await db.run_sync(
+                paginate, page, limit + 1, offset, include_total, estimate_total
             )
-            .join(StockMoveLine, StockMove.id == StockMoveLine.move_id)
-            .join(User, StockMove.user_id == User.id)
-            .join(Product, Product.id == StockMoveLine.product_id)
-            .order_by(StockMove.created_at.desc())
-        )
-        history = db.exec(statement.limit(limit).offset(offset)).all()
-        total_records = db.exec(
-            select(func.count()).select_from(statement.subquery())
-        ).first()
 
     except SQLAlchemyError:
         raise HTTPException(
@@ -447,105 +581,128 @@ def get_stock_history(
             detail="Database connection error",
         )
 
+    next_cursor = None
+    if len(history) > limit:
+        history = history[:limit]
+        last = history[-1]
+        next_cursor = encode_history_cursor(last.created_at, last.id, last.line_id)
+
     return PaginatedStockHistory(
         data=[_row_to_stock_history(item) for item in history],
-        total=total_records or 0,
+        total=total_records,
         limit=limit,
         offset=offset,
+        next_cursor=next_cursor,
     )
 
 
-@router.get("/product/{product_id}/history", response_model=PaginatedStockHistory)
-def get_product_stock_history(
-    product_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+@router.get("/history", response_model=PaginatedStockHistory)
+async def get_stock_history(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
     limit: int = Query(10, ge=1, le=1000),
     offset: int = Query(0, ge=0),
+    cursor: str | None = Query(
+        None, description="Opaque cursor from a previous page's 'next_cursor'"
+    ),
+    include_total: bool | None = Query(
+        None, description="Count the total (default: true without a cursor, false with one)"
+    ),
+    estimate_total: bool = Query(False, description="Return an approximate total from planner statistics"),
 ):
-    """Returns the stock movement history for a specific product."""
-    try:
-        statement = (
-            select(
-                StockMove.id,
-                StockMove.created_at,
-                StockMove.move_type,
-                StockMoveLine.warehouse_id,
-                StockMoveLine.product_id,
-                Product.sku,
-                StockMoveLine.lot,
-                StockMoveLine.quantity,
-                User.name.label("user_name"),
-            )
-            .join(StockMoveLine, StockMove.id == StockMoveLine.move_id)
-            .join(User, StockMove.user_id == User.id)
-            .join(Product, Product.id == StockMoveLine.product_id)
-            .where(Product.id == product_id)
-            .order_by(StockMove.created_at.desc(), StockMoveLine.lot)
-        )
-        history = db.exec(statement.limit(limit).offset(offset)).all()
-        total_records = db.exec(
-            select(func.count()).select_from(statement.subquery())
-        ).first()
+    """Returns the stock movement history (all movement lines)."""
+    return await _paginate_stock_history(
+        db,
+        _stock_history_statement(),
+        limit,
+        offset,
+        cursor,
+        include_total,
+        estimate_total,
+    )
+
 
+@router.get("/history/export", response_class=StreamingResponse)
+async def export_stock_history(
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_async),
+    export_format: ColumnarFormat = Query("arrow", alias="format"),
+    warehouse_id: int | None = Query(None, gt=0),
+    product_id: int | None = Query(None, gt=0),
+    date_from: date | None = Query(None, description="First day (UTC)"),
+    date_to: date | None = Query(None, description="Last day (UTC)"),
+):
+    """Downloads the movement history as an Arrow IPC stream or a Parquet file.
+    - One row per movement line, ordered by movement and line.
+    - Replaces paging through /stock/history for full extracts: rows are read from a
+      server-side cursor and sent batch by batch, in one response.
+    """
+    statement = _stock_history_statement().order_by(StockMove.id, StockMoveLine.line_id)
+    if warehouse_id is not None:
+        statement = statement.where(StockMoveLine.warehouse_id == warehouse_id)
+    if product_id is not None:
+        statement = statement.where(StockMoveLine.product_id == product_id)
+    if date_from is not None:
+        statement = statement.where(
+            StockMove.created_at >= datetime.combine(date_from, time.min, tzinfo=timezone.utc)
+        )
+    if date_to is not None:
+        statement = statement.where(
+            StockMove.created_at < datetime.combine(date_to + timedelta(days=1), time.min, tzinfo=timezone.utc)
+        )
+    try:
+        result = await open_cursor(db, statement)
     except SQLAlchemyError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Database connection error",
         )
+    return columnar_export(result, STOCK_HISTORY_EXPORT_SCHEMA, export_format, "stock_history")
 
-    return PaginatedStockHistory(
-        data=[_row_to_stock_history(item) for item in history],
-        total=total_records or 0,
-        limit=limit,
-        offset=offset,
+
+@router.get("/product/{product_id}/history", response_model=PaginatedStockHistory)
+async def get_product_stock_history(
+    product_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+    limit: int = Query(10, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    cursor: str | None = Query(
+        None, description="Opaque cursor from a previous page's 'next_cursor'"
+    ),
+    include_total: bool | None = Query(
+        None, description="Count the total (default: true without a cursor, false with one)"
+    ),
+    estimate_total: bool = Query(False, description="Return an approximate total from planner statistics"),
+):
+    """Returns the stock movement history for a specific product."""
+    statement = _stock_history_statement().where(Product.id == product_id)
+    return await _paginate_stock_history(
+        db, statement, limit, offset, cursor, include_total, estimate_total
     )
 
 
 @router.get("/warehouse/{warehouse_id}/history", response_model=PaginatedStockHistory)
-def get_warehouse_stock_history(
+async def get_warehouse_stock_history(
     warehouse_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
     limit: int = Query(10, ge=1, le=1000),
     offset: int = Query(0, ge=0),
+    cursor: str | None = Query(
+        None, description="Opaque cursor from a previous page's 'next_cursor'"
+    ),
+    include_total: bool | None = Query(
+        None, description="Count the total (default: true without a cursor, false with one)"
+    ),
+    estimate_total: bool = Query(False, description="Return an approximate total from planner statistics"),
 ):
     """Returns the stock movement history for a specific warehouse."""
-    try:
-        statement = (
-            select(
-                StockMove.id,
-                StockMove.created_at,
-                StockMove.move_type,
-                StockMoveLine.warehouse_id,
-                StockMoveLine.product_id,
-                Product.sku,
-                StockMoveLine.lot,
-                StockMoveLine.quantity,
-                User.name.label("user_name"),
-            )
-            .join(StockMoveLine, StockMove.id == StockMoveLine.move_id)
-            .join(User, StockMove.user_id == User.id)
-            .join(Product, Product.id == StockMoveLine.product_id)
-            .where(StockMoveLine.warehouse_id == warehouse_id)
-            .order_by(StockMove.created_at.desc(), StockMoveLine.lot)
-        )
-        history = db.exec(statement.limit(limit).offset(offset)).all()
-        total_records = db.exec(
-            select(func.count()).select_from(statement.subquery())
-        ).first()
-
-    except SQLAlchemyError:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Database connection error",
-        )
-
-    return PaginatedStockHistory(
-        data=[_row_to_stock_history(item) for item in history],
-        total=total_records or 0,
-        limit=limit,
-        offset=offset,
+    statement = _stock_history_statement().where(
+        StockMoveLine.warehouse_id == warehouse_id
+    )
+    return await _paginate_stock_history(
+        db, statement, limit, offset, cursor, include_total, estimate_total
     )
 
 
@@ -553,117 +710,247 @@ def get_warehouse_stock_history(
     "/warehouse/{warehouse_id}/product/{product_id}/history",
     response_model=PaginatedStockHistory,
 )
-def get_warehouse_and_product_stock_history(
+async def get_warehouse_and_product_stock_history(
     product_id: int,
     warehouse_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
     limit: int = Query(10, ge=1, le=1000),
     offset: int = Query(0, ge=0),
+    cursor: str | None = Query(
+        None, description="Opaque cursor from a previous page's 'next_cursor'"
+    ),
+    include_total: bool | None = Query(
+        None, description="Count the total (default: true without a cursor, false with one)"
+    ),
+    estimate_total: bool = Query(False, description="Return an approximate total from planner statistics"),
 ):
     """Returns the stock movement history filtered by warehouse and product."""
-    try:
-        statement = (
-            select(
-                StockMove.id,
-                StockMove.created_at,
-                StockMove.move_type,
-                StockMoveLine.warehouse_id,
-                StockMoveLine.product_id,
-                Product.sku,
-                StockMoveLine.lot,
-                StockMoveLine.quantity,
-                User.name.label("user_name"),
-            )
-            .join(StockMoveLine, StockMove.id == StockMoveLine.move_id)
-            .join(User, StockMove.user_id == User.id)
-            .join(Product, Product.id == StockMoveLine.product_id)
-            .where(
-                Product.id == product_id,
-                StockMoveLine.warehouse_id == warehouse_id,
-            )
-            .order_by(StockMove.created_at.desc(), StockMoveLine.lot)
+    statement = _stock_history_statement().where(
+        Product.id == product_id,
+        StockMoveLine.warehouse_id == warehouse_id,
+    )
+    return await _paginate_stock_history(
+        db, statement, limit, offset, cursor, include_total, estimate_total
+    )
+
+
+@router.get("/as-of", response_model=List[StockAsOf])
+async def get_stock_as_of(
+    as_of: date = Query(..., alias="date", description="Day (UTC) whose closing stock is returned"),
+    warehouse_id: int | None = Query(None, gt=0),
+    product_id: int | None = Query(None, gt=0),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    """Returns the stock at the end of a given day (lots with a positive quantity only).
+    - Starts from the latest daily snapshot before that day and replays only that day's lines.
+    """
+    snapshot_filters, line_filters = [], []
+    if warehouse_id is not None:
+        snapshot_filters.append(StockDailySnapshot.warehouse_id == warehouse_id)
+        line_filters.append(StockMoveLine.warehouse_id == warehouse_id)
+    if product_id is not None:
+        snapshot_filters.append(StockDailySnapshot.product_id == product_id)
+        line_filters.append(StockMoveLine.product_id == product_id)
+
+    snapshot = (
+        select(
+            StockDailySnapshot.warehouse_id,
+            StockDailySnapshot.product_id,
+            StockDailySnapshot.lot,
+            StockDailySnapshot.quantity,
+        )
+        .where(StockDailySnapshot.snapshot_date < as_of, *snapshot_filters)
+        .distinct(
+            StockDailySnapshot.warehouse_id,
+            StockDailySnapshot.product_id,
+            StockDailySnapshot.lot,
+        )
+        .order_by(
+            StockDailySnapshot.warehouse_id,
+            StockDailySnapshot.product_id,
+            StockDailySnapshot.lot,
+            StockDailySnapshot.snapshot_date.desc(),
+        )
+        .subquery()
+    )
+
+    day_start = datetime.combine(as_of, time.min, tzinfo=timezone.utc)
+    signed_quantity = case(
+        (StockMove.move_type == "incoming", StockMoveLine.quantity),
+        else_=-StockMoveLine.quantity,
+    )
+    # Lines without a lot are stored under 'NO_LOT' in "stock" and in the snapshots.
+    line_lot = func.coalesce(StockMoveLine.lot, "NO_LOT")
+    day_lines = (
+        select(
+            StockMoveLine.warehouse_id,
+            StockMoveLine.product_id,
+            line_lot.label("lot"),
+            func.sum(signed_quantity).label("quantity"),
+        )
+        .join(StockMove, StockMove.id == StockMoveLine.move_id)
+        .where(
+            StockMove.created_at >= day_start,
+            StockMove.created_at < day_start + timedelta(days=1),
+            *line_filters,
         )
-        history = db.exec(statement.limit(limit).offset(offset)).all()
-        total_records = db.exec(
-            select(func.count()).select_from(statement.subquery())
-        ).first()
+        .group_by(StockMoveLine.warehouse_id, StockMoveLine.product_id, line_lot)
+        .subquery()
+    )
 
+    warehouse = func.coalesce(snapshot.c.warehouse_id, day_lines.c.warehouse_id)
+    product = func.coalesce(snapshot.c.product_id, day_lines.c.product_id)
+    lot = func.coalesce(snapshot.c.lot, day_lines.c.lot)
+    quantity = func.coalesce(snapshot.c.quantity, 0) + func.coalesce(day_lines.c.quantity, 0)
+    statement = (
+        select(
+            warehouse.label("warehouse_id"),
+            product.label("product_id"),
+            lot.label("lot"),
+            quantity.label("quantity"),
+        )
+        .select_from(
+            snapshot.join(
+                day_lines,
+                and_(
+                    snapshot.c.warehouse_id == day_lines.c.warehouse_id,
+                    snapshot.c.product_id == day_lines.c.product_id,
+                    snapshot.c.lot == day_lines.c.lot,
+                ),
+                full=True,
+            )
+        )
+        .where(quantity > 0)
+        .order_by(warehouse, product, lot)
+    )
+    try:
+        rows = (await db.exec(statement)).all()
     except SQLAlchemyError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Database connection error",
         )
 
-    return PaginatedStockHistory(
-        data=[_row_to_stock_history(item) for item in history],
-        total=total_records or 0,
-        limit=limit,
-        offset=offset,
-    )
+    return [
+        StockAsOf(
+            warehouse_id=row.warehouse_id,
+            product_id=row.product_id,
+            lot=row.lot,
+            quantity=row.quantity,
+        )
+        for row in rows
+    ]
 
 
-@router.get("/semaphore", response_model=StockSemaphore)
-def get_stock_status_semaphore(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-):
-    """Returns stock status segmented by expiration (traffic light) — total units."""
+def _semaphore_buckets(today: date) -> list:
+    """SUM(CASE ...) per traffic light bucket, so all three come from one scan of `stock`."""
+    in_1_month = today + relativedelta(months=1)
+    in_6_months = today + relativedelta(months=6)
+    expiration = Stock.expiration_date
 
-    try:
-        today = datetime.now(timezone.utc).date()
-        in_1_month = today + relativedelta(months=1)
-        in_6_months = today + relativedelta(months=6)
-
-        expired = (
-            db.exec(
-                select(func.sum(Stock.quantity)).where(
-                    Stock.expiration_date != None,
-                    Stock.expiration_date <= in_1_month,
-                )
-            ).first()
-            or 0
-        )
+    def bucket(condition, label: str):
+        return func.coalesce(
+            func.sum(case((condition, Stock.quantity), else_=0)), 0
+        ).label(label)
 
-        expiring_soon = (
-            db.exec(
-                select(func.sum(Stock.quantity)).where(
-                    Stock.expiration_date > in_1_month,
-                    Stock.expiration_date <= in_6_months,
-                )
-            ).first()
-            or 0
+    return [
+        bucket(expiration <= in_1_month, "expired"),
+        bucket(and_(expiration > in_1_month, expiration <= in_6_months), "expiring_soon"),
+        bucket(or_(expiration == None, expiration > in_6_months), "no_expiration"),
+    ]
+
+
+async def _compute_semaphore(
+    db: AsyncSession, today: date, breakdown: str | None
+) -> StockSemaphore:
+    buckets = _semaphore_buckets(today)
+
+    if breakdown is None:
+        row = (await db.exec(select(*buckets))).one()
+        return StockSemaphore(
+            expired=row.expired,
+            expiring_soon=row.expiring_soon,
+            no_expiration=row.no_expiration,
         )
 
-        no_expiration = (
-            db.exec(
-                select(func.sum(Stock.quantity)).where(
-                    (Stock.expiration_date == None)
-                    | (Stock.expiration_date > in_6_months)
-                )
-            ).first()
-            or 0
+    if breakdown == "warehouse":
+        statement = (
+            select(Warehouse.id, Warehouse.name, *buckets)
+            .join(Warehouse, Warehouse.id == Stock.warehouse_id)
+            .group_by(Warehouse.id, Warehouse.name)
+            .order_by(Warehouse.name)
+        )
+    else:
+        statement = (
+            select(ProductCategory.id, ProductCategory.name, *buckets)
+            .join(Product, Product.id == Stock.product_id)
+            .join(ProductCategory, ProductCategory.id == Product.category_id)
+            .group_by(ProductCategory.id, ProductCategory.name)
+            .order_by(ProductCategory.name)
         )
+    groups = [
+        StockSemaphoreGroup(
+            id=row.id,
+            name=row.name,
+            expired=row.expired,
+            expiring_soon=row.expiring_soon,
+            no_expiration=row.no_expiration,
+        )
+        for row in (await db.exec(statement)).all()
+    ]
+    # Every stock row has exactly one warehouse and one category, so the groups add up to the totals.
+    return StockSemaphore(
+        expired=sum(group.expired for group in groups),
+        expiring_soon=sum(group.expiring_soon for group in groups),
+        no_expiration=sum(group.no_expiration for group in groups),
+        breakdown=groups,
+    )
 
+
+@router.get("/semaphore", response_model=StockSemaphore)
+async def get_stock_status_semaphore(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+    breakdown: Literal["warehouse", "category"] | None = Query(
+        None, description="Also return the buckets per warehouse or per product category"
+    ),
+):
+    """Returns stock status segmented by expiration (traffic light) — total units.
+    - Computed in a single pass over `stock` and cached per day for STOCK_SEMAPHORE_CACHE_TTL_SECONDS
+      (dropped earlier when a movement is committed).
+    """
+    today = datetime.now(timezone.utc).date()
+    cache_key = (today, breakdown)
+    cached = semaphore_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    generation = semaphore_cache.generation()
+    try:
+        result = await _compute_semaphore(db, today, breakdown)
     except SQLAlchemyError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Database connection error",
         )
 
-    return {
-        "expired": expired,
-        "expiring_soon": expiring_soon,
-        "no_expiration": no_expiration,
-    }
+    semaphore_cache.set(cache_key, result, tags=[STOCK_TAG], generation=generation)
+    return result
 
 
 @router.get("/warehouses/detail", response_model=List[StockByWarehouse])
-def get_warehouse_stock_detail(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+async def get_warehouse_stock_detail(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
 ):
-    """Returns the total stock quantity of all products, grouped by warehouse."""
+    """Returns the total stock quantity of all products, grouped by warehouse (cached)."""
+    cached = dashboard_cache.get("warehouses_detail")
+    if cached is not None:
+        return cached
+
+    generation = dashboard_cache.generation()
     try:
         statement = (
             select(
@@ -674,7 +961,7 @@ def get_warehouse_stock_detail(
             .join(Warehouse, Warehouse.id == Stock.warehouse_id)
             .group_by(Stock.warehouse_id, Warehouse.id)
         )
-        data = db.exec(statement).all()
+        data = (await db.exec(statement)).all()
 
     except SQLAlchemyError:
         raise HTTPException(
@@ -690,18 +977,24 @@ def get_warehouse_stock_detail(
         )
         for item in data
     ]
+    dashboard_cache.set("warehouses_detail", result, tags=[STOCK_TAG], generation=generation)
 
     return result
 
 
 @router.get("/product-categories", response_model=List[StockByCategory])
-def get_stock_by_product_category(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+async def get_stock_by_product_category(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
 ):
     """
-    Returns the total stock quantity grouped by product category.
+    Returns the total stock quantity grouped by product category (cached).
     """
+    cached = dashboard_cache.get("product_categories")
+    if cached is not None:
+        return cached
+
+    generation = dashboard_cache.generation()
     try:
         statement = (
             select(
@@ -714,14 +1007,14 @@ def get_stock_by_product_category(
             .group_by(ProductCategory.id, ProductCategory.name)
             .order_by(ProductCategory.name)
         )
-        results = db.exec(statement).all()
+        results = (await db.exec(statement)).all()
     except SQLAlchemyError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error retrieving stock by category",
         )
 
-    return [
+    result = [
         StockByCategory(
             category_id=row.id,
             category_name=row.name,
@@ -729,19 +1022,27 @@ def get_stock_by_product_category(
         )
         for row in results
     ]
+    dashboard_cache.set("product_categories", result, tags=[STOCK_TAG], generation=generation)
+    return result
 
 
 @router.get(
     "/category/{category_id}/products", response_model=List[StockByProductInCategory]
 )
-def get_stock_by_category_detail(
+async def get_stock_by_category_detail(
     category_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
 ):
     """
-    Returns the total stock quantity per product within a specific category.
+    Returns the total stock quantity per product within a specific category (cached).
     """
+    cache_key = ("category_products", category_id)
+    cached = dashboard_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    generation = dashboard_cache.generation()
     try:
         statement = (
             select(
@@ -754,14 +1055,14 @@ def get_stock_by_category_detail(
             .group_by(Product.id, Product.short_name)
             .order_by(Product.short_name)
         )
-        results = db.exec(statement).all()
+        results = (await db.exec(statement)).all()
     except SQLAlchemyError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error retrieving stock data for products in the selected category.",
         )
 
-    return [
+    result = [
         StockByProductInCategory(
             product_id=row.id,
             product_name=row.short_name,
@@ -769,14 +1070,18 @@ def get_stock_by_category_detail(
         )
         for row in results
     ]
+    dashboard_cache.set(
+        cache_key, result, tags=[("category", category_id)], generation=generation
+    )
+    return result
 
 
 @router.get("/available-lots", response_model=list[AvailableLotResponse])
-def get_available_lots(
+async def get_available_lots(
     product: int = Query(..., gt=0),
     warehouse: int = Query(..., gt=0),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
 ):
     """
     Retrieves the available lots for a given product in a warehouse.
@@ -797,7 +1102,7 @@ def get_available_lots(
             .order_by(Stock.expiration_date)
         )
 
-        results = db.exec(statement).all()
+        results = (await db.exec(statement)).all()
 
         return [
             AvailableLotResponse(
@@ -1,13 +1,20 @@
+import json
 import logging
 from collections import defaultdict
-from datetime import date, datetime, time, timezone
+from datetime import date, datetime, time, timedelta, timezone
+from sqlalchemy import DateTime, cast
 from sqlalchemy.exc import SQLAlchemyError
 from dateutil.relativedelta import relativedelta
-from typing import Optional, List
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlmodel import Session, func, select, case
-from app.models.database import get_db
+from typing import AsyncIterator, Literal, Optional, List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlmodel import Session, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.models.database import get_async_db, get_db, get_read_db
 from app.models.stock_move import StockMove
+from app.models.stock_move_daily_rollup import StockMoveDailyRollup
 from app.models.stock_move_line import StockMoveLine
 from app.models.product import Product
 from app.models.user import User
@@ -18,26 +25,72 @@ from app.schemas.stock_move import (
     StockMoveCreate,
     PaginatedStockMovesResponse,
     StockMoveSummary,
+    StockMoveBatchResponse,
+    StockMoveBatchResult,
 )
-from app.dependencies import get_current_user
+from app.dependencies import get_current_user, get_current_user_async
 from app.schemas.stock_move_line import (
     StockMoveLineResponse,
     PaginatedStockMoveLineWithNamesResponse,
 )
-from app.routers.websocket import manager
-from app.services.stock_move_service import create_stock_movement
-import anyio
+from app.services.stock_move_service import (
+    create_stock_movement,
+    create_stock_movements_batch,
+    find_idempotent_movement,
+    hash_movement_request,
+)
+from app.utils.getenv import get_required_env
+from app.utils.export import TextFormat, accepts_gzip, open_cursor, text_export
+from app.utils.pagination import paginate
 
 logger = logging.getLogger(__name__)
 
+# Batch ingestion: movements committed per transaction, and maximum size of a JSON array body
+# (NDJSON bodies are processed chunk by chunk while they stream in, so they are not capped).
+BATCH_CHUNK_SIZE = int(get_required_env("STOCK_MOVE_BATCH_CHUNK_SIZE", "500"))
+BATCH_MAX_MOVEMENTS = int(get_required_env("STOCK_MOVE_BATCH_MAX_MOVEMENTS", "10000"))
 
 router = APIRouter(prefix="/stock-movements", tags=["Stock Movements"])
 
 
+def _filter_movements(
+    statement,
+    current_user: User,
+    search: Optional[str],
+    move_type: Optional[str],
+    date_from: Optional[date],
+    date_to: Optional[date],
+    user_id: Optional[int],
+):
+    """Applies the movement list filters. Regular users only ever see their own movements."""
+    if search:
+        search_like = f"%{search.lower()}%"
+        statement = statement.where(func.lower(User.name).ilike(search_like))
+
+    if move_type in {"incoming", "outgoing"}:
+        statement = statement.where(StockMove.move_type == move_type)
+
+    if date_from:
+        dt_from = datetime.combine(date_from, time.min, tzinfo=timezone.utc)
+        statement = statement.where(StockMove.created_at >= dt_from)
+
+    if date_to:
+        dt_to = datetime.combine(date_to, time.max, tzinfo=timezone.utc)
+        statement = statement.where(StockMove.created_at <= dt_to)
+
+    if user_id and current_user.role.strip().lower() == "admin":
+        statement = statement.where(StockMove.user_id == user_id)
+
+    if current_user.role.strip().lower() != "admin":
+        statement = statement.where(StockMove.user_id == current_user.id)
+
+    return statement
+
+
 @router.get("/", response_model=PaginatedStockMovesResponse)
-def get_movements(
-    db: Session = Depends(get_db),
-    current_user=Depends(get_current_user),
+async def get_movements(
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user_async),
     limit: int = Query(10, ge=1, le=1000),
     offset: int = Query(0, ge=0),
     search: Optional[str] = Query(None),
@@ -45,49 +98,37 @@ def get_movements(
     date_from: Optional[date] = Query(None),
     date_to: Optional[date] = Query(None),
     user_id: Optional[int] = Query(None),
+    include_total: bool = Query(True, description="Set to false to skip counting the total"),
+    estimate_total: bool = Query(False, description="Return an approximate total from planner statistics"),
 ):
     """List all stock movements. Admin sees all, regular users see only their own, including lines."""
     try:
-        statement = select(StockMove, User.name).join(
-            User, StockMove.user_id == User.id
+        statement = _filter_movements(
+            select(StockMove, User.name).join(User, StockMove.user_id == User.id),
+            current_user,
+            search,
+            move_type,
+            date_from,
+            date_to,
+            user_id,
         )
 
-        if search:
-            search_like = f"%{search.lower()}%"
-            statement = statement.where(func.lower(User.name).ilike(search_like))
-
-        if move_type in {"incoming", "outgoing"}:
-            statement = statement.where(StockMove.move_type == move_type)
-
-        if date_from:
-            dt_from = datetime.combine(date_from, time.min, tzinfo=timezone.utc)
-            statement = statement.where(StockMove.created_at >= dt_from)
-
-        if date_to:
-            dt_to = datetime.combine(date_to, time.max, tzinfo=timezone.utc)
-            statement = statement.where(StockMove.created_at <= dt_to)
-
-        if user_id and current_user.role.strip().lower() == "admin":
-            statement = statement.where(StockMove.user_id == user_id)
-
-        if current_user.role.strip().lower() != "admin":
-            statement = statement.where(StockMove.user_id == current_user.id)
-
-        results = db.exec(
-            statement.order_by(StockMove.created_at.desc()).limit(limit).offset(offset)
-        ).all()
-
-        total_records = (
-            db.exec(select(func.count()).select_from(statement.subquery())).first() or 0
+        results, total_records = await db.run_sync(
+            paginate,
+            statement.order_by(StockMove.created_at.desc()),
+            limit,
+            offset,
+            include_total,
+            estimate_total,
         )
         
         # Extract movement ids from the results to fetch lines in a single query
         ids = [movement.id for movement, _ in results]
         
         # Fetch all lines for the retrieved movements in a single query
-        all_lines = db.exec(
-            select(StockMoveLine).where(StockMoveLine.move_id.in_(ids))
-        ).all() 
+        all_lines = (
+            await db.exec(select(StockMoveLine).where(StockMoveLine.move_id.in_(ids)))
+        ).all()
 
     except SQLAlchemyError:
         raise HTTPException(
@@ -126,34 +167,162 @@ def get_movements(
     }
 
 
-@router.get("/last-year", response_model=List[StockMoveLastYearGraph])
-def get_movements_last_year(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+# Columns of the CSV export: one row per movement line, movement fields repeated.
+MOVEMENT_EXPORT_FIELDS = [
+    "move_id",
+    "created_at",
+    "move_type",
+    "user_id",
+    "user_name",
+    "line_id",
+    "warehouse_id",
+    "product_id",
+    "lot",
+    "expiration_date",
+    "quantity",
+]
+LINE_FIELDS = ["move_id", "line_id", "warehouse_id", "product_id", "lot", "expiration_date", "quantity"]
+
+
+async def _movement_records(result) -> AsyncIterator[list[dict]]:
+    """Groups the line rows of the export cursor into one record per movement (StockMoveResponse shape).
+
+    Rows arrive ordered by movement, so a movement is complete when the next one starts;
+    the last movement of a batch is held back until then.
+    """
+    current = None
+    async for rows in result.partitions():
+        records = []
+        for row in rows:
+            if current is None or current["id"] != row.move_id:
+                if current is not None:
+                    records.append(current)
+                current = {
+                    "id": row.move_id,
+                    "created_at": row.created_at,
+                    "move_type": row.move_type,
+                    "user_id": row.user_id,
+                    "user_name": row.user_name,
+                    "lines": [],
+                }
+            if row.line_id is not None:
+                current["lines"].append({field: getattr(row, field) for field in LINE_FIELDS})
+        if records:
+            yield records
+    if current is not None:
+        yield [current]
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_movements(
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_async),
+    export_format: TextFormat = Query("csv", alias="format"),
+    search: Optional[str] = Query(None),
+    move_type: Optional[str] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    user_id: Optional[int] = Query(None),
 ):
-    """Returns movements from the last year. Filters by user if not admin."""
-    date_to = datetime.combine(datetime.now(timezone.utc).date(), time.max).replace(
-        tzinfo=timezone.utc
+    """Downloads the movements matching the list filters as CSV or NDJSON, newest first.
+    - CSV has one row per line; NDJSON has one movement (with its lines) per line.
+    - Rows are read from a server-side cursor and written as they arrive, gzipped on the
+      fly when the client accepts it, so memory does not grow with the result.
+    """
+    statement = _filter_movements(
+        select(
+            StockMove.id.label("move_id"),
+            StockMove.created_at,
+            StockMove.move_type,
+            StockMove.user_id,
+            User.name.label("user_name"),
+            StockMoveLine.line_id,
+            StockMoveLine.warehouse_id,
+            StockMoveLine.product_id,
+            StockMoveLine.lot,
+            StockMoveLine.expiration_date,
+            StockMoveLine.quantity,
+        )
+        .join(User, StockMove.user_id == User.id)
+        .outerjoin(StockMoveLine, StockMoveLine.move_id == StockMove.id)
+        .order_by(StockMove.created_at.desc(), StockMove.id.desc(), StockMoveLine.line_id),
+        current_user,
+        search,
+        move_type,
+        date_from,
+        date_to,
+        user_id,
+    )
+    try:
+        result = await open_cursor(db, statement)
+    except SQLAlchemyError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database connection error",
+        )
+    return text_export(
+        result,
+        export_format,
+        "stock_movements",
+        fieldnames=MOVEMENT_EXPORT_FIELDS,
+        compress=accepts_gzip(request),
+        records=_movement_records(result) if export_format == "ndjson" else None,
     )
-    date_from = date_to - relativedelta(years=1)
+
+
+@router.get("/last-year", response_model=List[StockMoveLastYearGraph])
+async def get_movements_last_year(
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_async),
+    date_from: Optional[date] = Query(None, description="First day (UTC), default one year before date_to"),
+    date_to: Optional[date] = Query(None, description="Last day (UTC), default today"),
+    granularity: Literal["day", "week", "month"] = Query("month"),
+):
+    """Returns movements per period, from the last year by default. Filters by user if not admin.
+    - Served from the `stock_move_daily_rollup` table, updated with every movement.
+    - Periods without movements are omitted.
+    """
+    date_to = date_to or datetime.now(timezone.utc).date()
+    date_from = date_from or date_to - relativedelta(years=1) + timedelta(days=1)
+    if date_from > date_to:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="'date_from' must be before or equal to 'date_to'.",
+        )
 
     try:
+        # One expression object, so asyncpg gets the same $n for SELECT and GROUP BY.
+        # Periods start at midnight UTC whatever the session time zone.
+        period = func.timezone(
+            "UTC", func.date_trunc(granularity, cast(StockMoveDailyRollup.day, DateTime))
+        ).label("period")
+
+        def total(column, move_type: str):
+            return func.coalesce(
+                func.sum(column).filter(StockMoveDailyRollup.move_type == move_type), 0
+            )
+
         statement = (
             select(
-                func.date_trunc("month", StockMove.created_at).label("month"),
-                func.count(case((StockMove.move_type == "incoming", 1))).label("incoming"),
-                func.count(case((StockMove.move_type == "outgoing", 1))).label("outgoing"),
+                period,
+                total(StockMoveDailyRollup.move_count, "incoming").label("incoming"),
+                total(StockMoveDailyRollup.move_count, "outgoing").label("outgoing"),
+                total(StockMoveDailyRollup.line_count, "incoming").label("incoming_lines"),
+                total(StockMoveDailyRollup.line_count, "outgoing").label("outgoing_lines"),
+                total(StockMoveDailyRollup.units, "incoming").label("incoming_units"),
+                total(StockMoveDailyRollup.units, "outgoing").label("outgoing_units"),
             )
-            .where(StockMove.created_at >= date_from)
-            .where(StockMove.created_at <= date_to)
-            .group_by(func.date_trunc("month", StockMove.created_at))
-            .order_by(func.date_trunc("month", StockMove.created_at))
+            .where(StockMoveDailyRollup.day >= date_from)
+            .where(StockMoveDailyRollup.day <= date_to)
+            .group_by(period)
+            .order_by(period)
         )
 
         if current_user.role.strip().lower() != "admin":
-            statement = statement.where(StockMove.user_id == current_user.id)
+            statement = statement.where(StockMoveDailyRollup.user_id == current_user.id)
 
-        results = db.exec(statement).all()
+        results = (await db.exec(statement)).all()
 
     except SQLAlchemyError:
         raise HTTPException(
@@ -163,19 +332,23 @@ def get_movements_last_year(
 
     return [
         StockMoveLastYearGraph(
-            month=row.month,
+            month=row.period,
             incoming=row.incoming,
             outgoing=row.outgoing,
+            incoming_lines=row.incoming_lines,
+            outgoing_lines=row.outgoing_lines,
+            incoming_units=row.incoming_units,
+            outgoing_units=row.outgoing_units,
         )
         for row in results
     ]
 
 
 @router.get("/{id}", response_model=StockMoveResponse)
-def get_movement(
+async def get_movement(
     id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
 ):
     """Retrieves the details of a specific movement along with its lines.
     - **Regular users** can only view their own movements.
@@ -187,7 +360,7 @@ def get_movement(
             .join(User, StockMove.user_id == User.id)
             .where(StockMove.id == id)
 )
-        result = db.exec(statement).first()
+        result = (await db.exec(statement)).first()
     except SQLAlchemyError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -213,7 +386,7 @@ def get_movement(
         statement_lines = select(StockMoveLine).where(
             StockMoveLine.move_id == movement.id
         )
-        movement_lines = db.exec(statement_lines).all()
+        movement_lines = (await db.exec(statement_lines)).all()
     except SQLAlchemyError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -233,50 +406,191 @@ def get_movement(
 @router.post("/", response_model=StockMoveResponse, status_code=status.HTTP_201_CREATED)
 def create_movement(
     movement_data: StockMoveCreate,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(
+        None,
+        alias="Idempotency-Key",
+        min_length=1,
+        max_length=255,
+        description="Client-generated key; retries with the same key return the original movement",
+    ),
 ):
     """
     Registers a stock movement with all its lines in a single request.
     - If a product is inactive, the operation is interrupted.
     - If a warehouse is inactive, the operation is interrupted.
+    - If the `Idempotency-Key` header was already used by this user (within
+      `IDEMPOTENCY_KEY_TTL_HOURS`), the original movement is returned with the
+      `Idempotent-Replayed: true` header and nothing is recorded again.
     """
-    new_movement, created_lines = create_stock_movement(movement_data, current_user.id, db)
+    request_hash = hash_movement_request(movement_data) if idempotency_key else None
 
-    # Broadcast to connected WebSocket clients.
-    try:
-        message = f"New stock movement recorded: {new_movement.id} ({new_movement.move_type})"
+    if idempotency_key:
+        replay = find_idempotent_movement(db, current_user.id, idempotency_key, request_hash)
+        if replay:
+            response.headers["Idempotent-Replayed"] = "true"
+            return _movement_response(*replay, user_name=current_user.name)
+
+    new_movement, created_lines = create_stock_movement(
+        movement_data, current_user.id, db, idempotency_key, request_hash
+    )
 
-        async def _broadcast(msg: str):
-            await manager.broadcast(msg)
+    return _movement_response(new_movement, created_lines, user_name=current_user.name)
 
-        anyio.from_thread.run(_broadcast, message)
-    except Exception as e:
-        logger.warning("WebSocket broadcast failed: %s", str(e))
 
+def _movement_response(
+    movement: StockMove, lines: List[StockMoveLine], user_name: str
+) -> StockMoveResponse:
     return StockMoveResponse(
-        id=new_movement.id,
-        created_at=new_movement.created_at,
-        move_type=new_movement.move_type,
-        user_id=new_movement.user_id,
-        user_name=current_user.name,
-        lines=[StockMoveLineResponse.model_validate(line) for line in created_lines],
+        id=movement.id,
+        created_at=movement.created_at,
+        move_type=movement.move_type,
+        user_id=movement.user_id,
+        user_name=user_name,
+        lines=[StockMoveLineResponse.model_validate(line) for line in lines],
     )
 
 
-@router.get("/{id}/lines", response_model=PaginatedStockMoveLineWithNamesResponse)
-def get_movement_lines(
-    id: int,
+def _parse_batch_item(index: int, raw) -> StockMoveCreate | StockMoveBatchResult:
+    """Validates one movement of a batch, returning an error result instead of raising."""
+    try:
+        if isinstance(raw, (str, bytes)):
+            return StockMoveCreate.model_validate_json(raw)
+        return StockMoveCreate.model_validate(raw)
+    except ValidationError as e:
+        detail = "; ".join(
+            f"{'.'.join(str(loc) for loc in error['loc']) or 'body'}: {error['msg']}"
+            for error in e.errors()
+        )
+        return StockMoveBatchResult(index=index, status="error", detail=detail)
+
+
+async def _ingest_batch_chunk(
+    items: list[tuple[int, StockMoveCreate | StockMoveBatchResult]],
+    user_id: int,
+    db: Session,
+    chunk_size: int,
+) -> list[StockMoveBatchResult]:
+    """Persists the parsed movements of `items` off the event loop and merges parse errors back in."""
+    valid = [(i, item) for i, item in items if isinstance(item, StockMoveCreate)]
+    results = [item for _, item in items if isinstance(item, StockMoveBatchResult)]
+    if valid:
+        results += await run_in_threadpool(
+            create_stock_movements_batch, valid, user_id, db, chunk_size
+        )
+    return sorted(results, key=lambda result: result.index)
+
+
+@router.post(
+    "/batch",
+    response_model=StockMoveBatchResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {
+                        "type": "array",
+                        "items": {"$ref": "#/components/schemas/StockMoveCreate"},
+                    }
+                },
+                "application/x-ndjson": {
+                    "schema": {"$ref": "#/components/schemas/StockMoveCreate"}
+                },
+            },
+        }
+    },
+)
+async def create_movements_batch(
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    chunk_size: int = Query(
+        BATCH_CHUNK_SIZE, ge=1, le=5000, description="Movements committed per transaction"
+    ),
+):
+    """
+    Registers many stock movements in one request (handheld scanners, ERP sync).
+    - The body is either a JSON array of movements or NDJSON
+      (`Content-Type: application/x-ndjson`, one movement per line). NDJSON is
+      ingested chunk by chunk while it is still being received.
+    - Movements are committed in chunks of `chunk_size`. Each movement is
+      independent and gets its own result (`created` with its id, or `error`).
+    """
+    results: list[StockMoveBatchResult] = []
+
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        pending: list[tuple[int, StockMoveCreate | StockMoveBatchResult]] = []
+        index = 0
+        buffer = b""
+        async for data in request.stream():
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if not line.strip():
+                    continue
+                pending.append((index, _parse_batch_item(index, line)))
+                index += 1
+                if len(pending) >= chunk_size:
+                    results += await _ingest_batch_chunk(pending, current_user.id, db, chunk_size)
+                    pending = []
+        if buffer.strip():
+            pending.append((index, _parse_batch_item(index, buffer)))
+        results += await _ingest_batch_chunk(pending, current_user.id, db, chunk_size)
+
+    else:
+        try:
+            payload = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="The body must be a JSON array of movements or NDJSON.",
+            )
+        if not isinstance(payload, list) or not payload:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="The body must be a non-empty JSON array of movements.",
+            )
+        if len(payload) > BATCH_MAX_MOVEMENTS:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=(
+                    f"The maximum number of movements per JSON batch is {BATCH_MAX_MOVEMENTS}. "
+                    "Use NDJSON to stream larger batches."
+                ),
+            )
+        results = await _ingest_batch_chunk(
+            [(i, _parse_batch_item(i, raw)) for i, raw in enumerate(payload)],
+            current_user.id,
+            db,
+            chunk_size,
+        )
+
+    created = sum(1 for result in results if result.status == "created")
+
+    return StockMoveBatchResponse(
+        created=created, failed=len(results) - created, results=results
+    )
+
+
+
+@router.get("/{id}/lines", response_model=PaginatedStockMoveLineWithNamesResponse)
+async def get_movement_lines(
+    id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
     limit: int = Query(10, ge=1, le=1000),
     offset: int = Query(0, ge=0),
+    include_total: bool = Query(True, description="Set to false to skip counting the total"),
+    estimate_total: bool = Query(False, description="Return an approximate total from planner statistics"),
 ):
     """Lists all lines of a movement with product and warehouse names."""
 
     try:
         statement = select(StockMove).where(StockMove.id == id)
-        movement = db.exec(statement).first()
+        movement = (await db.exec(statement)).first()
     except SQLAlchemyError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -304,12 +618,8 @@ def get_movement_lines(
             .order_by(StockMoveLine.line_id)
         )
 
-        results = db.exec(statement_lines.limit(limit).offset(offset)).all()
-        total_records = (
-            db.exec(
-                select(func.count()).select_from(statement_lines.subquery())
-            ).first()
-            or 0
+        results, total_records = await db.run_sync(
+            paginate, statement_lines, limit, offset, include_total, estimate_total
         )
 
         lines = []
@@ -343,9 +653,9 @@ def get_movement_lines(
 
 
 @router.get("/summary/move-type", response_model=List[StockMoveSummary])
-def count_movements_by_move_type(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+async def count_movements_by_move_type(
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_async),
 ):
     """Counts the number of stock movements grouped by move type (incoming, outgoing)."""
     try:
@@ -355,7 +665,7 @@ def count_movements_by_move_type(
             statement = statement.where(StockMove.user_id == current_user.id)
 
         statement = statement.group_by(StockMove.move_type)
-        results = db.exec(statement).all()
+        results = (await db.exec(statement)).all()
 
         count = {"incoming": 0, "outgoing": 0}
         for move_type, quantity in results:
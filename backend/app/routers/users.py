@@ -14,8 +14,11 @@ from app.schemas.user import (
     UserUpdate,
 )
 from app.schemas.common import BulkStatusUpdate, BulkStatusUpdateResponse
+from app.services.auth_cache import invalidate_users
+from app.services.notification_bus import publish_user_changed
 from app.utils.authentication import hash_password
 from app.dependencies import require_admin
+from app.utils.pagination import paginate
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
@@ -44,11 +47,9 @@ def get_users(
                 | func.lower(User.email).like(search_like)
             )
 
-        total_records = db.exec(
-            select(func.count()).select_from(statement.subquery())
-        ).first()
-
-        users = db.exec(statement.order_by(User.name).limit(limit).offset(offset)).all()
+        users, total_records = paginate(
+            db, statement.order_by(User.name), limit, offset
+        )
 
     except SQLAlchemyError:
         raise HTTPException(
@@ -167,6 +168,8 @@ def bulk_update_user_status(
             db.add(user)
             updated.append(user)
 
+        if updated:
+            publish_user_changed(db, [user.id for user in updated])
         db.commit()
 
     except SQLAlchemyError:
@@ -176,6 +179,8 @@ def bulk_update_user_status(
             detail="Error updating users",
         )
 
+    # Cached tokens of deactivated users must stop working now, not when they expire.
+    invalidate_users([user.id for user in updated])
     return {
         "message": f"{len(updated)} users updated",
         "skipped": len(data.ids) - len(updated),
@@ -265,6 +270,7 @@ def update_user(
 
     try:
         db.add(user)
+        publish_user_changed(db, [user.id])
         db.commit()
         db.refresh(user)
     except IntegrityError:
@@ -279,6 +285,7 @@ def update_user(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error while updating the user.",
         )
+    invalidate_users([user.id])
     return user
 
 
@@ -319,6 +326,7 @@ def delete_user(
 
     try:
         db.delete(user)
+        publish_user_changed(db, [user.id])
         db.commit()
     except SQLAlchemyError:
         db.rollback()
@@ -326,4 +334,5 @@ def delete_user(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error deleting the user",
         )
+    invalidate_users([user.id])
     return user  # Returns the deleted user's data
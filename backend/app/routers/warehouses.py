@@ -9,6 +9,7 @@ from app.models.stock import Stock
 from app.models.warehouse import Warehouse
 from app.models.user import User
 from app.dependencies import get_current_user
+from app.utils.pagination import paginate
 from app.schemas.warehouse import (
     PaginatedWarehouseResponse,
     WarehouseCreate,
@@ -28,6 +29,8 @@ def get_warehouses(
     offset: int = Query(0, ge=0),
     search: Optional[str] = Query(None),
     is_active: Optional[bool] = Query(None),
+    include_total: bool = Query(True, description="Set to false to skip counting the total"),
+    estimate_total: bool = Query(False, description="Return an approximate total from planner statistics"),
 ):
     """Lists all warehouses. Both regular users and admins can view them."""
     try:
@@ -42,13 +45,13 @@ def get_warehouses(
         if is_active is not None:
             statement = statement.where(Warehouse.is_active == is_active)
 
-        paginated = (
-            statement.order_by(Warehouse.name).limit(limit).offset(offset)
-        )
-        warehouses = db.exec(paginated).all()
-
-        total_records = (
-            db.exec(select(func.count()).select_from(statement.subquery())).first() or 0
+        warehouses, total_records = paginate(
+            db,
+            statement.order_by(Warehouse.name),
+            limit,
+            offset,
+            include_total,
+            estimate_total,
         )
 
     except SQLAlchemyError:
@@ -1,46 +1,225 @@
 
+import asyncio
+import json
+import logging
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import List
+from pydantic import ValidationError
 from app.utils.authentication import decode_access_token
+from app.utils.getenv import get_required_env
 from app.models.database import engine
 from sqlmodel import Session, select
 from app.models.user import User
+from app.schemas.websocket import StockDeltaEvent, StockLevel, StockSubscription
 
 router = APIRouter()
 
+logger = logging.getLogger(__name__)
+
+# Messages waiting to be sent to one client before it counts as a slow consumer.
+SEND_QUEUE_SIZE = int(get_required_env("WS_SEND_QUEUE_SIZE", fallback="100"))
+# What to do with a slow consumer whose queue is full:
+# "drop" discards its oldest pending message, "disconnect" closes its connection.
+SLOW_CONSUMER_POLICY = get_required_env("WS_SLOW_CONSUMER_POLICY", fallback="drop")
+# A single send that takes longer than this closes the connection.
+SEND_TIMEOUT = float(get_required_env("WS_SEND_TIMEOUT_SECONDS", fallback="10"))
+
+# 1013 = Try Again Later
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class ClientConnection:
+    """An authenticated client with its own bounded send queue, drained by its own task.
+
+    Without a `subscription` the client gets the plain text notifications.
+    """
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.sender: asyncio.Task | None = None
+        self.subscription: StockSubscription | None = None
+        self.subscription_key: tuple | None = None
+
+    def subscribe(self, subscription: StockSubscription) -> None:
+        self.subscription = subscription
+        self.subscription_key = (
+            frozenset(subscription.warehouse_ids),
+            frozenset(subscription.product_ids),
+            frozenset(subscription.move_types),
+        )
+
+
+def _text_message(event: dict) -> str:
+    if event.get("move_id") is not None:
+        return f"New stock movement recorded: {event['move_id']} ({event['move_types'][0]})"
+    return f"New stock movements recorded: {event['count']} (batch)"
+
+
+def _delta_message(event: dict, subscription: StockSubscription) -> str | None:
+    """The `stock_delta` JSON for one subscription, or None if the event doesn't concern it."""
+    warehouses, products = set(subscription.warehouse_ids), set(subscription.product_ids)
+    if subscription.move_types and not set(subscription.move_types) & set(event["move_types"]):
+        return None
+
+    stock = None
+    if event.get("stock") is not None:
+        stock = [
+            StockLevel(warehouse_id=w, product_id=p, lot=lot, quantity=quantity)
+            for w, p, lot, quantity in event["stock"]
+            if (not warehouses or w in warehouses) and (not products or p in products)
+        ]
+        if not stock:
+            return None
+    # Too many rows for one notification: match on the IDs (when known) and let the client refetch.
+    elif (
+        warehouses and event.get("warehouse_ids") is not None and not warehouses & set(event["warehouse_ids"])
+    ) or (
+        products and event.get("product_ids") is not None and not products & set(event["product_ids"])
+    ):
+        return None
+
+    return StockDeltaEvent(
+        move_id=event.get("move_id"),
+        count=event["count"],
+        move_types=event["move_types"],
+        stock=stock,
+    ).model_dump_json()
 
-class ConnectionManager:
-    """This class stores all active WebSocket connections in a list.
-    Each time a client connects, the connection is added to the list."""
 
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+class ConnectionManager:
+    """Stores the authenticated WebSocket connections of this worker.
+
+    - `broadcast` only enqueues: each connection has a bounded queue and a sender task,
+      so a slow client never delays the others or the caller.
+    - When a queue is full, `slow_consumer_policy` either drops the oldest pending
+      message ("drop") or closes the connection ("disconnect").
+    - A failed or timed-out send closes the connection.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = SEND_QUEUE_SIZE,
+        slow_consumer_policy: str = SLOW_CONSUMER_POLICY,
+        send_timeout: float = SEND_TIMEOUT,
+    ):
+        if slow_consumer_policy not in ("drop", "disconnect"):
+            raise ValueError(f"Unknown slow consumer policy: {slow_consumer_policy!r}")
+        self.queue_size = queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.send_timeout = send_timeout
+        self.active_connections: dict[WebSocket, ClientConnection] = {}
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()  # Establish the connection with the client.
-    
-    def authorize(self, websocket: WebSocket):
-        self.active_connections.append(websocket)  
-    
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)  
 
-    async def broadcast(self, message: str):
-        """This method sends a text message to all connected clients."""
-        dead = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception:
-                dead.append(connection)
-        for conn in dead:
-            self.active_connections.remove(conn)
+    def authorize(self, websocket: WebSocket) -> ClientConnection:
+        connection = ClientConnection(websocket, self.queue_size)
+        connection.sender = asyncio.create_task(self._send_loop(connection))
+        self.active_connections[websocket] = connection
+        return connection
+
+    def disconnect(self, websocket: WebSocket):
+        connection = self.active_connections.pop(websocket, None)
+        if connection is not None and connection.sender is not asyncio.current_task():
+            connection.sender.cancel()
+
+    def broadcast(self, message: str) -> None:
+        """Queues a text message for every connected client and returns immediately."""
+        for connection in list(self.active_connections.values()):
+            self.send(connection, message)
+
+    def broadcast_movements(self, event: dict) -> None:
+        """Queues a `movements_recorded` bus event for every client that should see it.
+
+        Clients without a subscription get the text notification; the others get the
+        JSON delta filtered by their subscription, serialized once per distinct subscription.
+        """
+        text = None
+        deltas: dict[tuple, str | None] = {}
+        for connection in list(self.active_connections.values()):
+            if connection.subscription is None:
+                text = text or _text_message(event)
+                message = text
+            else:
+                key = connection.subscription_key
+                if key not in deltas:
+                    deltas[key] = _delta_message(event, connection.subscription)
+                message = deltas[key]
+            if message is not None:
+                self.send(connection, message)
+
+    def send(self, connection: ClientConnection, message: str) -> None:
+        """Queues a message for one client, applying the slow consumer policy if its queue is full."""
+        try:
+            connection.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self._on_queue_full(connection, message)
+
+    def receive(self, websocket: WebSocket, text: str) -> None:
+        """Handles a message from an authenticated client: JSON objects are commands."""
+        connection = self.active_connections.get(websocket)
+        if connection is None or not text.lstrip().startswith("{"):
+            return  # e.g. keep-alive pings
+        try:
+            subscription = StockSubscription.model_validate_json(text)
+        except ValidationError as e:
+            errors = e.errors(include_url=False, include_input=False, include_context=False)
+            self.send(connection, json.dumps({"type": "error", "detail": errors}))
+            return
+        connection.subscribe(subscription)
+        self.send(
+            connection,
+            json.dumps({"type": "subscribed", **subscription.model_dump(exclude={"action"})}),
+        )
+
+    def _on_queue_full(self, connection: ClientConnection, message: str) -> None:
+        if self.slow_consumer_policy == "drop":
+            connection.queue.get_nowait()
+            connection.queue.put_nowait(message)
+            connection.dropped += 1
+            if connection.dropped == 1:
+                logger.warning("Slow WebSocket client, dropping its oldest messages")
+            return
+        logger.warning("Slow WebSocket client, closing its connection")
+        self.disconnect(connection.websocket)
+        asyncio.ensure_future(self._close(connection.websocket))
+
+    async def _send_loop(self, connection: ClientConnection) -> None:
+        try:
+            while True:
+                message = await connection.queue.get()
+                # asyncio.timeout, unlike wait_for, doesn't wrap every send in a new task.
+                async with asyncio.timeout(self.send_timeout):
+                    await connection.websocket.send_text(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Gone or stuck: forget it, the receive loop ends with the socket.
+            self.disconnect(connection.websocket)
+            await self._close(connection.websocket)
+
+    @staticmethod
+    async def _close(websocket: WebSocket) -> None:
+        try:
+            await websocket.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except Exception:
+            pass
 
 
 # Instantiate so it can be used anywhere in the code
 manager = ConnectionManager()
 
 
+def on_movements_recorded(event: dict) -> None:
+    """Relays a committed movement, recorded by any worker, to this worker's clients.
+
+    Subscribed to the notification bus in app/main.py; every worker runs it for
+    every movement, so each client hears about it whichever worker it is connected to.
+    """
+    manager.broadcast_movements(event)
+
+
 @router.websocket("/ws/stock-moves")
 async def websocket_endpoint(websocket: WebSocket):
     # Accept the connection first to allow receiving messages (like the token) from the client.
@@ -69,6 +248,8 @@ async def websocket_endpoint(websocket: WebSocket):
     try:
         # Keep the connection alive with an infinite loop.
         while True:
-            await websocket.receive_text()
+            manager.receive(websocket, await websocket.receive_text())
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
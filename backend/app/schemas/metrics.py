@@ -0,0 +1,45 @@
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel, Field
+
+
+class PoolMetrics(BaseModel):
+    """Connection pool state and checkout wait times of one engine (current worker only)."""
+
+    engine: str = Field(..., description="'sync' (psycopg2), 'async' (asyncpg) or 'replica' (asyncpg, read replica)")
+    pool_size: int = Field(..., description="Configured pool size (DB_POOL_SIZE)")
+    checked_out: int = Field(..., description="Connections currently in use")
+    overflow: int = Field(..., description="Connections opened beyond pool_size (negative while the pool is not full)")
+    checkouts: int = Field(..., description="Checkouts since the worker started")
+    timeouts: int = Field(..., description="Checkouts that gave up after DB_POOL_TIMEOUT")
+    wait_avg_ms: float = Field(..., description="Average time waiting for a connection")
+    wait_max_ms: float = Field(..., description="Longest time waiting for a connection")
+
+
+class CacheMetrics(BaseModel):
+    """Size and hit/miss counters of one in-process cache (current worker only)."""
+
+    cache: str = Field(
+        ..., description="'semaphore' (/stock/semaphore), 'dashboard' (other stock aggregates) or 'auth' (verified tokens)"
+    )
+    size: int = Field(..., description="Entries currently cached")
+    max_entries: int = Field(..., description="Entries kept before the least recently used is evicted")
+    ttl_seconds: float = Field(..., description="Lifetime of an entry")
+    hits: int = Field(..., description="Lookups answered from the cache since the worker started")
+    misses: int = Field(..., description="Lookups that went to the database")
+    evictions: int = Field(..., description="Entries evicted because the cache was full")
+    hit_ratio: float = Field(..., description="hits / (hits + misses), 0 before the first lookup")
+
+
+class RevokedTokenMetrics(BaseModel):
+    """Size of `revoked_tokens` and the expired token purges run by the current worker."""
+
+    rows: int = Field(..., description="Rows in revoked_tokens")
+    expired_rows: int = Field(..., description="Rows already expired, waiting for the next purge")
+    total_bytes: int = Field(..., description="On-disk size of the table and its indexes")
+    in_memory: Optional[int] = Field(..., description="Tokens in this worker's revoked set (null when only the Bloom filter is kept)")
+    purge_runs: int = Field(..., description="Purges run by this worker since it started")
+    total_purged: int = Field(..., description="Rows deleted by those purges")
+    last_purged: Optional[int] = Field(..., description="Rows deleted by the last purge (null before the first one)")
+    last_purge_at: Optional[datetime] = Field(..., description="When the last purge finished")
+    last_purge_ms: Optional[float] = Field(..., description="Duration of the last purge")
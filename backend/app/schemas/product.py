@@ -53,7 +53,7 @@ class ProductResponse(ProductBase):
 
 class PaginatedProductResponse(BaseModel):
     data: List[ProductResponse]
-    total: int
+    total: Optional[int] = Field(..., description="Total rows (null when include_total=false)")
     limit: int
     offset: int
 
@@ -58,7 +58,7 @@ class PaginatedStockResponse(BaseModel):
     """Pagination schema for StockResponse."""
 
     data: List[StockResponse]
-    total: int
+    total: Optional[int] = Field(..., description="Total rows (null when include_total=false)")
     limit: int
     offset: int
 
@@ -77,16 +77,31 @@ class PaginatedStockSummary(BaseModel):
 
 
 class PaginatedStockHistory(BaseModel):
-    """Pagination schema for StockHistory."""
+    """Pagination schema for StockHistory.
+    - `next_cursor` is null on the last page; pass it as `cursor` to fetch the next one.
+    """
 
     data: List[StockHistory]
-    total: int
+    total: Optional[int] = Field(..., description="Total rows (null when include_total=false)")
     limit: int
     offset: int
+    next_cursor: Optional[str] = Field(
+        default=None, description="Opaque cursor for the next page (keyset pagination)"
+    )
 
     model_config = {"from_attributes": True}
 
 
+class StockSemaphoreGroup(BaseModel):
+    """Traffic light buckets for one warehouse or product category."""
+
+    id: int
+    name: str
+    no_expiration: int
+    expiring_soon: int
+    expired: int
+
+
 class StockSemaphore(BaseModel):
     """Schema for stock expiration traffic light endpoint."""
 
@@ -98,6 +113,9 @@ class StockSemaphore(BaseModel):
     )
     expired: int = Field(..., ge=0, description="Stock expired or expiring within the next month (expiration date <= 1 month from today)."
     )
+    breakdown: Optional[List[StockSemaphoreGroup]] = Field(
+        default=None, description="Same buckets per warehouse or per category (null unless requested)."
+    )
 
     model_config = {"from_attributes": True}
 
@@ -140,3 +158,12 @@ class AvailableLotResponse(BaseModel):
     lot: str
     expiration_date: Optional[datetime.date]
     quantity: int
+
+
+class StockAsOf(BaseModel):
+    """Quantity of a (warehouse, product, lot) at the end of a past day."""
+
+    warehouse_id: int
+    product_id: int
+    lot: str
+    quantity: int = Field(..., description="Quantity at the end of the requested day (UTC)")
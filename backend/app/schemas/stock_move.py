@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Literal, List
+from typing import Literal, List, Optional
 from app.schemas.stock_move_line import StockMoveLineCreate, StockMoveLineResponse
 
 
@@ -36,7 +36,7 @@ class StockMoveResponse(StockMoveBase):
 
 class PaginatedStockMovesResponse(BaseModel):
     data: List[StockMoveResponse]
-    total: int
+    total: Optional[int] = Field(..., description="Total rows (null when include_total=false)")
     limit: int
     offset: int
 
@@ -51,8 +51,34 @@ class StockMoveSummary(BaseModel):
 
 
 class StockMoveLastYearGraph(BaseModel):
+    """Movements of one period of the movement graph.
+    - `month` is the start of the period (a month, an ISO week or a day, see `granularity`).
+    """
+
     month: datetime
     incoming: int
     outgoing: int
+    incoming_lines: int = Field(0, description="Lines of the incoming movements")
+    outgoing_lines: int = Field(0, description="Lines of the outgoing movements")
+    incoming_units: int = Field(0, description="Units received")
+    outgoing_units: int = Field(0, description="Units shipped")
 
     model_config = {"from_attributes": True}
+
+
+class StockMoveBatchResult(BaseModel):
+    """Outcome of one movement of a batch.
+    - `index` is the position of the movement in the request (0-based).
+    - `id` is set when the movement was created, `detail` when it failed.
+    """
+
+    index: int
+    status: Literal["created", "error"]
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class StockMoveBatchResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[StockMoveBatchResult]
@@ -50,7 +50,7 @@ class StockMoveLineWithNamesResponse(StockMoveLineResponse):
 
 class PaginatedStockMoveLineWithNamesResponse(BaseModel):
     data: List[StockMoveLineWithNamesResponse]
-    total: int
+    total: Optional[int] = Field(..., description="Total rows (null when include_total=false)")
     limit: int
     offset: int
 
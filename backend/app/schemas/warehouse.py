@@ -47,7 +47,7 @@ class WarehouseResponse(WarehouseBase):
 
 class PaginatedWarehouseResponse(BaseModel):
     data: List[WarehouseResponse]
-    total: int
+    total: Optional[int] = Field(..., description="Total rows (null when include_total=false)")
     limit: int
     offset: int
 
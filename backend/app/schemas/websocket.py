@@ -0,0 +1,35 @@
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
+
+
+class StockSubscription(BaseModel):
+    """Message a client sends on /ws/stock-moves to receive JSON deltas instead of text.
+    - An empty list means "all" for that dimension.
+    - Sending it again replaces the previous subscription.
+    """
+
+    action: Literal["subscribe"]
+    warehouse_ids: List[int] = Field(default=[], description="Only movements touching these warehouses")
+    product_ids: List[int] = Field(default=[], description="Only movements touching these products")
+    move_types: List[Literal["incoming", "outgoing"]] = Field(default=[], description="Only these movement types")
+
+
+class StockLevel(BaseModel):
+    """Stock of one (warehouse, product, lot) right after the movement committed."""
+
+    warehouse_id: int
+    product_id: int
+    lot: str
+    quantity: int = Field(..., ge=0, description="New quantity (0 if the lot is gone)")
+
+
+class StockDeltaEvent(BaseModel):
+    """JSON event pushed to subscribed clients when movements commit."""
+
+    type: Literal["stock_delta"] = "stock_delta"
+    move_id: Optional[int] = Field(default=None, description="Movement ID (null for a batch)")
+    count: int = Field(..., description="Movements recorded (1, or the size of a batch chunk)")
+    move_types: List[str]
+    stock: Optional[List[StockLevel]] = Field(
+        ..., description="Changed stock rows matching the subscription; null if too many to send, refetch instead"
+    )
@@ -0,0 +1,70 @@
+import time
+from typing import Iterable
+from app.models.user import User
+from app.utils.cache import TTLCache
+from app.utils.getenv import get_required_env
+
+# Verified access tokens, keyed by the raw token. A hit skips the JWT decode, the
+# revoked-token lookup and the user query. Entries are tagged ("user", id) and
+# ("jti", jti) so that a user change or a logout drops them right away.
+AUTH_CACHE_TTL = float(get_required_env("AUTH_CACHE_TTL_SECONDS", "30"))
+AUTH_CACHE_MAX_ENTRIES = int(get_required_env("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+token_cache = TTLCache(ttl=AUTH_CACHE_TTL, maxsize=AUTH_CACHE_MAX_ENTRIES)
+
+# The password hash is deliberately not cached.
+USER_FIELDS = ("id", "name", "email", "role", "is_active")
+
+
+def get_cached_user(token: str) -> User | None:
+    """The active user a previously verified token belongs to, or None on a miss.
+
+    A new detached User is returned each time, so callers can't alter the cached row.
+    """
+    values = token_cache.get(token)
+    return User(**values) if values is not None else None
+
+
+def cache_user(token: str, payload: dict, user: User, generation: int) -> None:
+    """Remembers that `token` (decoded as `payload`) belongs to the active `user`.
+
+    The entry never outlives the token's own expiry.
+    """
+    expires_in = payload.get("exp", 0) - time.time()
+    token_cache.set(
+        token,
+        {field: getattr(user, field) for field in USER_FIELDS},
+        tags=[("user", user.id), ("jti", payload.get("jti"))],
+        generation=generation,
+        ttl=expires_in,
+    )
+
+
+def invalidate_users(user_ids: Iterable[int]) -> None:
+    """Drops the tokens of updated, deactivated or deleted users (this worker only).
+
+    The other workers get the same call from the `user_changed` notification.
+    """
+    token_cache.invalidate([("user", user_id) for user_id in user_ids])
+
+
+def invalidate_tokens(jtis: Iterable[str]) -> None:
+    """Drops revoked tokens (this worker only; see on_tokens_revoked)."""
+    token_cache.invalidate([("jti", jti) for jti in jtis])
+
+
+def clear_all() -> None:
+    token_cache.clear()
+
+
+def on_user_changed(event: dict) -> None:
+    """Handler for `user_changed` notifications sent by any worker (app/services/notification_bus.py)."""
+    if event.get("user_ids") is None:
+        clear_all()
+    else:
+        invalidate_users(event["user_ids"])
+
+
+def on_tokens_revoked(event: dict) -> None:
+    """Handler for `tokens_revoked` notifications sent by any worker."""
+    invalidate_tokens(event.get("tokens") or {})
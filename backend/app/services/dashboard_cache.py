@@ -0,0 +1,46 @@
+from typing import Iterable
+from app.utils.cache import TTLCache
+from app.utils.getenv import get_required_env
+
+# Every cached aggregate is tagged with the data it summarises:
+# - STOCK_TAG: aggregates over the whole `stock` table (any movement changes them)
+# - ("warehouse", id) / ("category", id): aggregates over one warehouse or category
+STOCK_TAG = "stock"
+
+# The traffic light buckets only move with stock changes or the date, so a short TTL is enough.
+SEMAPHORE_CACHE_TTL = float(get_required_env("STOCK_SEMAPHORE_CACHE_TTL_SECONDS", "30"))
+DASHBOARD_CACHE_TTL = float(get_required_env("DASHBOARD_CACHE_TTL_SECONDS", "60"))
+DASHBOARD_CACHE_MAX_ENTRIES = int(get_required_env("DASHBOARD_CACHE_MAX_ENTRIES", "1024"))
+
+semaphore_cache = TTLCache(ttl=SEMAPHORE_CACHE_TTL, maxsize=16)
+dashboard_cache = TTLCache(ttl=DASHBOARD_CACHE_TTL, maxsize=DASHBOARD_CACHE_MAX_ENTRIES)
+
+caches = {"semaphore": semaphore_cache, "dashboard": dashboard_cache}
+
+
+def invalidate_stock(
+    warehouse_ids: Iterable[int] | None, category_ids: Iterable[int] | None
+) -> None:
+    """Drops the cached aggregates a committed movement may have changed (`None` = all of them).
+
+    Only this worker's caches are cleared; the other workers get the same call from
+    the `stock_changed` notification (see on_stock_changed).
+    """
+    if warehouse_ids is None or category_ids is None:
+        clear_all()
+        return
+    tags = [STOCK_TAG]
+    tags += [("warehouse", warehouse_id) for warehouse_id in set(warehouse_ids)]
+    tags += [("category", category_id) for category_id in set(category_ids)]
+    for cache in caches.values():
+        cache.invalidate(tags)
+
+
+def clear_all() -> None:
+    for cache in caches.values():
+        cache.clear()
+
+
+def on_stock_changed(event: dict) -> None:
+    """Handler for `stock_changed` notifications sent by any worker (app/services/notification_bus.py)."""
+    invalidate_stock(event.get("warehouse_ids"), event.get("category_ids"))
@@ -0,0 +1,200 @@
+import asyncio
+import inspect
+import json
+import logging
+from typing import Callable, Iterable, Optional
+import asyncpg
+from sqlalchemy.engine import make_url
+from sqlmodel import Session, func, select
+from app.models.database import DATABASE_URL
+from app.utils.getenv import get_required_env
+
+logger = logging.getLogger(__name__)
+
+# Postgres channel shared by every worker (and every API instance on the same database).
+CHANNEL = "tabulae_stock"
+
+# LISTEN needs a session-level connection: point this at Postgres directly when
+# DATABASE_URL goes through PgBouncer in transaction mode.
+LISTEN_DATABASE_URL = get_required_env("DB_LISTEN_URL", fallback=DATABASE_URL)
+RECONNECT_DELAY = float(get_required_env("NOTIFY_RECONNECT_DELAY_SECONDS", fallback="1"))
+# An idle LISTEN connection is pinged this often, so a silently dropped one is noticed.
+HEALTH_CHECK_INTERVAL = 30
+
+# NOTIFY payloads are limited to 8000 bytes by Postgres.
+MAX_PAYLOAD_BYTES = 7900
+
+# Event types
+STOCK_CHANGED = "stock_changed"
+MOVEMENTS_RECORDED = "movements_recorded"
+USER_CHANGED = "user_changed"
+TOKENS_REVOKED = "tokens_revoked"
+
+
+def publish(db: Session, event_type: str, **data) -> None:
+    """Queues an event on CHANNEL inside the current transaction.
+
+    Postgres delivers it to the listeners when (and only if) the transaction commits.
+    """
+    payload = json.dumps({"type": event_type, **data}, separators=(",", ":"), default=str)
+    if len(payload.encode()) > MAX_PAYLOAD_BYTES:
+        raise ValueError(f"Notification payload too large ({len(payload)} bytes)")
+    db.exec(select(func.pg_notify(CHANNEL, payload)))
+
+
+def publish_stock_changed(
+    db: Session, warehouse_ids: Iterable[int], category_ids: Iterable[int]
+) -> None:
+    """Announces a stock change in the current transaction.
+
+    If the IDs don't fit in one payload, `null` lists are sent, meaning "anything may have changed".
+    """
+    warehouse_ids, category_ids = sorted(set(warehouse_ids)), sorted(set(category_ids))
+    try:
+        publish(db, STOCK_CHANGED, warehouse_ids=warehouse_ids, category_ids=category_ids)
+    except ValueError:
+        publish(db, STOCK_CHANGED, warehouse_ids=None, category_ids=None)
+
+
+def publish_movements_recorded(
+    db: Session,
+    move_types: Iterable[str],
+    stock_levels: list[tuple[int, int, str, int]],
+    move_id: Optional[int] = None,
+    count: int = 1,
+) -> None:
+    """Announces committed movements with the new stock of every (warehouse, product, lot) they touched.
+
+    `stock_levels` holds (warehouse_id, product_id, lot, quantity) tuples. When they don't fit
+    in one payload, `stock` is sent as null; if even the IDs don't fit, they are null too.
+    """
+    event = {
+        "move_id": move_id,
+        "count": count,
+        "move_types": sorted(set(move_types)),
+        "warehouse_ids": sorted({level[0] for level in stock_levels}),
+        "product_ids": sorted({level[1] for level in stock_levels}),
+    }
+    try:
+        publish(db, MOVEMENTS_RECORDED, **event, stock=[list(level) for level in stock_levels])
+        return
+    except ValueError:
+        pass
+    try:
+        publish(db, MOVEMENTS_RECORDED, **event, stock=None)
+    except ValueError:
+        event.update(warehouse_ids=None, product_ids=None)
+        publish(db, MOVEMENTS_RECORDED, **event, stock=None)
+
+
+def publish_user_changed(db: Session, user_ids: Iterable[int]) -> None:
+    """Announces that users were updated, deactivated or deleted in the current transaction.
+
+    If the IDs don't fit in one payload, `user_ids` is null, meaning "any user may have changed".
+    """
+    try:
+        publish(db, USER_CHANGED, user_ids=sorted(set(user_ids)))
+    except ValueError:
+        publish(db, USER_CHANGED, user_ids=None)
+
+
+def publish_tokens_revoked(db: Session, tokens: dict[str, float]) -> None:
+    """Announces tokens revoked in the current transaction, as jti -> expiry timestamp."""
+    publish(db, TOKENS_REVOKED, tokens=tokens)
+
+
+class NotificationListener:
+    """Per-worker LISTEN connection that dispatches CHANNEL events to subscribed handlers.
+
+    - Handlers receive the decoded event dict; they may be plain functions or coroutines.
+    - The connection is re-opened after RECONNECT_DELAY if it drops. Events sent
+      meanwhile are lost: `on_disconnect` callbacks run as soon as it drops, and
+      `on_reconnect` callbacks once it is back.
+    """
+
+    def __init__(self, dsn: str, channel: str = CHANNEL):
+        self.dsn = make_url(dsn).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.channel = channel
+        self._handlers: dict[str, list[Callable]] = {}
+        self._reconnect_callbacks: list[Callable] = []
+        self._disconnect_callbacks: list[Callable] = []
+        self._task: Optional[asyncio.Task] = None
+        self.connected = asyncio.Event()
+
+    def subscribe(self, event_type: str, handler: Callable) -> None:
+        self._handlers.setdefault(event_type, []).append(handler)
+
+    def on_reconnect(self, callback: Callable) -> None:
+        self._reconnect_callbacks.append(callback)
+
+    def on_disconnect(self, callback: Callable) -> None:
+        self._disconnect_callbacks.append(callback)
+
+    def start(self) -> None:
+        self.connected = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def dispatch(self, event: dict) -> None:
+        for handler in self._handlers.get(event.get("type"), []):
+            try:
+                result = handler(event)
+                if inspect.isawaitable(result):
+                    asyncio.ensure_future(result)
+            except Exception:
+                logger.exception("Notification handler failed for %s", event.get("type"))
+
+    def _on_notification(self, connection, pid, channel, payload) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed notification on %s: %r", channel, payload[:200])
+            return
+        self.dispatch(event)
+
+    async def _run(self) -> None:
+        first_connection = True
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                lost = asyncio.Event()
+                connection.add_termination_listener(lambda _: lost.set())
+                await connection.add_listener(self.channel, self._on_notification)
+                if not first_connection:
+                    for callback in self._reconnect_callbacks:
+                        callback()
+                first_connection = False
+                self.connected.set()
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), HEALTH_CHECK_INTERVAL)
+                    except asyncio.TimeoutError:
+                        await connection.fetchval("SELECT 1")
+                logger.warning("Lost the LISTEN connection on %s, reconnecting", self.channel)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("LISTEN on %s failed: %s", self.channel, str(e))
+            finally:
+                if self.connected.is_set():
+                    self.connected.clear()
+                    for callback in self._disconnect_callbacks:
+                        callback()
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            first_connection = False
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+# One listener per worker process, started and stopped by the app lifespan.
+notification_listener = NotificationListener(LISTEN_DATABASE_URL)
@@ -0,0 +1,36 @@
+import logging
+from fastapi import HTTPException
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session, update
+from app.models.database import engine
+from app.models.user import User
+from app.utils.password_hashing import hash_password, password_hash_pool
+
+logger = logging.getLogger(__name__)
+
+
+def rehash_password(user_id: int, password: str, current_hash: str) -> None:
+    """Replaces a hash made with another cost by one made with BCRYPT_ROUNDS.
+
+    Runs as a background task after a successful login, so the login response doesn't wait for it.
+    - Skipped while the hashing pool is busy with logins: the next login will try again.
+    - The row is only updated if the hash is still `current_hash`, so a password changed
+      in the meantime is never overwritten.
+    """
+    if password_hash_pool.busy:
+        return
+    try:
+        new_hash = hash_password(password)
+    except HTTPException:
+        return
+    with Session(engine) as db:
+        try:
+            db.exec(
+                update(User)
+                .where(User.id == user_id, User.password == current_hash)
+                .values(password=new_hash)
+            )
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.warning("Password rehash failed for user %s: %s", user_id, str(e))
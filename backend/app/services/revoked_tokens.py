@@ -0,0 +1,225 @@
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Optional
+from sqlmodel import Session, delete, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.models.revoked_token import RevokedToken
+from app.utils.bloom import BloomFilter
+from app.utils.getenv import get_required_env
+
+# Above this many unexpired revoked tokens, a worker keeps only the Bloom filter:
+# tokens it rejects are confirmed in the database, tokens it passes are not revoked.
+REVOKED_TOKENS_MEMORY_LIMIT = int(get_required_env("REVOKED_TOKENS_MEMORY_LIMIT", "100000"))
+REVOKED_TOKENS_BLOOM_ERROR_RATE = float(get_required_env("REVOKED_TOKENS_BLOOM_ERROR_RATE", "0.01"))
+# Seconds between two reloads of the set from `revoked_tokens` (which also drop expired tokens).
+REVOKED_TOKENS_RELOAD_INTERVAL = int(get_required_env("REVOKED_TOKENS_RELOAD_INTERVAL_SECONDS", "300"))
+# Expired rows are deleted every REVOKED_TOKENS_PURGE_INTERVAL seconds, at most
+# REVOKED_TOKENS_PURGE_BATCH_SIZE per transaction so that locks stay short.
+REVOKED_TOKENS_PURGE_INTERVAL = int(get_required_env("REVOKED_TOKENS_PURGE_INTERVAL_SECONDS", "3600"))
+REVOKED_TOKENS_PURGE_BATCH_SIZE = int(get_required_env("REVOKED_TOKENS_PURGE_BATCH_SIZE", "1000"))
+
+
+def _timestamp(expires_at: datetime) -> float:
+    """`expires_at` as a Unix timestamp; naive values are UTC, as stored in `revoked_tokens`."""
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at.timestamp()
+
+
+class RevokedTokenSet:
+    """Per-worker copy of the unexpired `revoked_tokens` rows, so checking a token needs no query.
+
+    - `check` answers from memory, or returns None when the database must be asked:
+      before the first load, and for Bloom filter hits once the set outgrew `memory_limit`.
+    - Tokens revoked after a load are added by logout and by the `tokens_revoked` notification.
+    """
+
+    def __init__(self, memory_limit: int, error_rate: float = 0.01):
+        self.memory_limit = memory_limit
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._loaded = False
+        self._expires: Optional[dict[str, float]] = {}  # jti -> expiry; None once over memory_limit
+        self._bloom = BloomFilter(memory_limit, error_rate)
+        self._added_during_load: Optional[dict[str, float]] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def check(self, jti: str) -> Optional[bool]:
+        """True if `jti` is revoked, False if not, None if only the database can tell."""
+        with self._lock:
+            if not self._loaded:
+                return None
+            if self._expires is not None:
+                return jti in self._expires
+            return None if jti in self._bloom else False
+
+    def add(self, jti: str, expires_at: float) -> None:
+        with self._lock:
+            if self._added_during_load is not None:
+                self._added_during_load[jti] = expires_at
+            self._insert(jti, expires_at)
+
+    def load(self, fetch: Callable[[], Iterable[tuple[str, float]]]) -> int:
+        """Replaces the set with the (jti, expiry) pairs returned by `fetch`.
+
+        Tokens added while `fetch` runs are kept. Returns the number of tokens held.
+        """
+        with self._load_lock:
+            with self._lock:
+                self._added_during_load = {}
+            try:
+                entries = dict(fetch())
+            except BaseException:
+                with self._lock:
+                    self._added_during_load = None
+                raise
+            with self._lock:
+                # Merge and swap under one lock, so no `add` falls between them.
+                entries.update(self._added_during_load)
+                self._added_during_load = None
+                now = time.time()
+                entries = {jti: expiry for jti, expiry in entries.items() if expiry > now}
+                self._bloom = BloomFilter(max(self.memory_limit, 2 * len(entries)), self.error_rate)
+                self._expires = {}
+                for jti, expiry in entries.items():
+                    self._insert(jti, expiry)
+                self._loaded = True
+            return len(entries)
+
+    def reset(self) -> None:
+        """Forgets the loaded state: checks go to the database until the next load."""
+        with self._lock:
+            self._loaded = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": self._loaded,
+                "size": len(self._expires) if self._expires is not None else None,
+                "bloom_only": self._expires is None,
+            }
+
+    def _insert(self, jti: str, expires_at: float) -> None:
+        self._bloom.add(jti)
+        if self._expires is None:
+            return
+        self._expires[jti] = expires_at
+        if len(self._expires) > self.memory_limit:
+            self._expires = None
+
+
+class PurgeStats:
+    """Thread-safe counters of the expired token purges run by this worker since it started."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.total_purged = 0
+        self.last_purged: Optional[int] = None
+        self.last_run_at: Optional[datetime] = None
+        self.last_duration_seconds: Optional[float] = None
+
+    def record(self, purged: int, duration_seconds: float) -> None:
+        with self._lock:
+            self.runs += 1
+            self.total_purged += purged
+            self.last_purged = purged
+            self.last_run_at = datetime.now(timezone.utc)
+            self.last_duration_seconds = duration_seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "total_purged": self.total_purged,
+                "last_purged": self.last_purged,
+                "last_run_at": self.last_run_at,
+                "last_duration_seconds": self.last_duration_seconds,
+            }
+
+
+# One set per worker process, loaded by the app lifespan.
+revoked_tokens = RevokedTokenSet(REVOKED_TOKENS_MEMORY_LIMIT, REVOKED_TOKENS_BLOOM_ERROR_RATE)
+purge_stats = PurgeStats()
+
+
+def is_token_revoked(db: Session, jti: str) -> bool:
+    """Checks `jti` against the in-memory set, falling back to `revoked_tokens` when it can't tell."""
+    revoked = revoked_tokens.check(jti)
+    if revoked is None:
+        revoked = db.get(RevokedToken, jti) is not None
+    return revoked
+
+
+async def is_token_revoked_async(db: AsyncSession, jti: str) -> bool:
+    """Same as is_token_revoked, on the async session."""
+    revoked = revoked_tokens.check(jti)
+    if revoked is None:
+        revoked = await db.get(RevokedToken, jti) is not None
+    return revoked
+
+
+def remember_revoked(tokens: dict[str, float]) -> None:
+    """Adds tokens revoked by this worker (jti -> expiry timestamp) once their rows are committed."""
+    for jti, expires_at in tokens.items():
+        revoked_tokens.add(jti, expires_at)
+
+
+def on_tokens_revoked(event: dict) -> None:
+    """Handler for `tokens_revoked` notifications sent by any worker (app/services/notification_bus.py)."""
+    remember_revoked(event.get("tokens") or {})
+
+
+def purge_expired_revoked_tokens(db: Session, batch_size: int = REVOKED_TOKENS_PURGE_BATCH_SIZE) -> int:
+    """Deletes expired rows of `revoked_tokens`, `batch_size` per transaction, and returns how many were removed.
+
+    Rows locked by another worker's purge are skipped, so concurrent purges don't wait on each other.
+    """
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    purged = 0
+    while True:
+        batch = (
+            select(RevokedToken.jti)
+            .where(RevokedToken.expires_at <= now)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        result = db.exec(delete(RevokedToken).where(RevokedToken.jti.in_(batch.scalar_subquery())))
+        db.commit()
+        purged += result.rowcount
+        if result.rowcount < batch_size:
+            break
+    purge_stats.record(purged, time.perf_counter() - started)
+    return purged
+
+
+def get_revoked_token_table_stats(db: Session) -> dict:
+    """Row counts and on-disk size (table and indexes) of `revoked_tokens`."""
+    rows, expired_rows, total_bytes = db.exec(
+        select(
+            func.count(),
+            func.count().filter(RevokedToken.expires_at <= datetime.now(timezone.utc)),
+            func.pg_total_relation_size(RevokedToken.__tablename__),
+        ).select_from(RevokedToken)
+    ).one()
+    return {"rows": rows, "expired_rows": expired_rows, "total_bytes": total_bytes}
+
+
+def load_revoked_tokens(db: Session) -> int:
+    """(Re)loads this worker's set from the unexpired `revoked_tokens` rows."""
+
+    def fetch():
+        rows = db.exec(
+            select(RevokedToken.jti, RevokedToken.expires_at).where(
+                RevokedToken.expires_at > datetime.now(timezone.utc)
+            )
+        ).all()
+        return [(jti, _timestamp(expires_at)) for jti, expires_at in rows]
+
+    return revoked_tokens.load(fetch)
@@ -1,16 +1,30 @@
+import hashlib
 import logging
-from datetime import date
+from typing import Collection, Iterable, Optional
+from datetime import date, datetime, timedelta, timezone
 from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from sqlmodel import Session, select
+from sqlmodel import Session, delete, insert, select
 from app.models.product import Product
+from app.models.stock import Stock
 from app.models.stock_move import StockMove
+from app.models.stock_move_idempotency_key import StockMoveIdempotencyKey
 from app.models.stock_move_line import StockMoveLine
 from app.models.warehouse import Warehouse
-from app.schemas.stock_move import StockMoveCreate
+from app.schemas.stock_move import StockMoveBatchResult, StockMoveCreate
+from app.services.dashboard_cache import invalidate_stock
+from app.services.notification_bus import publish_movements_recorded, publish_stock_changed
+from app.utils.getenv import get_required_env
 
 logger = logging.getLogger(__name__)
 
+# How long an Idempotency-Key replays the movement it created.
+IDEMPOTENCY_KEY_TTL = timedelta(
+    hours=int(get_required_env("IDEMPOTENCY_KEY_TTL_HOURS", fallback="24"))
+)
+
 
 def _validate_movement_input(movement_data: StockMoveCreate) -> None:
     """Pure-Python validation of movement data before any DB interaction."""
@@ -38,88 +52,257 @@ def _validate_movement_input(movement_data: StockMoveCreate) -> None:
                 )
 
 
-def _validate_active_warehouses(db: Session, warehouse_ids: list[int]) -> None:
-    """Checks all warehouse IDs exist and are active. Raises 400 if any are not."""
-    active_warehouses = db.exec(
-        select(Warehouse.id).where(
-            Warehouse.id.in_(warehouse_ids), Warehouse.is_active == True
-        )
-    ).all()
+def _active_warehouse_ids(db: Session, warehouse_ids: Iterable[int]) -> set[int]:
+    """Returns the subset of warehouse IDs that exist and are active."""
+    return set(
+        db.exec(
+            select(Warehouse.id).where(
+                Warehouse.id.in_(set(warehouse_ids)), Warehouse.is_active == True
+            )
+        ).all()
+    )
+
 
-    missing = set(warehouse_ids) - set(active_warehouses)
+def _active_product_categories(db: Session, product_ids: Iterable[int]) -> dict[int, int]:
+    """Maps the product IDs that exist and are active to their category ID."""
+    return dict(
+        db.exec(
+            select(Product.id, Product.category_id).where(
+                Product.id.in_(set(product_ids)), Product.is_active == True
+            )
+        ).all()
+    )
+
+
+def _check_active_references(
+    movement_data: StockMoveCreate,
+    active_warehouses: set[int],
+    active_products: Collection[int],
+) -> None:
+    """Checks the movement only references active warehouses and products. Raises 400 if not."""
+    missing = {line.warehouse_id for line in movement_data.lines} - active_warehouses
     if missing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"The following warehouses are inactive or do not exist: {missing}",
         )
 
+    missing_products = {
+        line.product_id for line in movement_data.lines if line.product_id not in active_products
+    }
+    if missing_products:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"The following products are inactive or do not exist: {missing_products}",
+        )
+
+
+def _insert_movement(
+    db: Session, movement_data: StockMoveCreate, user_id: int
+) -> tuple[StockMove, list[StockMoveLine]]:
+    """Writes a movement and its lines (without committing) and returns them as detached models.
 
-def _validate_active_products(db: Session, product_ids: list[int]) -> None:
-    """Checks all product IDs exist and are active. Raises 400 if any are not."""
-    active_products = db.exec(
-        select(Product.id).where(
-            Product.id.in_(product_ids), Product.is_active == True
+    Core INSERT ... RETURNING statements are used: the generated values come back
+    with the insert itself, so nothing has to be refreshed after the commit.
+    """
+    movement_row = db.exec(
+        insert(StockMove)
+        .values(
+            move_type=movement_data.move_type,
+            user_id=user_id,
+            created_at=datetime.now(timezone.utc),
+        )
+        .returning(*StockMove.__table__.c)
+    ).one()
+
+    # All lines in a single multi-row INSERT (the stock trigger fires once for all of them).
+    line_rows = db.exec(
+        insert(StockMoveLine)
+        .values(
+            [
+                {
+                    "move_id": movement_row.id,
+                    "line_id": i,
+                    "warehouse_id": line_data.warehouse_id,
+                    "product_id": line_data.product_id,
+                    "lot": line_data.lot or "NO_LOT",
+                    "expiration_date": line_data.expiration_date,
+                    "quantity": line_data.quantity,
+                }
+                for i, line_data in enumerate(movement_data.lines, 1)
+            ]
         )
+        .returning(*StockMoveLine.__table__.c)
     ).all()
 
-    missing_products = set(product_ids) - set(active_products)
-    if missing_products:
+    return StockMove(**movement_row._mapping), [
+        StockMoveLine(**row._mapping)
+        for row in sorted(line_rows, key=lambda row: row.line_id)
+    ]
+
+
+def _line_keys(movement_data: StockMoveCreate) -> set[tuple[int, int, str]]:
+    return {
+        (line.warehouse_id, line.product_id, line.lot or "NO_LOT")
+        for line in movement_data.lines
+    }
+
+
+def _stock_levels(
+    db: Session, keys: set[tuple[int, int, str]]
+) -> list[tuple[int, int, str, int]]:
+    """Current quantity of each (warehouse, product, lot), 0 for rows that don't exist.
+
+    Called after the lines are inserted: the stock trigger has already updated (and
+    locked) these rows, so the values are the ones other sessions will see on commit.
+    """
+    quantities = {
+        (row.warehouse_id, row.product_id, row.lot): row.quantity
+        for row in db.exec(
+            select(Stock.warehouse_id, Stock.product_id, Stock.lot, Stock.quantity).where(
+                tuple_(Stock.warehouse_id, Stock.product_id, Stock.lot).in_(keys)
+            )
+        ).all()
+    }
+    return [(*key, quantities.get(key, 0)) for key in sorted(keys)]
+
+
+def hash_movement_request(movement_data: StockMoveCreate) -> str:
+    """Fingerprint of a movement request, used to detect a key reused for another body."""
+    return hashlib.sha256(movement_data.model_dump_json().encode()).hexdigest()
+
+
+def find_idempotent_movement(
+    db: Session, user_id: int, idempotency_key: str, request_hash: str
+) -> Optional[tuple[StockMove, list[StockMoveLine]]]:
+    """
+    Returns the movement already created with this user's Idempotency-Key, if any.
+
+    Only a primary key lookup and the movement lines are read: validation,
+    inserts and the stock trigger are not run again for a retried request.
+
+    Raises:
+        HTTPException: 422 if the key was used with a different request body.
+    """
+    try:
+        row = db.exec(
+            select(StockMoveIdempotencyKey, StockMove)
+            .join(StockMove, StockMoveIdempotencyKey.move_id == StockMove.id)
+            .where(
+                StockMoveIdempotencyKey.user_id == user_id,
+                StockMoveIdempotencyKey.key == idempotency_key,
+                StockMoveIdempotencyKey.expires_at > datetime.now(timezone.utc),
+            )
+        ).first()
+        if row is None:
+            return None
+
+        stored_key, movement = row
+        lines = db.exec(
+            select(StockMoveLine)
+            .where(StockMoveLine.move_id == movement.id)
+            .order_by(StockMoveLine.line_id)
+        ).all()
+    except SQLAlchemyError:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"The following products are inactive or do not exist: {missing_products}",
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database internal server error",
+        )
+
+    if stored_key.request_hash != request_hash:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail="This Idempotency-Key was already used with a different request.",
         )
+    return movement, list(lines)
+
+
+def _claim_idempotency_key(
+    db: Session, user_id: int, idempotency_key: str, request_hash: str, move_id: int
+) -> bool:
+    """Stores the key in the movement's transaction. Returns False if a live key already exists.
+
+    An expired key that has not been purged yet is taken over. When two requests
+    with the same key race, the second INSERT waits for the first transaction and
+    then finds its (live) key.
+    """
+    now = datetime.now(timezone.utc)
+    statement = pg_insert(StockMoveIdempotencyKey).values(
+        user_id=user_id,
+        key=idempotency_key,
+        request_hash=request_hash,
+        move_id=move_id,
+        expires_at=now + IDEMPOTENCY_KEY_TTL,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=["user_id", "key"],
+        set_={
+            "request_hash": statement.excluded.request_hash,
+            "move_id": statement.excluded.move_id,
+            "expires_at": statement.excluded.expires_at,
+        },
+        where=StockMoveIdempotencyKey.expires_at <= now,
+    ).returning(StockMoveIdempotencyKey.key)
+    return db.exec(statement).first() is not None
+
+
+def purge_expired_idempotency_keys(db: Session) -> int:
+    """Deletes expired Idempotency-Keys and returns how many were removed."""
+    result = db.exec(
+        delete(StockMoveIdempotencyKey).where(
+            StockMoveIdempotencyKey.expires_at <= datetime.now(timezone.utc)
+        )
+    )
+    db.commit()
+    return result.rowcount
 
 
 def create_stock_movement(
     movement_data: StockMoveCreate,
     user_id: int,
     db: Session,
+    idempotency_key: Optional[str] = None,
+    request_hash: Optional[str] = None,
 ) -> tuple[StockMove, list[StockMoveLine]]:
     """
     Creates a StockMove and its StockMoveLines in a single transaction.
 
     Validates input and entity constraints before persisting. Returns the
-    committed and refreshed movement and lines, ready for serialization.
+    committed movement and lines, ready for serialization.
+    When `idempotency_key` is given, it is stored in the same transaction.
 
     Raises:
-        HTTPException: on business rule violations or DB errors.
+        HTTPException: on business rule violations or DB errors, and 409 if
+        another request with the same Idempotency-Key committed first.
     """
     _validate_movement_input(movement_data)
 
     warehouse_ids = [line.warehouse_id for line in movement_data.lines]
     product_ids = [line.product_id for line in movement_data.lines]
 
-    new_movement = StockMove(
-        move_type=movement_data.move_type,
-        user_id=user_id,
-    )
-
     try:
         # Read-only validation queries first — no writes until both pass.
-        _validate_active_warehouses(db, warehouse_ids)
-        _validate_active_products(db, product_ids)
-
-        db.add(new_movement)
-        db.flush()  # Obtain new_movement.move_id for the FK in lines.
-
-        created_lines: list[StockMoveLine] = []
-        for i, line_data in enumerate(movement_data.lines, 1):
-            new_line = StockMoveLine(
-                move_id=new_movement.id,
-                line_id=i,
-                warehouse_id=line_data.warehouse_id,
-                product_id=line_data.product_id,
-                lot=line_data.lot or "NO_LOT",
-                expiration_date=line_data.expiration_date,
-                quantity=line_data.quantity,
-            )
-            db.add(new_line)
-            created_lines.append(new_line)
+        product_categories = _active_product_categories(db, product_ids)
+        _check_active_references(
+            movement_data, _active_warehouse_ids(db, warehouse_ids), product_categories
+        )
 
+        new_movement, created_lines = _insert_movement(db, movement_data, user_id)
+        if idempotency_key and not _claim_idempotency_key(
+            db, user_id, idempotency_key, request_hash, new_movement.id
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key has already been processed. Retry to get its result.",
+            )
+        category_ids = [product_categories[product_id] for product_id in product_ids]
+        stock_levels = _stock_levels(db, _line_keys(movement_data))
+        # Delivered to every worker when the movement commits.
+        publish_stock_changed(db, warehouse_ids, category_ids)
+        publish_movements_recorded(
+            db, [new_movement.move_type], stock_levels, move_id=new_movement.id
+        )
         db.commit()
-        db.refresh(new_movement)
-        for line in created_lines:
-            db.refresh(line)
 
     except IntegrityError:
         db.rollback()
@@ -137,4 +320,119 @@ def create_stock_movement(
             detail="Database internal server error",
         )
 
+    invalidate_stock(warehouse_ids, category_ids)
     return new_movement, created_lines
+
+
+def _database_error_detail(exc: SQLAlchemyError) -> str:
+    """Client-facing message for a movement rejected by the database.
+
+    Business rules enforced by the stock trigger (RAISE EXCEPTION, SQLSTATE P0001)
+    are passed through, e.g. "Insufficient stock for product ...".
+    """
+    if isinstance(exc, IntegrityError):
+        return "Integrity error: duplicate or invalid reference."
+    orig = getattr(exc, "orig", None)
+    if getattr(orig, "pgcode", None) == "P0001":
+        return orig.diag.message_primary
+    return "Database internal server error"
+
+
+def create_stock_movements_batch(
+    movements: list[tuple[int, StockMoveCreate]],
+    user_id: int,
+    db: Session,
+    chunk_size: int,
+) -> list[StockMoveBatchResult]:
+    """
+    Creates many movements, committing them in chunks of `chunk_size`.
+
+    `movements` pairs each payload with its position in the request, which is
+    echoed back in its result. Movements are independent: each one is written
+    inside a SAVEPOINT, so a movement that fails validation or is rejected by
+    the database (e.g. insufficient stock) is reported as an error without
+    affecting the rest. Warehouse and product activity is checked once for the
+    union of IDs in the batch instead of once per movement.
+
+    Raises:
+        HTTPException: if the batch-wide validation queries fail.
+    """
+    try:
+        active_warehouses = _active_warehouse_ids(
+            db, (line.warehouse_id for _, m in movements for line in m.lines)
+        )
+        active_products = _active_product_categories(
+            db, (line.product_id for _, m in movements for line in m.lines)
+        )
+    except SQLAlchemyError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database internal server error",
+        )
+
+    results: list[StockMoveBatchResult] = []
+    for start in range(0, len(movements), chunk_size):
+        chunk_results: list[StockMoveBatchResult] = []
+        touched_warehouses: set[int] = set()
+        touched_categories: set[int] = set()
+        touched_keys: set[tuple[int, int, str]] = set()
+        move_types: set[str] = set()
+
+        for index, movement_data in movements[start : start + chunk_size]:
+            try:
+                _validate_movement_input(movement_data)
+                _check_active_references(movement_data, active_warehouses, active_products)
+                with db.begin_nested():
+                    new_movement, _ = _insert_movement(db, movement_data, user_id)
+            except HTTPException as e:
+                chunk_results.append(
+                    StockMoveBatchResult(index=index, status="error", detail=e.detail)
+                )
+                continue
+            except SQLAlchemyError as e:
+                chunk_results.append(
+                    StockMoveBatchResult(
+                        index=index, status="error", detail=_database_error_detail(e)
+                    )
+                )
+                continue
+
+            chunk_results.append(
+                StockMoveBatchResult(index=index, status="created", id=new_movement.id)
+            )
+            for line in movement_data.lines:
+                touched_warehouses.add(line.warehouse_id)
+                touched_categories.add(active_products[line.product_id])
+            touched_keys |= _line_keys(movement_data)
+            move_types.add(movement_data.move_type)
+
+        try:
+            if touched_warehouses:
+                stock_levels = _stock_levels(db, touched_keys)
+                publish_stock_changed(db, touched_warehouses, touched_categories)
+                publish_movements_recorded(
+                    db,
+                    move_types,
+                    stock_levels,
+                    count=sum(1 for result in chunk_results if result.status == "created"),
+                )
+            db.commit()
+            invalidate_stock(touched_warehouses, touched_categories)
+        except SQLAlchemyError:
+            db.rollback()
+            logger.exception("Stock movement batch chunk could not be committed")
+            chunk_results = [
+                result
+                if result.status == "error"
+                else StockMoveBatchResult(
+                    index=result.index,
+                    status="error",
+                    detail="Database internal server error",
+                )
+                for result in chunk_results
+            ]
+
+        results.extend(chunk_results)
+
+    return results
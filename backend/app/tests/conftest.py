@@ -23,7 +23,7 @@ In this project:
 - `session` fixture resets the database before each test.
 - `client` fixture provides a FastAPI TestClient using that session.
 - `active_user`, `get_admin_headers`, etc., all depend on `session`, so they inherit a clean DB.
-- `create_test_database` runs once per session to initialize tables.
+- `create_test_database` runs once per session to initialize tables and the rollup triggers.
 
 This structure ensures:
 - Full test isolation
@@ -31,14 +31,22 @@ This structure ensures:
 - Stable and repeatable test runs
 """
 
-from app.tests.utils import create_user_in_db
+from app.tests.utils import ROLLUP_TRIGGER_SQL, create_user_in_db, load_migration_sql
 from app.models.stock import Stock
+from app.models.stock_daily_snapshot import StockDailySnapshot
 import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
 from sqlmodel import SQLModel, create_engine, Session, delete
-from app.models.database import get_db
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.models.database import get_async_db, get_db, get_read_db
+from app.services.auth_cache import token_cache
+from app.services.dashboard_cache import caches
 from app.models.user import User
 from app.models.revoked_token import RevokedToken
 from app.models.stock_move import StockMove
+from app.models.stock_move_daily_rollup import StockMoveDailyRollup
+from app.models.stock_move_idempotency_key import StockMoveIdempotencyKey
 from app.models.stock_move_line import StockMoveLine
 from app.models.warehouse import Warehouse
 from app.models.product import Product
@@ -51,14 +59,25 @@ TEST_DATABASE_URL = "postgresql://test_user:test_pass@db_test:5432/test_db"
 # Create the test engine (SQLModel)
 engine = create_engine(TEST_DATABASE_URL, echo=True)
 
+# Async engine for the `async def` routes. NullPool: asyncpg connections are tied to the
+# event loop that opened them, and every TestClient runs the app in a new loop.
+async_engine = create_async_engine(
+    TEST_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://"), poolclass=NullPool
+)
+
 
 # Create tables once before running any tests
 @pytest.fixture(scope="session", autouse=True)
 def create_test_database():
     """
     This fixture runs once per test session to create tables if they don't exist.
+    The stock_move_daily_rollup triggers are installed from db_init when it is available;
+    the stock trigger is not (see test_stock_trigger.py).
     """
     SQLModel.metadata.create_all(engine)
+    if ROLLUP_TRIGGER_SQL.exists():
+        with engine.begin() as connection:
+            connection.exec_driver_sql(load_migration_sql(ROLLUP_TRIGGER_SQL))
 
 
 # Create a fresh, clean session for each test
@@ -70,9 +89,12 @@ def session():
     """
     with Session(engine) as session:
         # Clean tables before each test in correct FK order
+        session.exec(delete(StockMoveIdempotencyKey))
         session.exec(delete(StockMoveLine))
         session.exec(delete(StockMove))
+        session.exec(delete(StockMoveDailyRollup))
         session.exec(delete(Stock))
+        session.exec(delete(StockDailySnapshot))
         session.exec(delete(Product))
         session.exec(delete(User))
         session.exec(delete(Warehouse))
@@ -93,7 +115,14 @@ def client(session):
     def override_get_db():
         yield session
 
+    async def override_get_async_db():
+        # Async routes get their own connection: they only see data the test has committed.
+        async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+            yield async_session
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_read_db] = override_get_async_db
 
     from fastapi.testclient import TestClient
 
@@ -101,6 +130,10 @@ def client(session):
         yield client
 
     app.dependency_overrides.clear()
+    # Cached aggregates must not leak into the next test's data.
+    for cache in caches.values():
+        cache.clear()
+    token_cache.clear()
 
 
 @pytest.fixture()
@@ -10,9 +10,23 @@ TESTED ENDPOINTS:
 [x] POST   /auth/logout
 """
 
+import os
+
+import bcrypt
 import jwt
 
 import pytest
+from fastapi import HTTPException
+from app.services.auth_cache import token_cache
+from app.services.notification_bus import USER_CHANGED, notification_listener
+from app.utils.password_hashing import (
+    BCRYPT_ROUNDS,
+    PasswordHashPool,
+    hash_password,
+    needs_rehash,
+    password_hash_pool,
+    verify_password,
+)
 from app.tests.utils import (
     create_user_in_db,
     get_auth_headers,
@@ -164,6 +178,76 @@ def test_login_inactive_user(client, session):
     assert "inactive" in response.json()["detail"].lower()
 
 
+def test_login_returns_503_when_password_hashing_is_saturated(client, active_user, monkeypatch):
+    """Ensure logins beyond the bcrypt queue limit are turned away with Retry-After"""
+    monkeypatch.setattr(password_hash_pool, "max_pending", 0)
+
+    response = client.post(
+        "/auth/login", data={"username": active_user.email, "password": "testpass123"}
+    )
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(password_hash_pool.retry_after)
+
+
+def test_password_hash_uses_configured_cost():
+    hashed = hash_password("secret123")
+
+    assert hashed.startswith(f"$2b${BCRYPT_ROUNDS:02d}$")
+    assert verify_password("secret123", hashed)
+    assert not verify_password("other", hashed)
+
+
+def test_password_hash_pool_recovers_from_a_dead_process():
+    """Ensure a killed pool process yields a 503 and the next call gets a new pool"""
+    pool = PasswordHashPool(workers=1, max_pending=4)
+    try:
+        assert pool.run(int, "1") == 1
+        broken = pool._executor
+
+        with pytest.raises(HTTPException) as exc_info:
+            pool.run(os._exit, 1)
+        assert exc_info.value.status_code == 503
+
+        assert pool.run(int, "7") == 7
+        assert pool._executor is not broken
+    finally:
+        pool.shutdown()
+
+
+def test_login_rehashes_password_with_outdated_cost(client, session):
+    """Ensure a hash made with another cost is replaced after login, and the password still works"""
+    user = create_user_in_db(session, "Old Hash", "oldhash@example.com", "testpass123")
+    old_hash = bcrypt.hashpw(b"testpass123", bcrypt.gensalt(4)).decode()
+    user.password = old_hash
+    session.commit()
+    assert needs_rehash(old_hash)
+
+    response = client.post(
+        "/auth/login", data={"username": user.email, "password": "testpass123"}
+    )
+    assert response.status_code == 200
+
+    session.refresh(user)
+    assert user.password != old_hash
+    assert not needs_rehash(user.password)
+    assert verify_password("testpass123", user.password)
+    assert get_token_for_user(client, user.email, "testpass123")
+
+
+def test_login_keeps_hash_with_current_cost(client, session, active_user):
+    """Ensure a hash already made with BCRYPT_ROUNDS is left alone"""
+    current_hash = active_user.password
+
+    response = client.post(
+        "/auth/login", data={"username": active_user.email, "password": "testpass123"}
+    )
+    assert response.status_code == 200
+
+    session.refresh(active_user)
+    assert active_user.password == current_hash
+
+
 def test_login_missing_fields(client):
     response = client.post("/auth/login", data={})
     assert response.status_code == 422
@@ -307,10 +391,36 @@ def test_refresh_token_inactive_user(client, session):
     assert "inactive" in response.json()["detail"].lower()
 
 
+def test_verified_token_is_served_from_auth_cache(client, active_user):
+    """Ensure repeated requests with the same token skip the database checks"""
+    token = get_token_for_user(client, active_user.email, "testpass123")
+    headers = get_auth_headers(token)
+    client.get("/auth/profile", headers=headers)
+    hits = token_cache.stats()["hits"]
+
+    response = client.get("/auth/profile", headers=headers)
+
+    assert response.status_code == 200
+    assert response.json()["email"] == active_user.email
+    assert token_cache.stats()["hits"] == hits + 1
+
+
+def test_user_changed_notification_drops_cached_tokens(client, active_user):
+    """Ensure a user change announced by another worker drops this worker's cached tokens"""
+    token = get_token_for_user(client, active_user.email, "testpass123")
+    client.get("/auth/profile", headers=get_auth_headers(token))
+    assert token_cache.get(token) is not None
+
+    notification_listener.dispatch({"type": USER_CHANGED, "user_ids": [active_user.id]})
+
+    assert token_cache.get(token) is None
+
+
 # POST   /auth/verify-password
 def test_verify_password_success(client, active_user):
     token = get_token_for_user(client, active_user.email, "testpass123")
     headers = get_auth_headers(token)
+    client.get("/auth/profile", headers=headers)  # the next request hits the auth cache
 
     response = client.post(
         "/auth/verify-password",
@@ -0,0 +1,75 @@
+"""
+This test module checks the in-process TTL cache (app/utils/cache.py) used for the
+dashboard aggregates: expiry, size bound, tag invalidation and hit/miss counters.
+"""
+
+import time
+
+from app.utils.cache import TTLCache
+
+
+def test_entries_expire_after_ttl():
+    cache = TTLCache(ttl=0.05)
+    cache.set("key", 1)
+    assert cache.get("key") == 1
+
+    time.sleep(0.06)
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_entry_ttl_can_be_shortened_but_not_lengthened():
+    cache = TTLCache(ttl=0.05)
+    cache.set("short", 1, ttl=0.01)
+    cache.set("long", 2, ttl=60)
+
+    time.sleep(0.02)
+    assert (cache.get("short"), cache.get("long")) == (None, 2)
+    time.sleep(0.04)
+    assert cache.get("long") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(ttl=60, maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_drops_only_tagged_entries():
+    cache = TTLCache(ttl=60)
+    cache.set("warehouse-1", 1, tags=[("warehouse", 1), "stock"])
+    cache.set("warehouse-2", 2, tags=[("warehouse", 2)])
+    cache.set("all", 3, tags=["stock"])
+
+    assert cache.invalidate([("warehouse", 1)]) == 1
+    assert cache.get("warehouse-1") is None
+    assert (cache.get("warehouse-2"), cache.get("all")) == (2, 3)
+
+    assert cache.invalidate(["stock"]) == 1
+    assert cache.get("all") is None
+
+
+def test_value_read_before_an_invalidation_is_not_stored():
+    cache = TTLCache(ttl=60)
+    generation = cache.generation()
+    cache.invalidate(["stock"])  # a write commits while the value is being computed
+
+    cache.set("all", "stale", tags=["stock"], generation=generation)
+    assert cache.get("all") is None
+
+
+def test_hits_and_misses_are_counted():
+    cache = TTLCache(ttl=60)
+    cache.get("key")
+    cache.set("key", 1)
+    cache.get("key")
+    cache.get("key")
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (2, 1, 1)
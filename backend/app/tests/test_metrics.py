@@ -0,0 +1,97 @@
+"""
+This test module covers the /metrics router and the pool checkout wait metric.
+
+TESTED ENDPOINTS:
+[x] GET    /metrics/db-pool
+[x] GET    /metrics/cache
+[x] GET    /metrics/revoked-tokens
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlmodel import create_engine
+
+from app.models.database import TimedQueuePool
+from app.models.revoked_token import RevokedToken
+from app.tests.conftest import TEST_DATABASE_URL
+from app.tests.utils import create_user_in_db, get_admin_headers, get_auth_headers, get_token_for_user
+from app.utils.metrics import pool_checkout_wait
+
+
+def test_admin_can_view_db_pool_metrics(client, session):
+    """Ensure admin gets the state of both engine pools"""
+    headers, _ = get_admin_headers(client, session)
+
+    response = client.get("/metrics/db-pool", headers=headers)
+
+    assert response.status_code == 200, response.json()
+    data = response.json()
+    assert [pool["engine"] for pool in data] == ["sync", "async"]
+    for pool in data:
+        assert pool["pool_size"] >= 1
+        assert pool["timeouts"] >= 0
+        assert pool["wait_max_ms"] >= pool["wait_avg_ms"] >= 0
+
+
+def test_user_cannot_view_db_pool_metrics(client, session):
+    """Ensure regular users cannot read the pool metrics"""
+    create_user_in_db(session, "User", "user@example.com", "pass1234", role="user")
+    headers = get_auth_headers(get_token_for_user(client, "user@example.com", "pass1234"))
+
+    response = client.get("/metrics/db-pool", headers=headers)
+    assert response.status_code == 403
+
+
+def test_admin_can_view_cache_metrics(client, session):
+    """Ensure admin gets the counters of the dashboard and auth caches"""
+    headers, _ = get_admin_headers(client, session)
+    client.get("/stock/product-categories", headers=headers)
+    client.get("/stock/product-categories", headers=headers)
+
+    response = client.get("/metrics/cache", headers=headers)
+
+    assert response.status_code == 200, response.json()
+    data = {cache["cache"]: cache for cache in response.json()}
+    assert set(data) == {"semaphore", "dashboard", "auth"}
+    assert data["dashboard"]["size"] == 1
+    assert data["dashboard"]["hits"] >= 1
+    assert 0 < data["dashboard"]["hit_ratio"] <= 1
+
+
+def test_admin_can_view_revoked_token_metrics(client, session):
+    """Ensure admin gets the size of revoked_tokens, including rows waiting for the purge"""
+    headers, _ = get_admin_headers(client, session)
+    session.add(RevokedToken(jti="expired", expires_at=datetime.now(timezone.utc) - timedelta(minutes=1)))
+    session.commit()
+
+    response = client.get("/metrics/revoked-tokens", headers=headers)
+
+    assert response.status_code == 200, response.json()
+    data = response.json()
+    assert (data["rows"], data["expired_rows"]) == (1, 1)
+    assert data["total_bytes"] > 0
+    assert data["purge_runs"] >= 0
+
+
+def test_pool_records_checkout_waits_and_timeouts():
+    """Ensure checkouts are timed and a pool timeout is counted"""
+
+    class TestPool(TimedQueuePool):
+        metric_name = "test"
+
+    engine = create_engine(
+        TEST_DATABASE_URL, poolclass=TestPool, pool_size=1, max_overflow=0, pool_timeout=0.2
+    )
+    try:
+        with engine.connect():
+            with pytest.raises(PoolTimeoutError):
+                engine.connect()
+    finally:
+        engine.dispose()
+
+    stats = pool_checkout_wait.snapshot("test")
+    assert stats["count"] == 2
+    assert stats["timeouts"] == 1
+    assert stats["max_seconds"] >= 0.2
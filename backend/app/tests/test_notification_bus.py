@@ -0,0 +1,139 @@
+"""
+This test module checks the LISTEN/NOTIFY bus (app/services/notification_bus.py):
+events are delivered to every listener on commit only, and a `stock_changed`
+event from another worker invalidates this worker's dashboard caches.
+"""
+
+import asyncio
+
+import pytest
+import pytest_asyncio
+from sqlmodel import Session
+
+from app.services.dashboard_cache import dashboard_cache, on_stock_changed
+from app.services.notification_bus import (
+    MOVEMENTS_RECORDED,
+    STOCK_CHANGED,
+    NotificationListener,
+    publish,
+    publish_movements_recorded,
+    publish_stock_changed,
+)
+from app.models.stock import Stock
+from app.tests.conftest import TEST_DATABASE_URL, engine
+from app.tests.utils import get_admin_headers
+
+
+@pytest_asyncio.fixture()
+async def listener():
+    """A listener on the test database, as another worker would run it."""
+    listener = NotificationListener(TEST_DATABASE_URL)
+    listener.start()
+    await asyncio.wait_for(listener.connected.wait(), 5)
+    yield listener
+    await listener.stop()
+
+
+def _collect(listener, event_type):
+    received = asyncio.Queue()
+    listener.subscribe(event_type, received.put_nowait)
+    return received
+
+
+@pytest.mark.asyncio
+async def test_events_are_delivered_on_commit_only(listener):
+    """Ensure a rolled back transaction sends nothing"""
+    received = _collect(listener, "test_event")
+
+    with Session(engine) as db:
+        publish(db, "test_event", n=1)
+        db.rollback()
+        publish(db, "test_event", n=2)
+        db.commit()
+
+    event = await asyncio.wait_for(received.get(), 5)
+    assert event == {"type": "test_event", "n": 2}
+    assert received.empty()
+
+
+@pytest.mark.asyncio
+async def test_movement_notifies_all_workers(client, session, base_data, listener):
+    """Ensure creating a movement announces its warehouses, categories, ID and new stock to all workers"""
+    received = _collect(listener, STOCK_CHANGED)
+    recorded = _collect(listener, MOVEMENTS_RECORDED)
+    headers, _ = get_admin_headers(client, session)
+    # The test schema has no stock trigger: this row stands for the quantity it would leave.
+    session.add(Stock(warehouse_id=base_data.warehouse.id, product_id=base_data.product.id, quantity=9))
+    session.commit()
+    payload = {
+        "move_type": "incoming",
+        "lines": [{"warehouse_id": base_data.warehouse.id, "product_id": base_data.product.id, "quantity": 2}],
+    }
+
+    response = client.post("/stock-movements/", json=payload, headers=headers)
+    assert response.status_code == 201
+
+    event = await asyncio.wait_for(received.get(), 5)
+    assert event == {
+        "type": STOCK_CHANGED,
+        "warehouse_ids": [base_data.warehouse.id],
+        "category_ids": [base_data.category.id],
+    }
+    event = await asyncio.wait_for(recorded.get(), 5)
+    assert event == {
+        "type": MOVEMENTS_RECORDED,
+        "move_id": response.json()["id"],
+        "count": 1,
+        "move_types": ["incoming"],
+        "warehouse_ids": [base_data.warehouse.id],
+        "product_ids": [base_data.product.id],
+        "stock": [[base_data.warehouse.id, base_data.product.id, "NO_LOT", 9]],
+    }
+
+
+@pytest.mark.asyncio
+async def test_stock_changed_from_another_worker_invalidates_caches(listener):
+    """Ensure the cache handler drops the entries of the announced warehouse only"""
+    listener.subscribe(STOCK_CHANGED, on_stock_changed)
+    received = _collect(listener, STOCK_CHANGED)
+    dashboard_cache.set(("warehouse_detail", 1), [], tags=[("warehouse", 1)])
+    dashboard_cache.set(("warehouse_detail", 2), [], tags=[("warehouse", 2)])
+    try:
+        with Session(engine) as db:
+            publish_stock_changed(db, [1], [])
+            db.commit()
+        await asyncio.wait_for(received.get(), 5)
+
+        assert dashboard_cache.get(("warehouse_detail", 1)) is None
+        assert dashboard_cache.get(("warehouse_detail", 2)) == []
+    finally:
+        dashboard_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_oversized_stock_changed_invalidates_everything(listener):
+    """Ensure IDs that don't fit in a NOTIFY payload are replaced by a full invalidation"""
+    received = _collect(listener, STOCK_CHANGED)
+
+    with Session(engine) as db:
+        publish_stock_changed(db, range(5000), [1])
+        db.commit()
+
+    event = await asyncio.wait_for(received.get(), 5)
+    assert event["warehouse_ids"] is None and event["category_ids"] is None
+
+
+@pytest.mark.asyncio
+async def test_oversized_movements_recorded_drops_stock_levels(listener):
+    """Ensure too many stock rows are replaced by null, keeping the IDs for filtering"""
+    received = _collect(listener, MOVEMENTS_RECORDED)
+    levels = [(1, product_id, f"LOT-{product_id}", 5) for product_id in range(400)]
+
+    with Session(engine) as db:
+        publish_movements_recorded(db, ["incoming"], levels, count=400)
+        db.commit()
+
+    event = await asyncio.wait_for(received.get(), 5)
+    assert event["stock"] is None
+    assert event["warehouse_ids"] == [1]
+    assert len(event["product_ids"]) == 400
@@ -0,0 +1,74 @@
+"""
+This test module checks the slow-query log (app/utils/query_log.py): statements over
+the threshold are logged as JSON with their duration, row count and route.
+"""
+
+import json
+import logging
+
+import pytest
+from sqlalchemy.engine import Engine
+
+from app.tests.utils import get_admin_headers
+from app.utils.query_log import SlowQueryLog, current_route
+
+
+class _Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.entries = []
+
+    def emit(self, record):
+        self.entries.append(json.loads(record.getMessage().removeprefix("slow query ")))
+
+
+@pytest.fixture()
+def slow_queries():
+    """Logs every statement (threshold 0 ms) of all engines and collects the entries."""
+    handler = _Records()
+    logger = logging.getLogger("app.slow_query")
+    logger.addHandler(handler)
+    query_log = SlowQueryLog(threshold_ms=0)
+    query_log.attach(Engine)
+    try:
+        yield handler.entries
+    finally:
+        query_log.detach(Engine)
+        logger.removeHandler(handler)
+
+
+def test_slow_queries_are_logged_with_route_and_rows(client, session, slow_queries):
+    """Ensure sync and async routes report their route template"""
+    headers, _ = get_admin_headers(client, session)
+    slow_queries.clear()
+
+    client.get("/warehouses/", headers=headers)
+    client.get("/stock/warehouse/123", headers=headers)
+
+    routes = {entry["route"] for entry in slow_queries}
+    assert "GET /warehouses/" in routes
+    assert "GET /stock/warehouse/{warehouse_id}" in routes
+
+    entry = next(e for e in slow_queries if "FROM warehouse" in e["statement"])
+    assert entry["duration_ms"] >= 0
+    assert entry["rows"] >= 0
+    assert entry["executemany"] is False
+
+
+def test_fast_queries_are_not_logged(client, session):
+    """Ensure statements under the threshold are skipped"""
+    handler = _Records()
+    logging.getLogger("app.slow_query").addHandler(handler)
+    query_log = SlowQueryLog(threshold_ms=60_000)
+    query_log.attach(Engine)
+    try:
+        get_admin_headers(client, session)
+    finally:
+        query_log.detach(Engine)
+        logging.getLogger("app.slow_query").removeHandler(handler)
+
+    assert handler.entries == []
+
+
+def test_queries_outside_requests_have_no_route():
+    assert current_route() is None
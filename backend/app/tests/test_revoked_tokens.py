@@ -0,0 +1,176 @@
+"""
+This test module checks the per-worker revoked token set (app/services/revoked_tokens.py)
+and its Bloom filter (app/utils/bloom.py): tokens revoked by logout or announced by
+another worker are rejected from memory, the set falls back to the database
+when it can't tell or the LISTEN connection is down, and expired rows are purged
+in batches.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import jwt
+from sqlalchemy import text
+from sqlmodel import select
+
+from app.models.revoked_token import RevokedToken
+from app.services import notification_bus
+from app.services.notification_bus import TOKENS_REVOKED, notification_listener
+from app.services.revoked_tokens import (
+    RevokedTokenSet,
+    load_revoked_tokens,
+    purge_expired_revoked_tokens,
+    purge_stats,
+    revoked_tokens,
+)
+from app.tests.conftest import engine
+from app.tests.utils import create_user_in_db, get_auth_headers, get_token_for_user
+from app.utils.bloom import BloomFilter
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    bloom = BloomFilter(capacity=5000, error_rate=0.01)
+    for i in range(5000):
+        bloom.add(f"member-{i}")
+
+    assert all(f"member-{i}" in bloom for i in range(5000))
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 300  # ~1% expected
+
+
+def test_set_defers_to_database_until_loaded():
+    tokens = RevokedTokenSet(memory_limit=10)
+    assert tokens.check("jti") is None
+
+    tokens.load(lambda: [("jti", time.time() + 60)])
+
+    assert tokens.check("jti") is True
+    assert tokens.check("other") is False
+
+
+def test_load_keeps_tokens_added_meanwhile_and_drops_expired_ones():
+    tokens = RevokedTokenSet(memory_limit=10)
+
+    def fetch():
+        tokens.add("revoked-during-load", time.time() + 60)  # a logout while the query runs
+        return [("active", time.time() + 60), ("expired", time.time() - 1)]
+
+    assert tokens.load(fetch) == 2
+    assert tokens.check("revoked-during-load") is True
+    assert tokens.check("active") is True
+    assert tokens.check("expired") is False
+
+
+def test_load_keeps_tokens_added_by_another_thread_at_the_end_of_the_fetch():
+    tokens = RevokedTokenSet(memory_limit=10)
+
+    def notify():
+        time.sleep(0.05)  # the notification arrives while the rows are being converted
+        tokens.add("revoked-late", time.time() + 60)
+
+    def fetch():
+        notifier = threading.Thread(target=notify)
+        notifier.start()
+        rows = [("active", time.time() + 60)]
+        notifier.join()
+        return rows
+
+    tokens.load(fetch)
+
+    assert tokens.check("revoked-late") is True
+    assert tokens.check("active") is True
+
+
+def test_set_keeps_only_the_bloom_filter_above_memory_limit():
+    tokens = RevokedTokenSet(memory_limit=100)
+    tokens.load(lambda: [(f"jti-{i}", time.time() + 60) for i in range(101)])
+
+    assert tokens.stats()["bloom_only"] is True
+    assert tokens.check("jti-5") is None  # maybe revoked: ask the database
+    assert sum(tokens.check(f"other-{i}") is False for i in range(1000)) > 900
+
+
+def test_logout_adds_tokens_to_the_revoked_set(client, session):
+    user = create_user_in_db(session, "Revoked User", "revoked@example.com", "pass1234")
+    token = get_token_for_user(client, user.email, "pass1234")
+    jti = jwt.decode(token, options={"verify_signature": False})["jti"]
+
+    client.post("/auth/logout", headers=get_auth_headers(token))
+
+    assert revoked_tokens.check(jti) is True
+
+
+def test_token_revoked_by_another_worker_is_rejected_from_memory(client, session):
+    """The notification alone (no row in this database) is enough to reject the token"""
+    user = create_user_in_db(session, "Revoked User", "revoked@example.com", "pass1234")
+    client.post("/auth/login", data={"username": user.email, "password": "pass1234"})
+    refresh_token = client.cookies.get("refresh_token")
+    claims = jwt.decode(refresh_token, options={"verify_signature": False})
+
+    notification_listener.dispatch(
+        {"type": TOKENS_REVOKED, "tokens": {claims["jti"]: claims["exp"]}}
+    )
+
+    response = client.post("/auth/refresh")
+    assert response.status_code == 401
+    assert "revoked" in response.json()["detail"].lower()
+
+
+def test_token_revoked_by_another_worker_is_rejected_while_listen_is_down(client, session, monkeypatch):
+    """A revocation whose notification is lost with the LISTEN connection is found in the database"""
+    # Keep the listener down for the rest of the test.
+    monkeypatch.setattr(notification_bus, "RECONNECT_DELAY", 60)
+    user = create_user_in_db(session, "Revoked User", "revoked@example.com", "pass1234")
+    client.post("/auth/login", data={"username": user.email, "password": "pass1234"})
+    refresh_token = client.cookies.get("refresh_token")
+    claims = jwt.decode(refresh_token, options={"verify_signature": False})
+    assert revoked_tokens.loaded
+
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+                "WHERE pid <> pg_backend_pid() AND datname = current_database() AND query LIKE 'LISTEN %'"
+            )
+        )
+    deadline = time.monotonic() + 5
+    while revoked_tokens.loaded and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not revoked_tokens.loaded
+
+    # Another worker revokes the token: its notification never reaches this one.
+    session.add(RevokedToken(jti=claims["jti"], expires_at=datetime.fromtimestamp(claims["exp"], timezone.utc)))
+    session.commit()
+
+    response = client.post("/auth/refresh")
+    assert response.status_code == 401
+    assert "revoked" in response.json()["detail"].lower()
+
+
+def test_load_reads_unexpired_rows(session):
+    now = datetime.now(timezone.utc)
+    session.add(RevokedToken(jti="active", expires_at=now + timedelta(minutes=5)))
+    session.add(RevokedToken(jti="expired", expires_at=now - timedelta(minutes=5)))
+    session.commit()
+
+    assert load_revoked_tokens(session) == 1
+    assert revoked_tokens.check("active") is True
+    assert revoked_tokens.check("expired") is False
+
+
+def test_purge_deletes_expired_rows_in_batches(session):
+    now = datetime.now(timezone.utc)
+    for i in range(25):
+        session.add(RevokedToken(jti=f"expired-{i}", expires_at=now - timedelta(minutes=1)))
+    for i in range(3):
+        session.add(RevokedToken(jti=f"active-{i}", expires_at=now + timedelta(minutes=5)))
+    session.commit()
+    runs = purge_stats.snapshot()["runs"]
+
+    assert purge_expired_revoked_tokens(session, batch_size=10) == 25
+
+    remaining = session.exec(select(RevokedToken.jti)).all()
+    assert sorted(remaining) == ["active-0", "active-1", "active-2"]
+    stats = purge_stats.snapshot()
+    assert (stats["runs"], stats["last_purged"]) == (runs + 1, 25)
@@ -17,18 +17,30 @@ TESTED ENDPOINTS:
 [x] GET    /stock/product/{product_id}/history
 [x] GET    /stock/warehouse/{warehouse_id}/history
 [x] GET    /stock/warehouse/{warehouse_id}/product/{product_id}/history
+[x] GET    /stock/as-of
+[x] GET    /stock/export
+[x] GET    /stock/history/export
 """
 
+import io
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from sqlalchemy import text
 from sqlmodel import select
-from datetime import date, timedelta
+from datetime import date, datetime, time, timedelta, timezone
 from dateutil.relativedelta import relativedelta
 
 from app.models.product import Product
 from app.models.stock import Stock
+from app.models.stock_daily_snapshot import StockDailySnapshot
 from app.models.stock_move import StockMove
 from app.models.stock_move_line import StockMoveLine
 from app.models.warehouse import Warehouse
 from app.models.product_category import ProductCategory
+from app.services.dashboard_cache import semaphore_cache
 from app.tests.utils import (
     create_user_in_db,
     get_admin_headers,
@@ -73,6 +85,26 @@ def test_admin_can_list_all_stock(client, session):
     assert any(item["sku"] == "STOCK001" for item in data["data"])
 
 
+def test_stock_rejects_revoked_and_inactive_tokens(client, session):
+    """Ensure the async stock routes apply the same token checks as the sync ones"""
+    user = create_user_in_db(session, "Stock User", "stockuser@example.com", "pass1234", is_active=True)
+    token = get_token_for_user(client, user.email, "pass1234")
+    headers = get_auth_headers(token)
+    assert client.get("/stock/", headers=headers).status_code == 200
+
+    # Deactivating through the API also drops the token from the auth cache.
+    admin_headers, _ = get_admin_headers(client, session)
+    client.put(f"/users/{user.id}", json={"is_active": False}, headers=admin_headers)
+    assert client.get("/stock/", headers=headers).status_code == 403
+
+    client.put(f"/users/{user.id}", json={"is_active": True}, headers=admin_headers)
+    assert client.get("/stock/", headers=headers).status_code == 200
+    client.post("/auth/logout", headers=headers)
+    response = client.get("/stock/", headers=headers)
+    assert response.status_code == 401
+    assert "revoked" in response.json()["detail"].lower()
+
+
 def test_stock_total_is_full_count_not_capped_by_limit(client, session):
     """Verify that 'total' in paginated stock response reflects the real record count, not the limit."""
     headers, _ = get_admin_headers(client, session)
@@ -100,6 +132,41 @@ def test_stock_total_is_full_count_not_capped_by_limit(client, session):
     assert len(data["data"]) == 5
 
 
+def test_stock_total_modes(client, session):
+    """Verify include_total=false, estimate_total and an offset past the last page."""
+    headers, _ = get_admin_headers(client, session)
+
+    category = ProductCategory(name="ModeCat")
+    session.add(category)
+    session.commit()
+
+    warehouse = Warehouse(name="ModeWH", is_active=True)
+    session.add(warehouse)
+    session.commit()
+
+    product = Product(sku="MODESKU", short_name="ModeProd", category_id=category.id)
+    session.add(product)
+    session.commit()
+
+    for i in range(3):
+        session.add(Stock(warehouse_id=warehouse.id, product_id=product.id, lot=f"LOT{i}", quantity=1))
+    session.commit()
+
+    response = client.get("/stock/?limit=2&include_total=false", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["total"] is None
+    assert len(response.json()["data"]) == 2
+
+    response = client.get("/stock/?limit=2&estimate_total=true", headers=headers)
+    assert response.status_code == 200
+    assert isinstance(response.json()["total"], int)
+
+    response = client.get("/stock/?limit=2&offset=10", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["total"] == 3
+    assert response.json()["data"] == []
+
+
 # [x] GET    /stock/warehouse/{warehouse_id}
 
 
@@ -610,6 +677,114 @@ def test_admin_can_get_semaphore_stock_summary(client, session):
     assert data["no_expiration"] == 10
 
 
+def test_semaphore_breakdown_per_warehouse_and_category(client, session):
+    """Ensure the buckets are split per warehouse / category and add up to the totals"""
+    headers, _ = get_admin_headers(client, session)
+
+    food = ProductCategory(name="Food")
+    tools = ProductCategory(name="Tools")
+    north = Warehouse(name="North", is_active=True)
+    south = Warehouse(name="South", is_active=True)
+    session.add_all([food, tools, north, south])
+    session.commit()
+
+    milk = Product(sku="MILK", short_name="Milk", category_id=food.id)
+    saw = Product(sku="SAW", short_name="Saw", category_id=tools.id)
+    session.add_all([milk, saw])
+    session.commit()
+
+    today = date.today()
+    session.add_all([
+        Stock(warehouse_id=north.id, product_id=milk.id, lot="M1", expiration_date=today, quantity=4),
+        Stock(warehouse_id=south.id, product_id=milk.id, lot="M2", expiration_date=today + timedelta(days=90), quantity=6),
+        Stock(warehouse_id=south.id, product_id=saw.id, quantity=5),
+    ])
+    session.commit()
+
+    response = client.get("/stock/semaphore?breakdown=warehouse", headers=headers)
+    assert response.status_code == 200, response.json()
+    data = response.json()
+    assert (data["expired"], data["expiring_soon"], data["no_expiration"]) == (4, 6, 5)
+    assert [(g["name"], g["expired"], g["expiring_soon"], g["no_expiration"]) for g in data["breakdown"]] == [
+        ("North", 4, 0, 0),
+        ("South", 0, 6, 5),
+    ]
+
+    response = client.get("/stock/semaphore?breakdown=category", headers=headers)
+    assert response.status_code == 200, response.json()
+    data = response.json()
+    assert [(g["name"], g["expired"], g["expiring_soon"], g["no_expiration"]) for g in data["breakdown"]] == [
+        ("Food", 4, 6, 0),
+        ("Tools", 0, 0, 5),
+    ]
+
+    assert client.get("/stock/semaphore", headers=headers).json()["breakdown"] is None
+    assert client.get("/stock/semaphore?breakdown=product", headers=headers).status_code == 422
+
+
+def test_semaphore_is_cached(client, session):
+    """Ensure repeated calls on the same day are served from the cache"""
+    headers, _ = get_admin_headers(client, session)
+
+    category = ProductCategory(name="CacheCat")
+    warehouse = Warehouse(name="WH Cache", is_active=True)
+    session.add_all([category, warehouse])
+    session.commit()
+    product = Product(sku="CACHED", short_name="Cached", category_id=category.id)
+    session.add(product)
+    session.commit()
+    session.add(Stock(warehouse_id=warehouse.id, product_id=product.id, quantity=2))
+    session.commit()
+
+    assert client.get("/stock/semaphore", headers=headers).json()["no_expiration"] == 2
+
+    session.add(Stock(warehouse_id=warehouse.id, product_id=product.id, lot="L2", quantity=3))
+    session.commit()
+    assert client.get("/stock/semaphore", headers=headers).json()["no_expiration"] == 2
+
+    semaphore_cache.clear()
+    assert client.get("/stock/semaphore", headers=headers).json()["no_expiration"] == 5
+
+
+def test_dashboard_cache_is_invalidated_per_warehouse_by_movements(client, session, base_data):
+    """Ensure a committed movement only drops the cached aggregates it touches"""
+    headers, _ = get_admin_headers(client, session)
+    touched, other, product = base_data.warehouse, Warehouse(name="WH Other", is_active=True), base_data.product
+    session.add(other)
+    session.commit()
+
+    def detail(warehouse):
+        return client.get(f"/stock/warehouse/{warehouse.id}/detail", headers=headers).json()
+
+    def dashboard_metrics():
+        metrics = client.get("/metrics/cache", headers=headers).json()
+        return next(m for m in metrics if m["cache"] == "dashboard")
+
+    before = dashboard_metrics()
+    assert detail(touched) == detail(other) == []
+
+    # Written behind the API's back: the cached (empty) answers are still served.
+    session.add_all([
+        Stock(warehouse_id=touched.id, product_id=product.id, lot="T", quantity=4),
+        Stock(warehouse_id=other.id, product_id=product.id, lot="O", quantity=6),
+    ])
+    session.commit()
+    assert detail(touched) == detail(other) == []
+
+    payload = {
+        "move_type": "incoming",
+        "lines": [{"warehouse_id": touched.id, "product_id": product.id, "lot": "NEW", "quantity": 1}],
+    }
+    assert client.post("/stock-movements/", json=payload, headers=headers).status_code == 201
+
+    assert [row["total_quantity"] for row in detail(touched)] == [4]
+    assert detail(other) == []
+
+    after = dashboard_metrics()
+    assert after["hits"] - before["hits"] == 3
+    assert after["misses"] - before["misses"] == 3
+
+
 # [x] GET    /stock/warehouse/{warehouse_id}/product/{product_id}
 
 
@@ -775,6 +950,90 @@ def test_admin_can_get_full_stock_history(client, session):
     assert all("move_id" in item for item in data["data"])
 
 
+def test_stock_history_cursor_pagination_walks_all_lines(client, session):
+    """Ensure following next_cursor returns every line exactly once, newest first"""
+    headers, admin = get_admin_headers(client, session)
+
+    # Setup
+    category = ProductCategory(name="CursorCat")
+    session.add(category)
+    session.commit()
+
+    product = Product(sku="CURSOR01", short_name="CursorProd", category_id=category.id)
+    session.add(product)
+    session.commit()
+
+    warehouse = Warehouse(name="WH Cursor", is_active=True)
+    session.add(warehouse)
+    session.commit()
+
+    # Three movements with two lines each
+    for _ in range(3):
+        move = StockMove(move_type="incoming", user_id=admin.id)
+        session.add(move)
+        session.commit()
+        session.refresh(move)
+        for line_id in (1, 2):
+            session.add(
+                StockMoveLine(
+                    move_id=move.id,
+                    line_id=line_id,
+                    warehouse_id=warehouse.id,
+                    product_id=product.id,
+                    lot=f"CL{line_id}",
+                    quantity=1,
+                )
+            )
+        session.commit()
+
+    seen = []
+    cursor = first_cursor = None
+    for _ in range(10):
+        params = {"limit": 4}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/stock/history", params=params, headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        # Only the first (offset mode) page counts the total by default
+        assert data["total"] == (None if cursor else 6)
+        seen.extend((item["move_id"], item["lot"]) for item in data["data"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+        first_cursor = first_cursor or cursor
+
+    assert len(seen) == 6
+    assert len(set(seen)) == 6
+    move_ids = [move_id for move_id, _ in seen]
+    assert move_ids == sorted(move_ids, reverse=True)
+
+    # Cursor pages still count the total on request
+    response = client.get(
+        "/stock/history",
+        params={"limit": 4, "cursor": first_cursor, "include_total": "true"},
+        headers=headers,
+    )
+    assert response.json()["total"] == 6
+
+    # Offset mode still works and returns the same first page
+    response = client.get("/stock/history", params={"limit": 4, "offset": 0}, headers=headers)
+    assert [(i["move_id"], i["lot"]) for i in response.json()["data"]] == seen[:4]
+
+
+def test_stock_history_rejects_invalid_cursor(client, session):
+    """Ensure a malformed cursor or a cursor combined with offset returns 400"""
+    headers, _ = get_admin_headers(client, session)
+
+    response = client.get("/stock/history", params={"cursor": "not-a-cursor"}, headers=headers)
+    assert response.status_code == 400
+
+    response = client.get(
+        "/stock/history", params={"cursor": "not-a-cursor", "offset": 5}, headers=headers
+    )
+    assert response.status_code == 400
+
+
 # [x] GET    /stock/product/{product_id}/history
 
 
@@ -926,3 +1185,214 @@ def test_admin_can_get_stock_history_by_product_and_warehouse(client, session):
     assert data["data"][0]["product_id"] == product.id
     assert data["data"][0]["warehouse_id"] == warehouse.id
     assert data["data"][0]["lot"] == "LXYZ"
+
+
+# [x] GET    /stock/as-of
+
+
+def _add_move(session, user_id, move_type, day, lines):
+    """Inserts a movement at noon (UTC) of `day` with (warehouse_id, product_id, lot, quantity) lines."""
+    move = StockMove(
+        move_type=move_type,
+        user_id=user_id,
+        created_at=datetime.combine(day, time(12), tzinfo=timezone.utc),
+    )
+    session.add(move)
+    session.commit()
+    session.add_all([
+        StockMoveLine(move_id=move.id, line_id=i, warehouse_id=w, product_id=p, lot=lot, quantity=q)
+        for i, (w, p, lot, q) in enumerate(lines, 1)
+    ])
+    session.commit()
+
+
+def test_stock_as_of_replays_the_day_after_the_nearest_snapshot(client, session, base_data):
+    """Ensure as-of starts from the latest earlier snapshot and only replays that day's lines"""
+    headers, admin = get_admin_headers(client, session)
+    w, p = base_data.warehouse.id, base_data.product.id
+    other = Warehouse(name="WH AsOf", is_active=True)
+    session.add(other)
+    session.commit()
+
+    day = date.today() - timedelta(days=10)
+    session.add_all([
+        StockDailySnapshot(warehouse_id=w, product_id=p, lot="A", snapshot_date=day - timedelta(days=3), quantity=10),
+        StockDailySnapshot(warehouse_id=w, product_id=p, lot="A", snapshot_date=day - timedelta(days=1), quantity=7),
+        StockDailySnapshot(warehouse_id=w, product_id=p, lot="B", snapshot_date=day - timedelta(days=5), quantity=4),
+        StockDailySnapshot(warehouse_id=w, product_id=p, lot="B", snapshot_date=day - timedelta(days=2), quantity=0),
+        StockDailySnapshot(warehouse_id=other.id, product_id=p, lot="A", snapshot_date=day - timedelta(days=4), quantity=2),
+    ])
+    session.commit()
+    _add_move(session, admin.id, "outgoing", day - timedelta(days=2), [(w, p, "B", 4)])
+    _add_move(session, admin.id, "incoming", day, [(w, p, "A", 5), (w, p, "C", 3)])
+    _add_move(session, admin.id, "outgoing", day, [(w, p, "A", 2)])
+    # Later days are not replayed.
+    _add_move(session, admin.id, "incoming", day + timedelta(days=1), [(w, p, "A", 100)])
+
+    def as_of(query_day, **filters):
+        response = client.get("/stock/as-of", params={"date": query_day.isoformat(), **filters}, headers=headers)
+        assert response.status_code == 200
+        return [(row["warehouse_id"], row["lot"], row["quantity"]) for row in response.json()]
+
+    assert as_of(day) == [(w, "A", 10), (w, "C", 3), (other.id, "A", 2)]
+    assert as_of(day, warehouse_id=w) == [(w, "A", 10), (w, "C", 3)]
+    assert as_of(day - timedelta(days=2)) == [(w, "A", 10), (other.id, "A", 2)]
+    assert as_of(day - timedelta(days=6)) == []
+
+
+@pytest.fixture()
+def nullable_lot(session):
+    """Lets stock_move_line.lot hold NULL, as databases created by db_init/ do, for one test."""
+    session.exec(text("ALTER TABLE stock_move_line ALTER COLUMN lot DROP NOT NULL"))
+    session.commit()
+    yield
+    session.rollback()
+    session.exec(text("DELETE FROM stock_move_line WHERE lot IS NULL"))
+    session.exec(text("ALTER TABLE stock_move_line ALTER COLUMN lot SET NOT NULL"))
+    session.commit()
+
+
+def test_stock_as_of_matches_lines_without_lot_to_no_lot_snapshots(client, session, base_data, nullable_lot):
+    """Ensure a legacy line with a NULL lot is added to the 'NO_LOT' snapshot, not listed apart"""
+    headers, admin = get_admin_headers(client, session)
+    w, p = base_data.warehouse.id, base_data.product.id
+    day = date.today() - timedelta(days=10)
+    session.add(StockDailySnapshot(warehouse_id=w, product_id=p, lot="NO_LOT", snapshot_date=day - timedelta(days=1), quantity=5))
+    session.commit()
+    _add_move(session, admin.id, "incoming", day, [(w, p, "NULL", 2)])
+    session.exec(text("UPDATE stock_move_line SET lot = NULL WHERE lot = 'NULL'"))
+    session.commit()
+
+    response = client.get("/stock/as-of", params={"date": day.isoformat()}, headers=headers)
+
+    assert response.status_code == 200
+    assert [(row["lot"], row["quantity"]) for row in response.json()] == [("NO_LOT", 7)]
+
+
+def test_stock_as_of_requires_a_valid_date(client, session):
+    """Ensure as-of rejects a missing or malformed date"""
+    headers, _ = get_admin_headers(client, session)
+    assert client.get("/stock/as-of", headers=headers).status_code == 422
+    assert client.get("/stock/as-of?date=yesterday", headers=headers).status_code == 422
+
+
+# [x] GET    /stock/export
+# [x] GET    /stock/history/export
+
+
+def _read_export(response, export_format):
+    assert response.status_code == 200
+    if export_format == "parquet":
+        return pq.read_table(io.BytesIO(response.content))
+    return pa.ipc.open_stream(response.content).read_all()
+
+
+def test_stock_export_streams_arrow_and_parquet(client, session, base_data, monkeypatch):
+    """Ensure the stock export returns every row, in several batches, in both formats"""
+    monkeypatch.setattr("app.utils.export.EXPORT_BATCH_ROWS", 2)
+    headers, _ = get_admin_headers(client, session)
+    w, p = base_data.warehouse.id, base_data.product.id
+    other = Warehouse(name="WH Export", is_active=True)
+    session.add(other)
+    session.commit()
+    session.add_all([
+        Stock(warehouse_id=w, product_id=p, lot=f"L{i}", expiration_date=date(2099, 1, i), quantity=i)
+        for i in range(1, 6)
+    ] + [Stock(warehouse_id=other.id, product_id=p, lot="NO_LOT", quantity=7)])
+    session.commit()
+
+    response = client.get("/stock/export", headers=headers)
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    assert 'filename="stock.arrow"' in response.headers["content-disposition"]
+    table = _read_export(response, "arrow")
+    assert table.num_rows == 6
+    assert table.column_names[:2] == ["warehouse_id", "warehouse_name"]
+    assert table.column("quantity").to_pylist() == [1, 2, 3, 4, 5, 7]
+    assert table.column("expiration_date").to_pylist()[0] == date(2099, 1, 1)
+    assert table.column("expiration_date").to_pylist()[-1] is None
+    # 2 rows per record batch.
+    assert len(table.column("quantity").chunks) == 3
+
+    response = client.get(f"/stock/export?format=parquet&warehouse_id={other.id}", headers=headers)
+    assert response.headers["content-type"] == "application/vnd.apache.parquet"
+    table = _read_export(response, "parquet")
+    assert table.to_pylist() == [{
+        "warehouse_id": other.id, "warehouse_name": "WH Export", "product_id": p,
+        "product_name": "Base Product", "sku": "BASESKU", "lot": "NO_LOT",
+        "expiration_date": None, "quantity": 7,
+    }]
+
+
+def test_stock_export_of_nothing_is_a_valid_empty_file(client, session):
+    """Ensure an empty result still carries the schema"""
+    headers, _ = get_admin_headers(client, session)
+    for export_format in ("arrow", "parquet"):
+        table = _read_export(client.get(f"/stock/export?format={export_format}", headers=headers), export_format)
+        assert table.num_rows == 0
+        assert "quantity" in table.column_names
+    assert client.get("/stock/export?format=xlsx", headers=headers).status_code == 422
+
+
+def test_stock_history_export_filters_lines(client, session, base_data):
+    """Ensure the history export returns one row per line, filtered by warehouse and date"""
+    headers, admin = get_admin_headers(client, session)
+    w, p = base_data.warehouse.id, base_data.product.id
+    other = Warehouse(name="WH Export History", is_active=True)
+    session.add(other)
+    session.commit()
+    day = date(2030, 3, 10)
+    _add_move(session, admin.id, "incoming", day, [(w, p, "A", 5), (other.id, p, "B", 2)])
+    _add_move(session, admin.id, "outgoing", day + timedelta(days=1), [(w, p, "A", 1)])
+
+    table = _read_export(client.get("/stock/history/export?format=parquet", headers=headers), "parquet")
+    assert [(r["line_id"], r["lot"], r["move_type"], r["quantity"]) for r in table.to_pylist()] == [
+        (1, "A", "incoming", 5), (2, "B", "incoming", 2), (1, "A", "outgoing", 1),
+    ]
+    assert table.column("user_name").to_pylist()[0] == admin.name
+    assert table.column("created_at").to_pylist()[0] == datetime.combine(day, time(12), tzinfo=timezone.utc)
+
+    response = client.get(
+        "/stock/history/export", params={"warehouse_id": w, "date_to": day.isoformat()}, headers=headers
+    )
+    table = _read_export(response, "arrow")
+    assert [(r["warehouse_id"], r["quantity"]) for r in table.to_pylist()] == [(w, 5)]
+
+
+def test_stock_export_as_gzipped_csv_and_ndjson(client, session, base_data, monkeypatch):
+    """Ensure the text formats stream every row and are gzipped only when accepted"""
+    monkeypatch.setattr("app.utils.export.EXPORT_BATCH_ROWS", 2)
+    headers, _ = get_admin_headers(client, session)
+    w, p = base_data.warehouse.id, base_data.product.id
+    session.add_all([
+        Stock(warehouse_id=w, product_id=p, lot=f"L{i}", expiration_date=date(2099, 1, i), quantity=i)
+        for i in range(1, 4)
+    ] + [Stock(warehouse_id=w, product_id=p, lot="NO_LOT", quantity=9)])
+    session.commit()
+
+    response = client.get("/stock/export?format=csv", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"].startswith("text/csv")
+    lines = response.text.splitlines()
+    assert lines[0] == "warehouse_id,warehouse_name,product_id,product_name,sku,lot,expiration_date,quantity"
+    assert lines[1] == f"{w},Base WH,{p},Base Product,BASESKU,L1,2099-01-01,1"
+    assert lines[4] == f"{w},Base WH,{p},Base Product,BASESKU,NO_LOT,,9"
+    assert len(lines) == 5
+
+    response = client.get(
+        "/stock/export?format=ndjson", headers={**headers, "Accept-Encoding": "identity"}
+    )
+    assert "content-encoding" not in response.headers
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["quantity"] for r in records] == [1, 2, 3, 9]
+    assert records[0]["expiration_date"] == "2099-01-01"
+    assert records[3]["expiration_date"] is None
+
+
+def test_stock_csv_export_of_nothing_has_a_header(client, session):
+    """Ensure an empty CSV export still has its header line"""
+    headers, _ = get_admin_headers(client, session)
+    response = client.get("/stock/export?format=csv", headers=headers)
+    assert response.text.splitlines() == [
+        "warehouse_id,warehouse_name,product_id,product_name,sku,lot,expiration_date,quantity"
+    ]
@@ -3,13 +3,19 @@ This test module covers all endpoints in the /stock-movements router.
 
 TESTED ENDPOINTS:
 [X] POST   /stock-movements/
+[X] POST   /stock-movements/batch
 [X] GET    /stock-movements/
 [X] GET    /stock-movements/{id}
 [X] GET    /stock-movements/{id}/lines
 [X] GET    /stock-movements/summary/move-type
 [X] GET    /stock-movements/last-year
+[X] GET    /stock-movements/export
 """
 
+import csv
+import io
+import json
+
 import pytest
 from datetime import date, datetime, timedelta, timezone
 from sqlmodel import select
@@ -18,12 +24,14 @@ from app.models.user import User
 from app.models.warehouse import Warehouse
 from app.models.product_category import ProductCategory
 from app.models.stock_move import StockMove
+from app.models.stock_move_daily_rollup import StockMoveDailyRollup
 from app.models.stock_move_line import StockMoveLine
 from app.tests.utils import (
     create_user_in_db,
     get_admin_headers,
     get_auth_headers,
     get_token_for_user,
+    requires_rollup_trigger,
 )
 
 
@@ -236,6 +244,246 @@ def test_movement_rejects_more_than_100_lines(client, session, base_data):
     assert "maximum number of allowed lines" in response.json()["detail"].lower()
 
 
+def test_movement_lines_are_inserted_in_a_single_statement(client, session, base_data):
+    """Ensure a multi-line movement issues one INSERT for its lines and no refresh SELECTs"""
+    from sqlalchemy import event
+
+    headers, _ = get_admin_headers(client, session)
+    warehouse, product = base_data.warehouse, base_data.product
+
+    lines = [
+        {"warehouse_id": warehouse.id, "product_id": product.id, "lot": f"BULK{i}", "quantity": i + 1}
+        for i in range(50)
+    ]
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.post(
+            "/stock-movements/", json={"move_type": "incoming", "lines": lines}, headers=headers
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert response.status_code == 201, response.json()
+    data = response.json()
+    assert [line["line_id"] for line in data["lines"]] == list(range(1, 51))
+    assert data["lines"][49]["quantity"] == 50
+    assert data["created_at"]
+
+    line_inserts = [s for s in statements if s.startswith("INSERT INTO stock_move_line")]
+    assert len(line_inserts) == 1
+    assert not any(
+        s.startswith("SELECT") and "FROM stock_move_line" in s for s in statements
+    )
+
+
+def test_movement_with_idempotency_key_is_created_once(client, session, base_data):
+    """Ensure a retried request with the same Idempotency-Key returns the original movement"""
+    headers, _ = get_admin_headers(client, session)
+    warehouse, product = base_data.warehouse, base_data.product
+    payload = {
+        "move_type": "incoming",
+        "lines": [{"warehouse_id": warehouse.id, "product_id": product.id, "quantity": 4}],
+    }
+    headers = {**headers, "Idempotency-Key": "scan-0001"}
+
+    first = client.post("/stock-movements/", json=payload, headers=headers)
+    retry = client.post("/stock-movements/", json=payload, headers=headers)
+
+    assert first.status_code == 201, first.json()
+    assert retry.status_code == 201, retry.json()
+    assert "Idempotent-Replayed" not in first.headers
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+    assert len(session.exec(select(StockMove)).all()) == 1
+
+
+def test_idempotency_key_reused_with_other_body_is_rejected(client, session, base_data):
+    """Ensure an Idempotency-Key cannot be replayed for a different request body"""
+    headers, _ = get_admin_headers(client, session)
+    warehouse, product = base_data.warehouse, base_data.product
+    line = {"warehouse_id": warehouse.id, "product_id": product.id, "quantity": 4}
+    headers = {**headers, "Idempotency-Key": "scan-0002"}
+
+    first = client.post(
+        "/stock-movements/", json={"move_type": "incoming", "lines": [line]}, headers=headers
+    )
+    other = client.post(
+        "/stock-movements/", json={"move_type": "outgoing", "lines": [line]}, headers=headers
+    )
+
+    assert first.status_code == 201
+    assert other.status_code == 422
+    assert "idempotency-key" in other.json()["detail"].lower()
+
+
+def test_idempotency_keys_are_scoped_per_user(client, session, base_data):
+    """Ensure two users sending the same key each get their own movement"""
+    admin_headers, _ = get_admin_headers(client, session)
+    user = create_user_in_db(session, "Scanner", "scanner@example.com", "scanpass", is_active=True)
+    user_headers = get_auth_headers(get_token_for_user(client, user.email, "scanpass"))
+    warehouse, product = base_data.warehouse, base_data.product
+    payload = {
+        "move_type": "incoming",
+        "lines": [{"warehouse_id": warehouse.id, "product_id": product.id, "quantity": 1}],
+    }
+
+    a = client.post("/stock-movements/", json=payload, headers={**admin_headers, "Idempotency-Key": "k"})
+    b = client.post("/stock-movements/", json=payload, headers={**user_headers, "Idempotency-Key": "k"})
+
+    assert a.status_code == b.status_code == 201
+    assert a.json()["id"] != b.json()["id"]
+
+
+def test_expired_idempotency_key_is_purged_and_reusable(client, session, base_data):
+    """Ensure expired keys no longer replay and are removed by the purge"""
+    from app.models.stock_move_idempotency_key import StockMoveIdempotencyKey
+    from app.services.stock_move_service import purge_expired_idempotency_keys
+
+    headers, _ = get_admin_headers(client, session)
+    warehouse, product = base_data.warehouse, base_data.product
+    payload = {
+        "move_type": "incoming",
+        "lines": [{"warehouse_id": warehouse.id, "product_id": product.id, "quantity": 1}],
+    }
+    headers = {**headers, "Idempotency-Key": "scan-0003"}
+
+    first = client.post("/stock-movements/", json=payload, headers=headers)
+    stored = session.exec(select(StockMoveIdempotencyKey)).one()
+    stored.expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    session.add(stored)
+    session.commit()
+
+    second = client.post("/stock-movements/", json=payload, headers=headers)
+    assert second.status_code == 201
+    assert second.json()["id"] != first.json()["id"]
+    assert "Idempotent-Replayed" not in second.headers
+
+    stored = session.exec(select(StockMoveIdempotencyKey)).one()
+    assert stored.move_id == second.json()["id"]
+    stored.expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    session.add(stored)
+    session.commit()
+
+    assert purge_expired_idempotency_keys(session) == 1
+    assert session.exec(select(StockMoveIdempotencyKey)).all() == []
+
+
+# [X] POST   /stock-movements/batch
+def test_batch_creates_valid_movements_and_reports_errors(client, session, base_data):
+    """Ensure a JSON batch creates valid movements and returns an error per invalid one"""
+    headers, admin = get_admin_headers(client, session)
+    warehouse, product = base_data.warehouse, base_data.product
+
+    inactive = Warehouse(name="Batch Disabled WH", is_active=False)
+    session.add(inactive)
+    session.commit()
+
+    line = {"warehouse_id": warehouse.id, "product_id": product.id, "quantity": 1}
+    payload = [
+        {"move_type": "incoming", "lines": [line]},
+        {"move_type": "incoming", "lines": [{**line, "warehouse_id": inactive.id}]},
+        {"move_type": "sideways", "lines": [line]},
+        {"move_type": "incoming", "lines": []},
+        {"move_type": "outgoing", "lines": [line, {**line, "lot": "LOT2"}]},
+    ]
+
+    response = client.post(
+        "/stock-movements/batch", json=payload, params={"chunk_size": 2}, headers=headers
+    )
+
+    assert response.status_code == 200, response.json()
+    data = response.json()
+    assert data["created"] == 2
+    assert data["failed"] == 3
+    assert [r["index"] for r in data["results"]] == [0, 1, 2, 3, 4]
+    assert [r["status"] for r in data["results"]] == ["created", "error", "error", "error", "created"]
+    assert "warehouses are inactive" in data["results"][1]["detail"].lower()
+    assert "move_type" in data["results"][2]["detail"]
+    assert "at least one line" in data["results"][3]["detail"].lower()
+
+    created_ids = [data["results"][0]["id"], data["results"][4]["id"]]
+    moves = session.exec(select(StockMove).where(StockMove.id.in_(created_ids))).all()
+    assert {m.user_id for m in moves} == {admin.id}
+    lines = session.exec(
+        select(StockMoveLine).where(StockMoveLine.move_id == created_ids[1])
+    ).all()
+    assert sorted(l.line_id for l in lines) == [1, 2]
+
+
+def test_batch_accepts_ndjson(client, session, base_data):
+    """Ensure an NDJSON body is ingested line by line, including malformed lines"""
+    import json
+
+    headers, _ = get_admin_headers(client, session)
+    warehouse, product = base_data.warehouse, base_data.product
+
+    line = {"warehouse_id": warehouse.id, "product_id": product.id, "quantity": 2}
+    body = "\n".join(
+        [json.dumps({"move_type": "incoming", "lines": [line]})] * 3
+        + ["{not json", "", json.dumps({"move_type": "outgoing", "lines": [line]})]
+    )
+
+    response = client.post(
+        "/stock-movements/batch",
+        content=body,
+        params={"chunk_size": 2},
+        headers={**headers, "Content-Type": "application/x-ndjson"},
+    )
+
+    assert response.status_code == 200, response.json()
+    data = response.json()
+    assert data["created"] == 4
+    assert data["failed"] == 1
+    assert data["results"][3]["status"] == "error"
+    assert [r["index"] for r in data["results"]] == [0, 1, 2, 3, 4]
+    assert len(session.exec(select(StockMove)).all()) == 4
+
+
+def test_batch_validates_references_once(client, session, base_data):
+    """Ensure active warehouses/products are looked up once for the whole batch"""
+    from sqlalchemy import event
+
+    headers, _ = get_admin_headers(client, session)
+    warehouse, product = base_data.warehouse, base_data.product
+    line = {"warehouse_id": warehouse.id, "product_id": product.id, "quantity": 1}
+    payload = [{"move_type": "incoming", "lines": [line]} for _ in range(20)]
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.post("/stock-movements/batch", json=payload, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200, response.json()
+    assert response.json()["created"] == 20
+    assert len([s for s in statements if "FROM warehouse" in s]) == 1
+    assert len([s for s in statements if "FROM product" in s]) == 1
+
+
+def test_batch_rejects_non_array_body(client, session):
+    """Ensure a JSON batch must be a non-empty array"""
+    headers, _ = get_admin_headers(client, session)
+
+    response = client.post("/stock-movements/batch", json={"move_type": "incoming"}, headers=headers)
+    assert response.status_code == 400
+
+    response = client.post("/stock-movements/batch", json=[], headers=headers)
+    assert response.status_code == 400
+
+
 # [X] GET    /stock-movements/
 def test_admin_can_list_all_movements(client, session, base_data):
     """Ensure admin can retrieve all stock movements"""
@@ -780,6 +1028,8 @@ def test_user_sees_only_their_own_movement_summary(client, session):
 
 # [X] GET    /stock-movements/last-year
 
+
+@requires_rollup_trigger
 def test_admin_can_view_all_aggregated_movements_from_last_year(client, session):
     """Ensure admin receives aggregated data for all users in the last 12 months, excluding older movements."""
     headers, admin = get_admin_headers(client, session)
@@ -823,6 +1073,7 @@ def test_admin_can_view_all_aggregated_movements_from_last_year(client, session)
     assert not any(m.startswith(old_month) for m in months)
 
 
+@requires_rollup_trigger
 def test_user_only_sees_own_aggregated_movements_from_last_year(client, session):
     """Ensure user receives only their own movements aggregated, not other users'."""
     user1 = create_user_in_db(
@@ -853,3 +1104,138 @@ def test_user_only_sees_own_aggregated_movements_from_last_year(client, session)
     total_outgoing = sum(entry["outgoing"] for entry in data)
     assert total_incoming >= 1
     assert total_outgoing == 0
+
+
+@requires_rollup_trigger
+def test_movements_are_counted_in_the_daily_rollup(client, session, base_data):
+    """Ensure created movements (single and batch) update the rollup the graph reads"""
+    headers, admin = get_admin_headers(client, session)
+    line = {"warehouse_id": base_data.warehouse.id, "product_id": base_data.product.id}
+
+    payload = {"move_type": "incoming", "lines": [{**line, "quantity": 5}, {**line, "lot": "L2", "quantity": 2}]}
+    assert client.post("/stock-movements/", json=payload, headers=headers).status_code == 201
+    batch = [
+        {"move_type": "incoming", "lines": [{**line, "quantity": 1}]},
+        {"move_type": "outgoing", "lines": [{**line, "quantity": 4}]},
+    ]
+    assert client.post("/stock-movements/batch", json=batch, headers=headers).status_code == 200
+
+    today = datetime.now(timezone.utc).date()
+    rows = session.exec(select(StockMoveDailyRollup).order_by(StockMoveDailyRollup.move_type)).all()
+    assert [(r.day, r.user_id, r.move_type, r.move_count, r.line_count, r.units) for r in rows] == [
+        (today, admin.id, "incoming", 2, 3, 8),
+        (today, admin.id, "outgoing", 1, 1, 4),
+    ]
+
+    data = client.get("/stock-movements/last-year", headers=headers).json()
+    assert len(data) == 1
+    assert data[0]["month"].startswith(today.strftime("%Y-%m-01"))
+    assert (data[0]["incoming"], data[0]["incoming_lines"], data[0]["incoming_units"]) == (2, 3, 8)
+    assert (data[0]["outgoing"], data[0]["outgoing_lines"], data[0]["outgoing_units"]) == (1, 1, 4)
+
+
+def test_movement_graph_range_and_granularity(client, session):
+    """Ensure the graph groups the rollup by day, week or month within the requested range"""
+    headers, admin = get_admin_headers(client, session)
+    session.add_all([
+        StockMoveDailyRollup(day=date(2024, 1, 31), user_id=admin.id, move_type="incoming", move_count=1, line_count=1, units=1),
+        StockMoveDailyRollup(day=date(2024, 2, 1), user_id=admin.id, move_type="incoming", move_count=2, line_count=2, units=2),
+        StockMoveDailyRollup(day=date(2024, 2, 1), user_id=admin.id, move_type="outgoing", move_count=3, line_count=3, units=3),
+        StockMoveDailyRollup(day=date(2024, 2, 6), user_id=admin.id, move_type="outgoing", move_count=4, line_count=4, units=4),
+    ])
+    session.commit()
+
+    def graph(**params):
+        response = client.get("/stock-movements/last-year", params=params, headers=headers)
+        assert response.status_code == 200
+        return [(entry["month"][:10], entry["incoming"], entry["outgoing"]) for entry in response.json()]
+
+    assert graph(date_from="2024-01-01", date_to="2024-02-29") == [
+        ("2024-01-01", 1, 0),
+        ("2024-02-01", 2, 7),
+    ]
+    # 2024-01-29 and 2024-02-05 are Mondays.
+    assert graph(date_from="2024-01-01", date_to="2024-02-29", granularity="week") == [
+        ("2024-01-29", 3, 3),
+        ("2024-02-05", 0, 4),
+    ]
+    assert graph(date_from="2024-02-01", date_to="2024-02-05", granularity="day") == [("2024-02-01", 2, 3)]
+    # The default range is the last year.
+    assert graph() == []
+
+
+def test_movement_graph_rejects_invalid_parameters(client, session):
+    """Ensure an inverted range or an unknown granularity is rejected"""
+    headers, _ = get_admin_headers(client, session)
+    response = client.get(
+        "/stock-movements/last-year?date_from=2024-03-01&date_to=2024-02-01", headers=headers
+    )
+    assert response.status_code == 400
+    response = client.get("/stock-movements/last-year?granularity=year", headers=headers)
+    assert response.status_code == 422
+
+
+# [X] GET    /stock-movements/export
+
+
+def test_movements_export_csv_has_one_row_per_line(client, session, base_data, monkeypatch):
+    """Ensure the CSV export flattens movements into lines, newest first, across batches"""
+    monkeypatch.setattr("app.utils.export.EXPORT_BATCH_ROWS", 2)
+    headers, admin = get_admin_headers(client, session)
+    line = {"warehouse_id": base_data.warehouse.id, "product_id": base_data.product.id}
+    first = {"move_type": "incoming", "lines": [{**line, "quantity": 5}, {**line, "lot": "L2", "quantity": 2}]}
+    second = {"move_type": "outgoing", "lines": [{**line, "quantity": 1}]}
+    first_id = client.post("/stock-movements/", json=first, headers=headers).json()["id"]
+    second_id = client.post("/stock-movements/", json=second, headers=headers).json()["id"]
+
+    response = client.get("/stock-movements/export", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert 'filename="stock_movements.csv"' in response.headers["content-disposition"]
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [(int(r["move_id"]), int(r["line_id"]), r["lot"], int(r["quantity"])) for r in rows] == [
+        (second_id, 1, "NO_LOT", 1),
+        (first_id, 1, "NO_LOT", 5),
+        (first_id, 2, "L2", 2),
+    ]
+    assert rows[0]["user_name"] == admin.name
+    assert rows[0]["expiration_date"] == ""
+
+    response = client.get("/stock-movements/export?move_type=incoming", headers=headers)
+    assert {r["move_id"] for r in csv.DictReader(io.StringIO(response.text))} == {str(first_id)}
+
+
+def test_movements_export_ndjson_nests_lines_like_the_listing(client, session, base_data, monkeypatch):
+    """Ensure NDJSON records match the /stock-movements/ items, even when a movement spans batches"""
+    monkeypatch.setattr("app.utils.export.EXPORT_BATCH_ROWS", 2)
+    headers, admin = get_admin_headers(client, session)
+    line = {"warehouse_id": base_data.warehouse.id, "product_id": base_data.product.id}
+    payload = {"move_type": "incoming", "lines": [{**line, "lot": f"L{i}", "quantity": i} for i in range(1, 4)]}
+    assert client.post("/stock-movements/", json=payload, headers=headers).status_code == 201
+    # A movement without lines is exported with an empty list.
+    session.add(StockMove(move_type="outgoing", user_id=admin.id, created_at=datetime(2020, 1, 1, tzinfo=timezone.utc)))
+    session.commit()
+
+    response = client.get("/stock-movements/export?format=ndjson", headers=headers)
+    assert response.headers["content-type"] == "application/x-ndjson"
+    records = [json.loads(line) for line in response.text.splitlines()]
+    listing = client.get("/stock-movements/", headers=headers).json()["data"]
+    assert [record["id"] for record in records] == [item["id"] for item in listing]
+    assert records[0]["lines"] == listing[0]["lines"]
+    assert records[0]["created_at"] == listing[0]["created_at"].replace("Z", "+00:00")
+    assert records[1]["lines"] == []
+
+
+def test_movements_export_only_contains_own_movements_for_users(client, session):
+    """Ensure a regular user only exports their own movements"""
+    user = create_user_in_db(session, "Exporter", "exporter@example.com", "pass1234", is_active=True)
+    other = create_user_in_db(session, "Other", "other-export@example.com", "pass1234", is_active=True)
+    session.add_all([
+        StockMove(move_type="incoming", user_id=user.id),
+        StockMove(move_type="incoming", user_id=other.id),
+    ])
+    session.commit()
+    headers = get_auth_headers(get_token_for_user(client, user.email, "pass1234"))
+
+    response = client.get(f"/stock-movements/export?format=ndjson&user_id={other.id}", headers=headers)
+    assert [json.loads(line)["user_id"] for line in response.text.splitlines()] == [user.id]
@@ -0,0 +1,304 @@
+"""
+This test module checks that the set-based (FOR EACH STATEMENT) stock trigger
+behaves exactly like the original per-row trigger.
+
+Both versions are read from db_init/migrations:
+- 001_set_based_stock_trigger_down.sql → original FOR EACH ROW trigger (reference)
+- 001_set_based_stock_trigger.sql      → set-based trigger using transition tables
+
+Each scenario is replayed once per trigger inside a savepoint of a single
+transaction that is rolled back at the end, so the test database is left without
+a stock trigger (other tests insert movement lines without matching stock).
+
+The daily snapshot trigger (002_stock_daily_snapshot.sql) is installed the same
+way, on top of the set-based stock trigger.
+
+The db_init folder is not copied into the backend container, so the module is
+skipped when the tests run from there.
+"""
+
+from datetime import date, datetime, timezone
+
+import psycopg2
+import pytest
+
+from app.tests.utils import MIGRATIONS_DIR, load_migration_sql
+
+ROW_TRIGGER_SQL = MIGRATIONS_DIR / "001_set_based_stock_trigger_down.sql"
+SET_TRIGGER_SQL = MIGRATIONS_DIR / "001_set_based_stock_trigger.sql"
+SNAPSHOT_TRIGGER_SQL = MIGRATIONS_DIR / "002_stock_daily_snapshot.sql"
+
+pytestmark = pytest.mark.skipif(
+    not SET_TRIGGER_SQL.exists(), reason="db_init/migrations is not available"
+)
+
+EXP_A = date(2099, 1, 31)
+EXP_B = date(2099, 6, 30)
+
+# Each scenario: initial stock rows, then a list of movements inserted one
+# statement per movement. Warehouses and products are referenced by index.
+# stock row: (warehouse, product, lot, expiration_date, quantity)
+# line:      (warehouse, product, lot, expiration_date, quantity)
+SCENARIOS = {
+    "incoming_new_lots_are_summed": (
+        [],
+        [("incoming", [(0, 0, "L1", EXP_A, 5), (0, 0, "L1", EXP_A, 7), (1, 1, "L2", None, 3)])],
+    ),
+    "incoming_existing_lot_keeps_expiration": (
+        [(0, 0, "L1", EXP_A, 10)],
+        [("incoming", [(0, 0, "L1", None, 4), (0, 0, "L1", EXP_A, 1)])],
+    ),
+    "no_lot_lines_are_summed": (
+        [(0, 0, "NO_LOT", None, 2)],
+        [("incoming", [(0, 0, "NO_LOT", None, 3), (0, 0, "NO_LOT", None, 1)])],
+    ),
+    "outgoing_within_stock": (
+        [(0, 0, "L1", EXP_A, 10), (1, 0, "NO_LOT", None, 4)],
+        [("outgoing", [(0, 0, "L1", EXP_A, 6), (0, 0, "L1", EXP_A, 4), (1, 0, "NO_LOT", None, 1)])],
+    ),
+    "outgoing_lines_exceed_stock_together": (
+        [(0, 0, "L1", EXP_A, 8)],
+        [("outgoing", [(0, 0, "L1", EXP_A, 5), (0, 0, "L1", EXP_A, 5)])],
+    ),
+    "outgoing_unknown_lot": (
+        [(0, 0, "L1", EXP_A, 8)],
+        [("outgoing", [(0, 0, "L9", None, 1)])],
+    ),
+    "no_lot_with_expiration": (
+        [],
+        [("incoming", [(0, 0, "NO_LOT", EXP_A, 1)])],
+    ),
+    "existing_lot_with_other_expiration": (
+        [(0, 0, "L1", EXP_A, 8)],
+        [("incoming", [(0, 0, "L1", EXP_B, 1)])],
+    ),
+    "new_lot_with_two_expirations": (
+        [],
+        [("incoming", [(0, 0, "L1", EXP_A, 1), (0, 0, "L1", EXP_B, 1)])],
+    ),
+    "new_lot_first_line_without_expiration": (
+        [],
+        [("incoming", [(0, 0, "L1", None, 1), (0, 0, "L1", EXP_B, 1)])],
+    ),
+    # Lines breaking different rules: the first one (in line order) decides the error.
+    "insufficient_line_before_expiration_mismatch": (
+        [(0, 0, "L1", EXP_A, 1), (0, 0, "L2", EXP_A, 5)],
+        [("outgoing", [(0, 0, "L1", EXP_A, 5), (0, 0, "L2", EXP_B, 1)])],
+    ),
+    "expiration_mismatch_before_insufficient_line": (
+        [(0, 0, "L1", EXP_A, 1), (0, 0, "L2", EXP_A, 5)],
+        [("outgoing", [(0, 0, "L2", EXP_B, 1), (0, 0, "L1", EXP_A, 5)])],
+    ),
+    "insufficient_line_before_no_lot_with_expiration": (
+        [(0, 0, "L1", EXP_A, 1)],
+        [("outgoing", [(0, 0, "L1", EXP_A, 5), (1, 0, "NO_LOT", EXP_A, 1)])],
+    ),
+    "outgoing_unknown_lot_with_two_expirations": (
+        [],
+        [("outgoing", [(0, 0, "L1", EXP_A, 1), (0, 0, "L1", EXP_B, 1)])],
+    ),
+    "incoming_then_outgoing_movements": (
+        [],
+        [
+            ("incoming", [(0, 0, "L1", EXP_A, 5), (1, 1, "NO_LOT", None, 5)]),
+            ("outgoing", [(0, 0, "L1", EXP_A, 5), (1, 1, "NO_LOT", None, 2)]),
+            ("incoming", [(0, 0, "L1", None, 2)]),
+        ],
+    ),
+}
+
+
+def _run_scenario(cursor, trigger_sql, refs, initial_stock, movements):
+    """Installs a trigger, replays a scenario and returns the resulting stock or error."""
+    warehouses, products, user_id = refs
+    cursor.execute("SAVEPOINT scenario")
+    try:
+        cursor.execute(trigger_sql)
+        for wh, prod, lot, exp, qty in initial_stock:
+            cursor.execute(
+                'INSERT INTO "stock" (warehouse_id, product_id, lot, expiration_date, quantity) '
+                "VALUES (%s, %s, %s, %s, %s)",
+                (warehouses[wh], products[prod], lot, exp, qty),
+            )
+
+        for move_type, lines in movements:
+            cursor.execute(
+                "INSERT INTO stock_move (move_type, user_id, created_at) "
+                "VALUES (%s, %s, NOW()) RETURNING id",
+                (move_type, user_id),
+            )
+            move_id = cursor.fetchone()[0]
+            values = []
+            params = []
+            for line_id, (wh, prod, lot, exp, qty) in enumerate(lines, 1):
+                values.append("(%s, %s, %s, %s, %s, %s, %s)")
+                params += [move_id, line_id, warehouses[wh], products[prod], lot, exp, qty]
+            cursor.execute(
+                "INSERT INTO stock_move_line "
+                "(move_id, line_id, warehouse_id, product_id, lot, expiration_date, quantity) "
+                "VALUES " + ", ".join(values),
+                params,
+            )
+
+        cursor.execute(
+            'SELECT warehouse_id, product_id, lot, expiration_date, quantity FROM "stock" '
+            "ORDER BY warehouse_id, product_id, lot"
+        )
+        return ("ok", cursor.fetchall())
+    except psycopg2.Error as exc:
+        return ("error", exc.diag.message_primary)
+    finally:
+        cursor.execute("ROLLBACK TO SAVEPOINT scenario")
+
+
+@pytest.fixture()
+def trigger_cursor(session):
+    """Raw DB-API cursor inside a transaction that is always rolled back."""
+    connection = session.get_bind().raw_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO \"user\" (name, email, password, role, is_active) "
+            "VALUES ('Trigger', 'trigger@example.com', 'x', 'admin', true) RETURNING id"
+        )
+        user_id = cursor.fetchone()[0]
+        cursor.execute("INSERT INTO product_category (name) VALUES ('TriggerCat') RETURNING id")
+        category_id = cursor.fetchone()[0]
+
+        warehouses = []
+        products = []
+        for i in range(2):
+            cursor.execute(
+                "INSERT INTO warehouse (name, is_active) VALUES (%s, true) RETURNING id",
+                (f"Trigger WH {i}",),
+            )
+            warehouses.append(cursor.fetchone()[0])
+            cursor.execute(
+                "INSERT INTO product (sku, short_name, category_id, is_active) "
+                "VALUES (%s, %s, %s, true) RETURNING id",
+                (f"TRIG{i}", f"Trigger product {i}", category_id),
+            )
+            products.append(cursor.fetchone()[0])
+
+        yield cursor, (warehouses, products, user_id)
+    finally:
+        connection.rollback()
+        connection.close()
+
+
+@pytest.mark.parametrize("name", SCENARIOS)
+def test_set_based_trigger_matches_row_trigger(trigger_cursor, name):
+    """The set-based trigger produces the same stock (or the same error) as the per-row one."""
+    cursor, refs = trigger_cursor
+    initial_stock, movements = SCENARIOS[name]
+
+    expected = _run_scenario(
+        cursor, load_migration_sql(ROW_TRIGGER_SQL), refs, initial_stock, movements
+    )
+    actual = _run_scenario(
+        cursor, load_migration_sql(SET_TRIGGER_SQL), refs, initial_stock, movements
+    )
+
+    assert actual == expected
+
+
+def test_set_based_trigger_fires_once_per_statement(trigger_cursor):
+    """The new trigger is registered as a statement-level trigger with a transition table."""
+    cursor, _ = trigger_cursor
+    cursor.execute(load_migration_sql(SET_TRIGGER_SQL))
+    cursor.execute(
+        "SELECT action_orientation, action_reference_new_table "
+        "FROM information_schema.triggers WHERE trigger_name = 'trg_update_stock'"
+    )
+    assert cursor.fetchone() == ("STATEMENT", "new_lines")
+
+
+def _insert_lines(cursor, refs, movements):
+    """Inserts the lines of several movements in a single statement.
+
+    movements: list of (move_type, created_at, [(lot, quantity), ...]) on the first
+    warehouse and product.
+    """
+    warehouses, products, user_id = refs
+    values = []
+    params = []
+    for move_type, created_at, lines in movements:
+        cursor.execute(
+            "INSERT INTO stock_move (move_type, user_id, created_at) VALUES (%s, %s, %s) RETURNING id",
+            (move_type, user_id, created_at),
+        )
+        move_id = cursor.fetchone()[0]
+        for line_id, (lot, qty) in enumerate(lines, 1):
+            values.append("(%s, %s, %s, %s, %s, %s)")
+            params += [move_id, line_id, warehouses[0], products[0], lot, qty]
+    cursor.execute(
+        "INSERT INTO stock_move_line (move_id, line_id, warehouse_id, product_id, lot, quantity) "
+        "VALUES " + ", ".join(values),
+        params,
+    )
+
+
+def _snapshots(cursor):
+    cursor.execute(
+        "SELECT lot, snapshot_date, quantity FROM stock_daily_snapshot ORDER BY lot, snapshot_date"
+    )
+    return cursor.fetchall()
+
+
+def _utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+@pytest.fixture()
+def snapshot_cursor(trigger_cursor):
+    cursor, refs = trigger_cursor
+    cursor.execute(load_migration_sql(SET_TRIGGER_SQL))
+    cursor.execute(load_migration_sql(SNAPSHOT_TRIGGER_SQL))
+    return cursor, refs
+
+
+def test_snapshot_trigger_writes_the_closing_quantity_of_today(snapshot_cursor):
+    """Each insert of lines leaves today's snapshot equal to the resulting stock."""
+    cursor, refs = snapshot_cursor
+    now = datetime.now(timezone.utc)
+    _insert_lines(cursor, refs, [("incoming", now, [("L1", 5), ("L2", 2)])])
+    _insert_lines(cursor, refs, [("outgoing", now, [("L1", 2)])])
+
+    today = now.date()
+    assert _snapshots(cursor) == [("L1", today, 3), ("L2", today, 2)]
+    cursor.execute('SELECT lot, quantity FROM "stock" ORDER BY lot')
+    assert cursor.fetchall() == [("L1", 3), ("L2", 2)]
+
+
+def test_snapshot_trigger_splits_a_statement_across_midnight(snapshot_cursor):
+    """Lines of one INSERT dated on two days get one snapshot per day."""
+    cursor, refs = snapshot_cursor
+    _insert_lines(
+        cursor,
+        refs,
+        [
+            ("incoming", _utc(2030, 1, 1, 23, 59), [("MID", 4)]),
+            ("outgoing", _utc(2030, 1, 2, 0, 1), [("MID", 1)]),
+            ("incoming", _utc(2030, 1, 2, 0, 1), [("MID", 3)]),
+        ],
+    )
+
+    assert _snapshots(cursor) == [("MID", date(2030, 1, 1), 4), ("MID", date(2030, 1, 2), 6)]
+
+
+def test_snapshot_trigger_corrects_later_days_for_backdated_lines(snapshot_cursor):
+    """A line dated before existing snapshots is carried into every later day, as the backfill would."""
+    cursor, refs = snapshot_cursor
+    _insert_lines(cursor, refs, [("incoming", _utc(2030, 1, 3, 12), [("OLD", 10)])])
+    _insert_lines(cursor, refs, [("incoming", _utc(2030, 1, 1, 12), [("OLD", 4)])])
+    _insert_lines(cursor, refs, [("outgoing", _utc(2030, 1, 2, 12), [("OLD", 1)])])
+
+    expected = [
+        ("OLD", date(2030, 1, 1), 4),
+        ("OLD", date(2030, 1, 2), 3),
+        ("OLD", date(2030, 1, 3), 13),
+    ]
+    assert _snapshots(cursor) == expected
+    # Re-running the migration recomputes every snapshot from stock_move_line.
+    cursor.execute(load_migration_sql(SNAPSHOT_TRIGGER_SQL))
+    assert _snapshots(cursor) == expected
@@ -243,6 +243,18 @@ def test_admin_can_bulk_update_user_status(client, session):
     for user_id in [user1.id, user2.id, user3.id]:
         assert session.get(User, user_id).is_active is False
 
+def test_deactivated_user_token_stops_working_at_once(client, session):
+    """Ensure a token already in the auth cache is rejected once its user is deactivated"""
+    headers, _ = get_admin_headers(client, session)
+    user = create_user_in_db(session, "User E", "e@example.com", "pass", is_active=True)
+    user_headers = get_auth_headers(get_token_for_user(client, user.email, "pass"))
+    assert client.get("/auth/profile", headers=user_headers).status_code == 200
+
+    client.put("/users/bulk-status", json={"ids": [user.id], "is_active": False}, headers=headers)
+
+    assert client.get("/auth/profile", headers=user_headers).status_code == 403
+
+
 def test_regular_user_cannot_bulk_update_users(client, session):
     """Ensure non-admin users cannot perform bulk status update"""
     user = create_user_in_db(session, "User D", "d@example.com", "pass")
@@ -1,3 +1,5 @@
+import asyncio
+import json
 from datetime import timedelta
 from unittest.mock import AsyncMock
 from app.utils.authentication import create_access_token, ACCESS_TOKEN_DURATION
@@ -35,6 +37,47 @@ def test_inactive_user_cannot_connect_websocket(client, session):
             ws.send_text(token)
             ws.receive_text()
 
+async def _drain():
+    """Lets the sender tasks flush their queues."""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+async def _disconnect_all(manager):
+    senders = [connection.sender for connection in manager.active_connections.values()]
+    for websocket in list(manager.active_connections):
+        manager.disconnect(websocket)
+    await asyncio.gather(*senders, return_exceptions=True)
+
+
+def _event(move_id=None, count=1, move_types=("incoming",), stock=((1, 10, "L1", 5), (2, 20, "L2", 0))):
+    """A `movements_recorded` bus event, as published by the stock movement service."""
+    return {
+        "type": "movements_recorded",
+        "move_id": move_id,
+        "count": count,
+        "move_types": list(move_types),
+        "warehouse_ids": [1, 2],
+        "product_ids": [10, 20],
+        "stock": None if stock is None else [list(level) for level in stock],
+    }
+
+
+def _sent(ws):
+    return [call.args[0] for call in ws.send_text.call_args_list]
+
+
+def _stuck_websocket():
+    """A client whose sends never complete (e.g. a tablet on a bad Wi-Fi link)."""
+
+    async def never_sent(message):
+        await asyncio.Event().wait()
+
+    ws = AsyncMock()
+    ws.send_text.side_effect = never_sent
+    return ws
+
+
 @pytest.mark.asyncio
 async def test_broadcast_removes_dead_connections_and_delivers_to_live_ones():
     manager = ConnectionManager()
@@ -43,10 +86,163 @@ async def test_broadcast_removes_dead_connections_and_delivers_to_live_ones():
     dead_ws = AsyncMock()
     dead_ws.send_text.side_effect = Exception("Connection lost")
 
-    manager.active_connections = [dead_ws, good_ws]
+    manager.authorize(dead_ws)
+    manager.authorize(good_ws)
 
-    await manager.broadcast("hello")
+    manager.broadcast("hello")
+    await _drain()
 
     good_ws.send_text.assert_called_once_with("hello")
     assert good_ws in manager.active_connections
-    assert dead_ws not in manager.active_connections
\ No newline at end of file
+    assert dead_ws not in manager.active_connections
+
+    await _disconnect_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_slow_client_does_not_delay_the_others():
+    manager = ConnectionManager(queue_size=2, slow_consumer_policy="drop")
+    slow_ws, fast_ws = _stuck_websocket(), AsyncMock()
+    slow = manager.authorize(slow_ws)
+    manager.authorize(fast_ws)
+
+    for i in range(5):
+        manager.broadcast(f"m{i}")  # returns without waiting for any send
+        await _drain()
+
+    assert [call.args[0] for call in fast_ws.send_text.call_args_list] == ["m0", "m1", "m2", "m3", "m4"]
+    # m0 is stuck in send_text; of m1..m4 only the two most recent are kept.
+    assert slow_ws in manager.active_connections
+    assert list(slow.queue._queue) == ["m3", "m4"]
+    assert slow.dropped == 2
+
+    await _disconnect_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_slow_client_is_disconnected_with_disconnect_policy():
+    manager = ConnectionManager(queue_size=1, slow_consumer_policy="disconnect")
+    slow_ws = _stuck_websocket()
+    manager.authorize(slow_ws)
+
+    for i in range(3):
+        manager.broadcast(f"m{i}")
+    await _drain()
+
+    assert slow_ws not in manager.active_connections
+    slow_ws.close.assert_awaited_once_with(code=1013)
+
+
+@pytest.mark.asyncio
+async def test_send_timeout_closes_the_connection():
+    manager = ConnectionManager(send_timeout=0.01)
+    stuck_ws = _stuck_websocket()
+    manager.authorize(stuck_ws)
+
+    manager.broadcast("hello")
+    await asyncio.sleep(0.05)
+
+    assert stuck_ws not in manager.active_connections
+    stuck_ws.close.assert_awaited_once_with(code=1013)
+
+
+@pytest.mark.asyncio
+async def test_recorded_movements_are_broadcast_to_this_workers_clients(monkeypatch):
+    from app.routers import websocket
+
+    manager = ConnectionManager()
+    client_ws = AsyncMock()
+    manager.authorize(client_ws)
+    monkeypatch.setattr(websocket, "manager", manager)
+
+    websocket.on_movements_recorded(_event(move_id=7))
+    websocket.on_movements_recorded(_event(count=3, move_types=["incoming", "outgoing"]))
+    await _drain()
+
+    assert [call.args[0] for call in client_ws.send_text.call_args_list] == [
+        "New stock movement recorded: 7 (incoming)",
+        "New stock movements recorded: 3 (batch)",
+    ]
+
+    await _disconnect_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_subscribed_clients_get_filtered_json_deltas():
+    manager = ConnectionManager()
+    plain_ws, warehouse_ws, outgoing_ws, product_ws = AsyncMock(), AsyncMock(), AsyncMock(), AsyncMock()
+    manager.authorize(plain_ws)
+    for ws in (warehouse_ws, outgoing_ws, product_ws):
+        manager.authorize(ws)
+    manager.receive(warehouse_ws, '{"action": "subscribe", "warehouse_ids": [2]}')
+    manager.receive(outgoing_ws, '{"action": "subscribe", "move_types": ["outgoing"]}')
+    manager.receive(product_ws, '{"action": "subscribe", "product_ids": [99]}')
+    await _drain()
+
+    manager.broadcast_movements(_event(move_id=7))
+    await _drain()
+
+    assert _sent(plain_ws) == ["New stock movement recorded: 7 (incoming)"]
+    assert json.loads(_sent(warehouse_ws)[0]) == {"type": "subscribed", "warehouse_ids": [2], "product_ids": [], "move_types": []}
+    assert json.loads(_sent(warehouse_ws)[1]) == {
+        "type": "stock_delta",
+        "move_id": 7,
+        "count": 1,
+        "move_types": ["incoming"],
+        "stock": [{"warehouse_id": 2, "product_id": 20, "lot": "L2", "quantity": 0}],
+    }
+    assert len(_sent(outgoing_ws)) == 1  # only the "subscribed" acknowledgement
+    assert len(_sent(product_ws)) == 1
+
+    await _disconnect_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_subscribed_clients_are_told_to_refetch_large_changes():
+    manager = ConnectionManager()
+    matching_ws, other_ws = AsyncMock(), AsyncMock()
+    manager.authorize(matching_ws)
+    manager.authorize(other_ws)
+    manager.receive(matching_ws, '{"action": "subscribe", "warehouse_ids": [1]}')
+    manager.receive(other_ws, '{"action": "subscribe", "warehouse_ids": [3]}')
+
+    manager.broadcast_movements(_event(count=500, stock=None))
+    await _drain()
+
+    delta = json.loads(_sent(matching_ws)[-1])
+    assert (delta["type"], delta["count"], delta["stock"]) == ("stock_delta", 500, None)
+    assert len(_sent(other_ws)) == 1
+
+    await _disconnect_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_invalid_subscription_is_reported():
+    manager = ConnectionManager()
+    ws = AsyncMock()
+    manager.authorize(ws)
+
+    manager.receive(ws, '{"action": "subscribe", "move_types": ["sideways"]}')
+    manager.receive(ws, "ping")
+    await _drain()
+
+    assert len(_sent(ws)) == 1
+    assert json.loads(_sent(ws)[0])["type"] == "error"
+    assert manager.active_connections[ws].subscription is None
+
+    await _disconnect_all(manager)
+
+
+def test_client_can_subscribe_over_websocket(client, session):
+    create_user_in_db(session, "User", "user@example.com", "pass123", is_active=True)
+    token = get_token_for_user(client, "user@example.com", "pass123")
+
+    with client.websocket_connect("/ws/stock-moves") as ws:
+        ws.send_text(token)
+        ws.send_text('{"action": "subscribe", "warehouse_ids": [1, 2], "move_types": ["outgoing"]}')
+        assert ws.receive_json() == {
+            "type": "subscribed",
+            "warehouse_ids": [1, 2],
+            "product_ids": [],
+            "move_types": ["outgoing"],
+        }
@@ -1,8 +1,20 @@
 # This file contains reusable helper functions for testing authentication.
 
+from pathlib import Path
+
+import pytest
 from app.utils.authentication import hash_password
 from app.models.user import User
 
+# The db_init folder is not copied into the backend container.
+MIGRATIONS_DIR = Path(__file__).resolve().parents[3] / "db_init" / "migrations"
+ROLLUP_TRIGGER_SQL = MIGRATIONS_DIR / "003_stock_move_daily_rollup.sql"
+
+# For tests reading stock_move_daily_rollup, which conftest fills with the rollup triggers.
+requires_rollup_trigger = pytest.mark.skipif(
+    not ROLLUP_TRIGGER_SQL.exists(), reason="db_init/migrations is not available"
+)
+
 
 def create_user_in_db(session, name, email, password, role="user", is_active=True):
     """Inserts a user directly into the test database."""
@@ -41,3 +53,9 @@ def get_admin_headers(client, session, email="admin@example.com", password="admi
     admin = create_user_in_db(session, "Admin", email, password, role="admin")
     token = get_token_for_user(client, email, password)
     return get_auth_headers(token), admin
+
+
+def load_migration_sql(path):
+    """Returns a db_init migration without its own BEGIN/COMMIT."""
+    lines = path.read_text().splitlines()
+    return "\n".join(line for line in lines if line.strip() not in ("BEGIN;", "COMMIT;"))
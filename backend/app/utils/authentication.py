@@ -6,8 +6,9 @@ from datetime import (
 
 from jwt import DecodeError
 from app.utils.getenv import get_required_env
+# bcrypt runs in a bounded process pool; re-exported for the routers.
+from app.utils.password_hashing import hash_password, needs_rehash, verify_password  # noqa: F401
 from fastapi import HTTPException, status
-import bcrypt as _bcrypt  
 import jwt  
 from uuid import uuid4  # To generate unique identifiers for JWT tokens (jti)
 
@@ -21,15 +22,6 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_DURATION = int(get_required_env("ACCESS_TOKEN_DURATION", 30))  # 30 minutes
 REFRESH_TOKEN_DURATION = int(get_required_env("REFRESH_TOKEN_DURATION", 7))  # 7 days
 
-def hash_password(password: str) -> str:
-    """Generates a secure hash for the given password."""
-    return _bcrypt.hashpw(password.encode(), _bcrypt.gensalt()).decode()
-
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Checks if the entered password matches the stored hash."""
-    return _bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
-
 
 def create_access_token(data: dict, expires_delta: timedelta) -> str:
     """Creates a JWT access token with an expiration time."""
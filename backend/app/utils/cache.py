@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Iterable
+
+
+class TTLCache:
+    """Thread-safe in-process cache with a time-to-live and a maximum number of entries.
+
+    - Entries older than `ttl` seconds are treated as missing.
+    - When full, the least recently used entry is evicted.
+    - Entries can carry tags; `invalidate(tags)` drops every entry sharing one of them.
+    - Values and hit/miss counters are kept per worker process.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 128):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()  # key -> (expires_at, value, tags)
+        self._keys_by_tag: dict[Hashable, set] = {}
+        self._generation = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def generation(self) -> int:
+        """Token to pass to `set`, taken before computing the value."""
+        with self._lock:
+            return self._generation
+
+    def set(
+        self,
+        key,
+        value,
+        tags: Iterable[Hashable] = (),
+        generation: int | None = None,
+        ttl: float | None = None,
+    ) -> None:
+        """Stores `value` unless the cache was invalidated since `generation` was taken.
+
+        This keeps a value computed from data read before a write from being cached
+        after that write's invalidation. `ttl` shortens the entry's lifetime below
+        the cache's own (it is never lengthened).
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            tags = frozenset(tags)
+            self._entries[key] = (time.monotonic() + ttl, value, tags)
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, tags: Iterable[Hashable]) -> int:
+        """Drops the entries tagged with any of `tags`. Returns how many were dropped."""
+        with self._lock:
+            self._generation += 1
+            keys = set()
+            for tag in tags:
+                keys |= self._keys_by_tag.get(tag, set())
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._keys_by_tag.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _remove(self, key) -> None:
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
@@ -0,0 +1,217 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from typing import AsyncIterator, Literal, Optional, Sequence
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncResult
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.utils.getenv import get_required_env
+
+# Rows fetched from the server-side cursor, and encoded, at a time. Memory per export
+# stays around one batch whatever the size of the result.
+EXPORT_BATCH_ROWS = int(get_required_env("EXPORT_BATCH_ROWS", fallback="20000"))
+
+ColumnarFormat = Literal["arrow", "parquet"]
+TextFormat = Literal["csv", "ndjson"]
+
+MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+async def open_cursor(db: AsyncSession, statement) -> AsyncResult:
+    """Runs `statement` on a server-side cursor that is read EXPORT_BATCH_ROWS rows at a time."""
+    return await db.stream(statement.execution_options(yield_per=EXPORT_BATCH_ROWS))
+
+
+async def row_records(result: AsyncResult) -> AsyncIterator[list[dict]]:
+    """Batches of the cursor's rows as dicts keyed by column label."""
+    async for rows in result.partitions():
+        yield [row._asdict() for row in rows]
+
+
+def accepts_gzip(request: Request) -> bool:
+    return "gzip" in request.headers.get("accept-encoding", "").lower()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands over the bytes written since the last `take()`."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ColumnarWriter:
+    """Encodes row batches as an Arrow IPC stream or a Parquet file, chunk by chunk.
+
+    Each row batch becomes one Arrow record batch (one Parquet row group). The schema
+    fields must follow the order of the selected columns.
+    """
+
+    def __init__(self, schema: pa.Schema, format: ColumnarFormat):
+        self.schema = schema
+        self._sink = _ChunkSink()
+        if format == "parquet":
+            self._writer = pq.ParquetWriter(self._sink, schema, compression="zstd")
+        else:
+            self._writer = pa.ipc.new_stream(self._sink, schema)
+
+    def write(self, rows) -> bytes:
+        columns = list(zip(*rows))
+        batch = pa.record_batch(
+            [pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema,
+        )
+        self._writer.write_batch(batch)
+        return self._sink.take()
+
+    def close(self) -> bytes:
+        """Writes the end of the stream (Arrow) or the footer (Parquet)."""
+        self._writer.close()
+        return self._sink.take()
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class TextWriter:
+    """Encodes batches of dict records as CSV (with a header line) or NDJSON, optionally gzipped.
+
+    - CSV columns are `fieldnames`; dates are written in ISO format and None as an empty cell.
+    - The gzip stream is flushed after every batch, so each chunk can be decoded on arrival.
+    """
+
+    def __init__(self, format: TextFormat, fieldnames: Sequence[str] = (), compress: bool = False):
+        self.format = format
+        self.fieldnames = list(fieldnames)
+        self._compressor = zlib.compressobj(wbits=31) if compress else None  # 31 = gzip container
+        self._header_written = False
+
+    def write(self, records: list[dict]) -> bytes:
+        buffer = io.StringIO()
+        if self.format == "csv":
+            writer = csv.DictWriter(buffer, fieldnames=self.fieldnames, extrasaction="ignore")
+            if not self._header_written:
+                writer.writeheader()
+                self._header_written = True
+            writer.writerows(
+                {
+                    key: value.isoformat() if isinstance(value, (date, datetime)) else value
+                    for key, value in record.items()
+                }
+                for record in records
+            )
+        else:
+            for record in records:
+                buffer.write(json.dumps(record, default=_json_default, separators=(",", ":")))
+                buffer.write("\n")
+        data = buffer.getvalue().encode()
+        if self._compressor is not None:
+            data = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return data
+
+    def close(self) -> bytes:
+        """Writes the CSV header if no batch came, and the end of the gzip stream."""
+        data = self.write([]) if self.format == "csv" and not self._header_written else b""
+        if self._compressor is not None:
+            data += self._compressor.flush()
+        return data
+
+
+def _export_response(
+    result: AsyncResult,
+    batches: AsyncIterator,
+    writer,
+    media_type: str,
+    filename: str,
+    headers: Optional[dict] = None,
+) -> StreamingResponse:
+    """Streams `batches` through `writer`, encoding each batch in the thread pool.
+
+    The cursor is closed when the export ends or the client goes away.
+    """
+
+    async def body() -> AsyncIterator[bytes]:
+        try:
+            async for batch in batches:
+                chunk = await run_in_threadpool(writer.write, batch)
+                if chunk:
+                    yield chunk
+            yield await run_in_threadpool(writer.close)
+        finally:
+            await result.close()
+
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', **(headers or {})},
+    )
+
+
+def columnar_export(
+    result: AsyncResult, schema: pa.Schema, format: ColumnarFormat, filename: str
+) -> StreamingResponse:
+    """Streams a server-side cursor result as an Arrow IPC stream or a Parquet file."""
+    return _export_response(
+        result,
+        result.partitions(),
+        ColumnarWriter(schema, format),
+        MEDIA_TYPES[format],
+        f"{filename}.{format}",
+    )
+
+
+def text_export(
+    result: AsyncResult,
+    format: TextFormat,
+    filename: str,
+    fieldnames: Sequence[str] = (),
+    compress: bool = False,
+    records: Optional[AsyncIterator[list[dict]]] = None,
+) -> StreamingResponse:
+    """Streams a server-side cursor result as CSV or NDJSON.
+
+    `records` replaces the default one-record-per-row batches (see `row_records`).
+    With `compress`, the body is gzipped on the fly and sent with `Content-Encoding: gzip`.
+    """
+    headers = {"Vary": "Accept-Encoding"}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return _export_response(
+        result,
+        records if records is not None else row_records(result),
+        TextWriter(format, fieldnames, compress),
+        MEDIA_TYPES[format],
+        f"{filename}.{format}",
+        headers,
+    )
@@ -0,0 +1,36 @@
+import threading
+
+
+class WaitTimeStats:
+    """Thread-safe counters of wait times, grouped by a label (e.g. "sync" / "async" engine).
+
+    Values are kept per worker process since startup.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict] = {}
+
+    def observe(self, label: str, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(
+                label, {"count": 0, "timeouts": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+            )
+            stats["count"] += 1
+            stats["timeouts"] += int(timed_out)
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def snapshot(self, label: str) -> dict:
+        with self._lock:
+            stats = dict(
+                self._stats.get(
+                    label, {"count": 0, "timeouts": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+                )
+            )
+        stats["avg_seconds"] = stats["total_seconds"] / stats["count"] if stats["count"] else 0.0
+        return stats
+
+
+# Time spent waiting for a connection from the SQLAlchemy pools (see app/models/database.py).
+pool_checkout_wait = WaitTimeStats()
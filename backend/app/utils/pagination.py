@@ -0,0 +1,101 @@
+import base64
+import json
+from datetime import datetime
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, func, select
+
+
+def count_rows(db: Session, statement) -> int:
+    """Exact number of rows `statement` returns, using a COUNT over a subquery."""
+    return db.exec(
+        select(func.count()).select_from(statement.order_by(None).subquery())
+    ).one()
+
+
+def estimate_rows(db: Session, statement) -> int:
+    """Planner estimate of the number of rows `statement` returns.
+
+    Reads the top-level "Plan Rows" of EXPLAIN, which for an unfiltered table
+    comes straight from pg_class.reltuples. It costs a plan, not a scan, but
+    it can be far off for selective filters, so it is only meant for large
+    unfiltered listings where an approximate page count is good enough.
+    """
+    compiled = statement.order_by(None).compile(dialect=db.get_bind().dialect)
+    params = compiled.params
+    if compiled.positiontup is not None:
+        # Positional drivers (asyncpg: $1, $2...) take a tuple, not a dict.
+        params = tuple(params[name] for name in compiled.positiontup)
+    plan = (
+        db.connection()
+        .exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", params)
+        .scalar()
+    )
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def paginate(
+    db: Session,
+    statement,
+    limit: int,
+    offset: int,
+    include_total: bool = True,
+    estimate_total: bool = False,
+) -> tuple[list, int | None]:
+    """Fetches one page of `statement` together with its total row count.
+
+    The exact total is read from a `COUNT(*) OVER()` column computed in the same
+    query as the page, so the listing is executed once instead of twice.
+    - `include_total=False` skips counting and returns None as the total.
+    - `estimate_total=True` returns the planner estimate (see `estimate_rows`).
+
+    Rows are returned in the same shape `db.exec(statement).all()` would give.
+    """
+    page = statement.limit(limit).offset(offset)
+
+    if not include_total or estimate_total:
+        rows = db.exec(page).all()
+        total = estimate_rows(db, statement) if include_total else None
+        return rows, total
+
+    width = len(statement.column_descriptions)
+    counted = page.add_columns(func.count().over().label("total_count"))
+
+    # SQLAlchemy's `Session.execute` rather than sqlmodel's `exec` (which would return only
+    # the first column of single-entity selects, dropping the window count) or its
+    # deprecated `execute` wrapper.
+    frozen = OrmSession.execute(db, counted).freeze()
+    counted_rows = frozen().all()
+
+    if counted_rows:
+        total = counted_rows[0].total_count
+    elif offset:
+        # Past the last page the window has no row to report the total on.
+        total = count_rows(db, statement)
+    else:
+        total = 0
+
+    result = frozen().columns(*range(width))
+    rows = result.scalars().all() if width == 1 else result.all()
+    return rows, total
+
+
+def encode_history_cursor(created_at: datetime, move_id: int, line_id: int) -> str:
+    """Encodes the position of a stock history row as an opaque, URL-safe cursor."""
+    raw = json.dumps([created_at.isoformat(), move_id, line_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_history_cursor(cursor: str) -> tuple[datetime, int, int]:
+    """Decodes a cursor created by encode_history_cursor.
+
+    Raises 400 if the cursor has been tampered with or is not a history cursor.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, move_id, line_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(move_id), int(line_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor."
+        )
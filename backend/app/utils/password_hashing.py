@@ -0,0 +1,113 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Callable, Optional
+import bcrypt as _bcrypt
+from fastapi import HTTPException, status
+from app.utils.getenv import get_required_env
+
+# bcrypt runs in a pool of PASSWORD_HASH_WORKERS processes per API worker, so a burst of
+# logins uses those CPUs instead of the request threads. At most PASSWORD_HASH_MAX_PENDING
+# hashes (running or queued) are accepted; beyond that requests get a 503 with Retry-After.
+# Keep it below AnyIO's 40 threads: each pending hash holds one while it waits.
+BCRYPT_ROUNDS = int(get_required_env("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(get_required_env("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(get_required_env("PASSWORD_HASH_MAX_PENDING", "16"))
+PASSWORD_HASH_RETRY_AFTER = int(get_required_env("PASSWORD_HASH_RETRY_AFTER_SECONDS", "1"))
+
+
+class PasswordHashPool:
+    """Bounded process pool for bcrypt.
+
+    - `run` blocks the calling thread until the result is ready; use it from sync routes.
+    - When `max_pending` calls are already running or queued, it raises a 503 right away.
+    - Processes are started with "spawn" (forking a threaded server is unsafe) on first use,
+      or by `start()`, and live as long as the API worker.
+    """
+
+    def __init__(self, workers: int, max_pending: int, retry_after: int = 1):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+
+    def start(self) -> None:
+        """Starts the processes now rather than on the first password check."""
+        executor = self._get_executor()
+        for _ in range(self.workers):
+            executor.submit(int)
+
+    def run(self, fn: Callable, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many password checks in progress. Please retry shortly.",
+                    headers={"Retry-After": str(self.retry_after)},
+                )
+            self._pending += 1
+        try:
+            executor = self._get_executor()
+            return executor.submit(fn, *args).result()
+        except BrokenProcessPool:
+            # A pool process died (e.g. killed by the OOM killer): start a new pool next time,
+            # unless another failed call already replaced this one.
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Password hashing is restarting. Please retry shortly.",
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    @property
+    def busy(self) -> bool:
+        """True when every process has a hash running or queued."""
+        with self._lock:
+            return self._pending >= self.workers
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=get_context("spawn")
+                )
+            return self._executor
+
+
+# One pool per API worker process.
+password_hash_pool = PasswordHashPool(
+    PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_RETRY_AFTER
+)
+
+
+def hash_password(password: str) -> str:
+    """bcrypt hash of `password` with BCRYPT_ROUNDS, computed in the pool."""
+    return password_hash_pool.run(_bcrypt.hashpw, password.encode(), _bcrypt.gensalt(BCRYPT_ROUNDS)).decode()
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """True if the hash wasn't made with BCRYPT_ROUNDS (format `$2b$<cost>$<salt+hash>`)."""
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Checks `plain_password` against a bcrypt hash, in the pool."""
+    return password_hash_pool.run(_bcrypt.checkpw, plain_password.encode(), hashed_password.encode())
@@ -0,0 +1,80 @@
+import json
+import logging
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+
+logger = logging.getLogger("app.slow_query")
+
+# ASGI scope of the request being served. FastAPI adds the matched route to the
+# same scope dict during routing, so the route template is known by query time.
+_request_scope: ContextVar[dict | None] = ContextVar("request_scope", default=None)
+
+# Statements are truncated in the log; parameters are never logged (they may hold personal data).
+MAX_STATEMENT_LENGTH = 2000
+
+
+class RequestContextMiddleware:
+    """Pure ASGI middleware that makes the current request visible to the slow-query log."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+        token = _request_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_scope.reset(token)
+
+
+def current_route() -> str | None:
+    """`METHOD /route/{template}` of the request being served, or None outside a request."""
+    scope = _request_scope.get()
+    if scope is None:
+        return None
+    path = getattr(scope.get("route"), "path", None) or scope.get("path")
+    return f"{scope.get('method', 'WS')} {path}"
+
+
+class SlowQueryLog:
+    """Logs statements slower than `threshold_ms` as one JSON object per line.
+
+    Fields: duration_ms, rows (cursor rowcount, -1 if the driver does not know it),
+    route (None for queries outside a request, e.g. background tasks) and statement.
+    """
+
+    def __init__(self, threshold_ms: float):
+        self.threshold_ms = threshold_ms
+
+    def attach(self, engine) -> None:
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+
+    def detach(self, engine) -> None:
+        event.remove(engine, "before_cursor_execute", self._before)
+        event.remove(engine, "after_cursor_execute", self._after)
+
+    # The start time is kept on the execution context (one per statement), so a
+    # statement that fails before after_cursor_execute leaves nothing behind.
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        context._slow_query_start = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        duration_ms = (time.perf_counter() - context._slow_query_start) * 1000
+        if duration_ms < self.threshold_ms:
+            return
+        logger.warning(
+            "slow query %s",
+            json.dumps(
+                {
+                    "duration_ms": round(duration_ms, 1),
+                    "rows": cursor.rowcount,
+                    "route": current_route(),
+                    "executemany": executemany,
+                    "statement": statement[:MAX_STATEMENT_LENGTH],
+                }
+            ),
+        )
@@ -0,0 +1,104 @@
+"""
+Per-request cost of authenticating a bearer token, with and without the auth cache.
+
+Calls the `get_current_user` and `get_current_user_async` dependencies directly,
+`--requests` times each, for one token of an existing user:
+
+- "db": the cache is emptied before every call, so each one decodes the JWT,
+  looks up the revoked tokens and loads the user (the behaviour without cache);
+- "cached": the token was verified once, later calls are cache hits.
+
+    DATABASE_URL=postgresql://... SECRET_KEY=... \\
+        python benchmarks/auth_cache.py --email admin@example.com --password ...
+
+Run it from backend/ against the database the token's user lives in. The
+database round trips dominate the "db" figures, so run it on the same network
+as production for representative numbers.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlmodel import Session, select  # noqa: E402
+from sqlmodel.ext.asyncio.session import AsyncSession  # noqa: E402
+
+from app.dependencies import get_current_user, get_current_user_async  # noqa: E402
+from app.models.database import async_engine, engine  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services.auth_cache import token_cache  # noqa: E402
+from app.utils.authentication import (  # noqa: E402
+    ACCESS_TOKEN_DURATION,
+    create_access_token,
+    verify_password,
+)
+
+
+def _report(label: str, latencies: list[float]) -> None:
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{label:<14} p50 {quantiles[49] * 1e6:8.1f} us   p99 {quantiles[98] * 1e6:8.1f} us"
+        f"   mean {statistics.fmean(latencies) * 1e6:8.1f} us"
+    )
+
+
+def _time_sync(token: str, requests: int, cached: bool) -> list[float]:
+    latencies = []
+    with Session(engine) as db:
+        for _ in range(requests):
+            if not cached:
+                token_cache.clear()
+            start = time.perf_counter()
+            get_current_user(token, db)
+            latencies.append(time.perf_counter() - start)
+            db.expunge_all()
+    return latencies
+
+
+async def _time_async(token: str, requests: int, cached: bool) -> list[float]:
+    latencies = []
+    async with AsyncSession(async_engine, expire_on_commit=False) as db:
+        for _ in range(requests):
+            if not cached:
+                token_cache.clear()
+            start = time.perf_counter()
+            await get_current_user_async(token, db)
+            latencies.append(time.perf_counter() - start)
+            db.expunge_all()
+    return latencies
+
+
+async def _run_async(token: str, requests: int) -> None:
+    for label, cached in (("async db", False), ("async cached", True)):
+        await _time_async(token, 50, cached)
+        _report(label, await _time_async(token, requests, cached))
+    await async_engine.dispose()
+
+
+def main(args) -> int:
+    with Session(engine) as db:
+        user = db.exec(select(User).where(User.email == args.email)).first()
+        if user is None or not verify_password(args.password, user.password):
+            print("Unknown user or wrong password", file=sys.stderr)
+            return 1
+        token = create_access_token({"sub": str(user.id)}, timedelta(minutes=ACCESS_TOKEN_DURATION))
+
+    for label, cached in (("sync db", False), ("sync cached", True)):
+        _time_sync(token, 50, cached)  # warm up the pool and the cache
+        _report(label, _time_sync(token, args.requests, cached))
+    asyncio.run(_run_async(token, args.requests))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--requests", type=int, default=5000)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,106 @@
+"""
+Login burst benchmark ("shift change").
+
+Keeps `--concurrency` POST /auth/login requests in flight against a running
+backend until `--logins` have succeeded, and meanwhile reads `--read-path` one
+request at a time with an already issued token. A login turned away with 503
+(bcrypt queue full, see PASSWORD_HASH_MAX_PENDING) is retried after its
+Retry-After, as the frontend would. It reports login throughput, how many 503s
+were received, and the read latency before and during the burst:
+
+    uvicorn app.main:app --workers 1 --port 8000
+    python benchmarks/login_throughput.py --email admin@example.com --password ... \\
+        --concurrency 100 --logins 1000
+
+Every login uses the same account, so the figures are bcrypt's, not the
+database's. Throughput is bounded by PASSWORD_HASH_WORKERS processes (and the
+CPUs behind them) at the cost set by BCRYPT_ROUNDS.
+
+Only httpx is needed (already in requirements.txt).
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def _percentiles(latencies: list[float]) -> str:
+    if len(latencies) < 2:
+        return "n/a"
+    quantiles = statistics.quantiles(latencies, n=100)
+    return f"p50 {quantiles[49] * 1000:7.1f} ms  p99 {quantiles[98] * 1000:7.1f} ms"
+
+
+async def _login(client: httpx.AsyncClient, email: str, password: str) -> httpx.Response:
+    return await client.post("/auth/login", data={"username": email, "password": password})
+
+
+async def _read_until(client: httpx.AsyncClient, path: str, headers: dict, stop: asyncio.Event) -> list[float]:
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get(path, headers=headers)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def main(args) -> None:
+    limits = httpx.Limits(max_connections=args.concurrency + 10)
+    async with httpx.AsyncClient(base_url=args.url, timeout=120, limits=limits) as client:
+        response = await _login(client, args.email, args.password)
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        # Read latency with no login traffic.
+        stop = asyncio.Event()
+        reader = asyncio.create_task(_read_until(client, args.read_path, headers, stop))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        idle_reads = await reader
+
+        statuses: dict[int, int] = {}
+        login_latencies: list[float] = []
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one_login():
+            async with semaphore:
+                start = time.perf_counter()
+                while True:
+                    response = await _login(client, args.email, args.password)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                    if response.status_code != 503:
+                        break
+                    await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+                if response.status_code == 200:
+                    login_latencies.append(time.perf_counter() - start)
+
+        stop = asyncio.Event()
+        reader = asyncio.create_task(_read_until(client, args.read_path, headers, stop))
+        start = time.perf_counter()
+        await asyncio.gather(*(one_login() for _ in range(args.logins)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        burst_reads = await reader
+
+    succeeded = statuses.get(200, 0)
+    print(f"{args.logins} logins, {args.concurrency} in flight: {elapsed:.1f}s, {succeeded / elapsed:.1f} successful logins/s")
+    print(f"  status codes: {dict(sorted(statuses.items()))}")
+    print(f"  login latency (200 only, retries included): {_percentiles(login_latencies)}")
+    print(f"{args.read_path} idle:        {_percentiles(idle_reads)}  ({len(idle_reads)} reads)")
+    print(f"{args.read_path} during burst: {_percentiles(burst_reads)}  ({len(burst_reads)} reads)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--logins", type=int, default=1000)
+    parser.add_argument("--read-path", default="/stock/")
+    parser.add_argument("--baseline-seconds", type=float, default=3.0)
+    asyncio.run(main(parser.parse_args()))
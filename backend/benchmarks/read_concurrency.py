@@ -0,0 +1,100 @@
+"""
+Concurrency benchmark for the read endpoints.
+
+Keeps `--concurrency` requests in flight against a running backend and reports
+throughput and latency percentiles per path. Run it against a single worker to
+see how many in-flight reads one process sustains, e.g.:
+
+    uvicorn app.main:app --workers 1 --port 8000
+    python benchmarks/read_concurrency.py --email admin@example.com --password ... \\
+        --concurrency 500 --requests 5000 /stock/ /stock/history /stock-movements/
+
+The async routes (`/stock/*`, `/stock-movements/*` reads) wait on asyncpg without
+holding a thread; the sync routes (e.g. `/warehouses/`) are capped by AnyIO's
+threadpool (40 threads by default), which shows up as queueing in the p95/p99.
+
+Only httpx is needed (already in requirements.txt).
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def _login(client: httpx.AsyncClient, email: str, password: str) -> str:
+    response = await client.post("/auth/login", data={"username": email, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def _run_path(client: httpx.AsyncClient, path: str, concurrency: int, total: int):
+    """Sends `total` GETs to `path`, never more than `concurrency` at a time."""
+    latencies: list[float] = []
+    errors = 0
+    in_flight = 0
+    peak_in_flight = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors, in_flight, peak_in_flight
+        async with semaphore:
+            in_flight += 1
+            peak_in_flight = max(peak_in_flight, in_flight)
+            start = time.perf_counter()
+            try:
+                response = await client.get(path)
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            finally:
+                latencies.append(time.perf_counter() - start)
+                in_flight -= 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "path": path,
+        "requests": total,
+        "errors": errors,
+        "peak_in_flight": peak_in_flight,
+        "req_per_s": total / elapsed,
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+    }
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        token = args.token or await _login(client, args.email, args.password)
+        client.headers["Authorization"] = f"Bearer {token}"
+
+        print(f"{'path':40} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'in-flight':>9} {'errors':>7}")
+        for path in args.paths:
+            r = await _run_path(client, path, args.concurrency, args.requests)
+            print(
+                f"{r['path']:40} {r['req_per_s']:9.0f} {r['p50_ms']:9.1f} {r['p95_ms']:9.1f} "
+                f"{r['p99_ms']:9.1f} {r['peak_in_flight']:9d} {r['errors']:7d}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", default=["/stock/", "/stock/history", "/stock-movements/"])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--token", help="Access token (otherwise --email/--password are used to log in)")
+    parser.add_argument("--email")
+    parser.add_argument("--password")
+    parser.add_argument("--concurrency", type=int, default=500, help="Requests kept in flight")
+    parser.add_argument("--requests", type=int, default=5000, help="Requests per path")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    asyncio.run(main(parser.parse_args()))
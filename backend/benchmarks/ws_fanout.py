@@ -0,0 +1,173 @@
+"""
+Load test for the cluster-wide WebSocket fan-out of /ws/stock-moves.
+
+Starts `--workers` uvicorn workers (or uses a running backend with `--no-spawn`),
+connects `--clients` WebSocket clients, which the kernel spreads across the
+workers, then creates `--movements` stock movements over REST, one at a time.
+For every movement it checks that all clients received the notification and
+reports the delivery latency, measured from just before the POST to the
+moment each client receives the message:
+
+    python benchmarks/ws_fanout.py --email admin@example.com --password ... \\
+        --warehouse-id 1 --product-id 1 --workers 4 --clients 5000
+
+Each movement is an incoming line of quantity 1, so run it against a
+disposable database. All clients live in this one process: above a few
+thousand clients, its own CPU time receiving the messages is part of the
+measured latency (compare p50 with a run at lower `--clients`). Raise the
+open-file limit first (`ulimit -n 20000`).
+
+Needs httpx and websockets (both in requirements.txt). Exits with status 1 if
+any client missed a movement.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+import websockets
+
+
+async def _login(client: httpx.AsyncClient, email: str, password: str) -> str:
+    response = await client.post("/auth/login", data={"username": email, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def _wait_for_server(base_url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while True:
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{base_url} did not start within {timeout}s")
+            await asyncio.sleep(0.2)
+
+
+class Client:
+    """One WebSocket client; records when each movement ID reached it."""
+
+    def __init__(self):
+        self.received: dict[int, float] = {}
+        self.websocket = None
+
+    async def connect(self, ws_url: str, token: str) -> None:
+        self.websocket = await websockets.connect(ws_url, open_timeout=60, max_queue=None)
+        await self.websocket.send(token)
+
+    async def receive(self) -> None:
+        async for message in self.websocket:
+            # "New stock movement recorded: <id> (<move_type>)"
+            if message.startswith("New stock movement recorded: "):
+                move_id = int(message.split(": ", 1)[1].split(" ", 1)[0])
+                self.received[move_id] = time.perf_counter()
+
+
+async def main(args) -> int:
+    base_url = f"http://{args.host}:{args.port}"
+    ws_url = f"ws://{args.host}:{args.port}/ws/stock-moves"
+    server = None
+    if not args.no_spawn:
+        server = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "app.main:app",
+                "--host", args.host, "--port", str(args.port),
+                "--workers", str(args.workers), "--log-level", "warning",
+            ],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+    try:
+        await _wait_for_server(base_url, timeout=60)
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as http:
+            token = args.token or await _login(http, args.email, args.password)
+            http.headers["Authorization"] = f"Bearer {token}"
+
+            clients = [Client() for _ in range(args.clients)]
+            handshakes = asyncio.Semaphore(args.connect_concurrency)
+
+            async def connect(client: Client):
+                async with handshakes:
+                    await client.connect(ws_url, token)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(connect(client) for client in clients))
+            print(f"connected {len(clients)} clients in {time.perf_counter() - start:.1f}s")
+            receivers = [asyncio.create_task(client.receive()) for client in clients]
+            # Authentication happens on the first message; give the workers time to register everyone.
+            await asyncio.sleep(args.settle)
+
+            payload = {
+                "move_type": "incoming",
+                "lines": [{"warehouse_id": args.warehouse_id, "product_id": args.product_id, "quantity": 1}],
+            }
+            latencies: list[float] = []
+            missed = 0
+            print(f"{'move':>8} {'delivered':>10} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+            for _ in range(args.movements):
+                sent_at = time.perf_counter()
+                response = await http.post("/stock-movements/", json=payload)
+                response.raise_for_status()
+                move_id = response.json()["id"]
+
+                deadline = time.monotonic() + args.timeout
+                while time.monotonic() < deadline:
+                    if all(move_id in client.received for client in clients):
+                        break
+                    await asyncio.sleep(0.01)
+
+                arrivals = [c.received[move_id] - sent_at for c in clients if move_id in c.received]
+                missed += len(clients) - len(arrivals)
+                latencies.extend(arrivals)
+                if arrivals:
+                    quantiles = statistics.quantiles(arrivals, n=100) if len(arrivals) > 1 else arrivals * 99
+                    print(
+                        f"{move_id:8d} {len(arrivals):10d} {quantiles[49] * 1000:9.1f} "
+                        f"{quantiles[98] * 1000:9.1f} {max(arrivals) * 1000:9.1f}"
+                    )
+                else:
+                    print(f"{move_id:8d} {0:10d}")
+
+            for task in receivers:
+                task.cancel()
+            await asyncio.gather(*(client.websocket.close() for client in clients), return_exceptions=True)
+
+        if latencies:
+            quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+            print(
+                f"\n{args.clients} clients x {args.movements} movements on {args.workers} workers: "
+                f"p50 {quantiles[49] * 1000:.1f} ms, p95 {quantiles[94] * 1000:.1f} ms, "
+                f"p99 {quantiles[98] * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms, missed {missed}"
+            )
+        return 1 if missed else 0
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=4, help="uvicorn workers to start")
+    parser.add_argument("--no-spawn", action="store_true", help="Use a backend already listening on --port")
+    parser.add_argument("--token", help="Access token (otherwise --email/--password are used to log in)")
+    parser.add_argument("--email")
+    parser.add_argument("--password")
+    parser.add_argument("--warehouse-id", type=int, required=True)
+    parser.add_argument("--product-id", type=int, required=True)
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--movements", type=int, default=20)
+    parser.add_argument("--connect-concurrency", type=int, default=200, help="WebSocket handshakes in flight")
+    parser.add_argument("--settle", type=float, default=2.0, help="Seconds to wait after connecting")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for each movement")
+    sys.exit(asyncio.run(main(parser.parse_args())))
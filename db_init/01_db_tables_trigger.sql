@@ -59,6 +59,34 @@ CREATE TABLE stock_move_line (
     FOREIGN KEY (product_id) REFERENCES product(id)
 );
 
+-- STOCK MOVE IDEMPOTENCY KEYS
+-- Idempotency-Key sent with POST /stock-movements/ and the movement it created, per user.
+-- expires_at is indexed for the background purge of expired keys.
+CREATE TABLE stock_move_idempotency_key (
+    user_id INT NOT NULL REFERENCES "user"(id),
+    key VARCHAR(255) NOT NULL,
+    request_hash VARCHAR(64) NOT NULL,
+    move_id INT NOT NULL REFERENCES stock_move(id),
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, key)
+);
+CREATE INDEX ix_stock_move_idempotency_key_expires_at
+    ON stock_move_idempotency_key (expires_at);
+
+-- DAILY MOVEMENT ROLLUP
+-- Movements, lines and units per UTC day, user and move type, incremented by the
+-- trg_rollup_stock_moves and trg_rollup_stock_move_lines triggers (below).
+-- GET /stock-movements/last-year is served from it.
+CREATE TABLE stock_move_daily_rollup (
+    day DATE NOT NULL,
+    user_id INT NOT NULL REFERENCES "user"(id),
+    move_type VARCHAR(10) NOT NULL,
+    move_count INT NOT NULL DEFAULT 0,
+    line_count INT NOT NULL DEFAULT 0,
+    units INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user_id, move_type)
+);
+
 -- STOCK
 CREATE TABLE "stock" (
     warehouse_id INT REFERENCES warehouse(id) ON DELETE RESTRICT,
@@ -69,75 +97,262 @@ CREATE TABLE "stock" (
     PRIMARY KEY (warehouse_id, product_id, lot) 
 );
 
+-- DAILY STOCK SNAPSHOTS
+-- Quantity of a (warehouse, product, lot) at the end of each day (UTC) it moved, written by
+-- trg_update_stock_daily_snapshot (below). GET /stock/as-of reads the latest snapshot before
+-- the requested day and replays that day's lines.
+CREATE TABLE stock_daily_snapshot (
+    warehouse_id INT REFERENCES warehouse(id),
+    product_id INT REFERENCES product(id),
+    lot VARCHAR(50) DEFAULT 'NO_LOT',
+    snapshot_date DATE NOT NULL,
+    quantity INT NOT NULL,
+    PRIMARY KEY (warehouse_id, product_id, lot, snapshot_date)
+);
+
 
 -- CREATION OF THE FUNCTION update_stock()
+-- Statement-level trigger function: it runs once per INSERT on stock_move_line and
+-- works on all inserted lines at once through the "new_lines" transition table.
+-- Lines are aggregated per (warehouse, product, lot), so a 100-line movement costs a
+-- handful of set-based statements instead of up to four lookups per line.
 CREATE OR REPLACE FUNCTION update_stock() RETURNS TRIGGER AS $$
-DECLARE 
-    move_type_value VARCHAR(10);
-    move_user INT;
-    processed_lot VARCHAR(50);
+DECLARE
+    bad RECORD;
 BEGIN
-    -- Retrieve the move type and user who created the stock move
-    SELECT move_type, user_id INTO move_type_value, move_user 
-    FROM stock_move 
-    WHERE id = NEW.move_id;
+    -- Validate the lines in insertion order, as the per-row trigger did: the first line that
+    -- breaks a rule raises that rule's error. Each line is checked against the stock left by
+    -- the lines before it (the existing row plus this statement's earlier lines for the same
+    -- warehouse, product and lot).
+    SELECT * INTO bad
+    FROM (
+        SELECT l.move_id, l.line_id, l.warehouse_id, l.product_id, l.lot,
+               l.expiration_date, l.quantity, l.move_type,
+               -- A lot that is not in stock yet is created by its first incoming line.
+               s.lot IS NOT NULL OR COALESCE(l.incoming_before, FALSE) AS lot_exists,
+               CASE WHEN s.lot IS NULL THEN l.created_expiration ELSE s.expiration_date END AS lot_expiration,
+               COALESCE(s.quantity, 0) + COALESCE(l.net_before, 0) AS available
+        FROM (
+            SELECT nl.move_id, nl.line_id, nl.warehouse_id, nl.product_id,
+                   COALESCE(nl.lot, 'NO_LOT') AS lot, nl.expiration_date, nl.quantity, m.move_type,
+                   bool_or(m.move_type = 'incoming') OVER earlier AS incoming_before,
+                   (array_agg(nl.expiration_date) FILTER (WHERE m.move_type = 'incoming') OVER earlier)[1]
+                       AS created_expiration,
+                   SUM(CASE WHEN m.move_type = 'incoming' THEN nl.quantity ELSE -nl.quantity END)
+                       OVER earlier AS net_before
+            FROM new_lines nl
+            JOIN stock_move m ON m.id = nl.move_id
+            WINDOW earlier AS (
+                PARTITION BY nl.warehouse_id, nl.product_id, COALESCE(nl.lot, 'NO_LOT')
+                ORDER BY nl.move_id, nl.line_id
+                ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+            )
+        ) l
+        LEFT JOIN "stock" s
+               ON s.warehouse_id = l.warehouse_id
+              AND s.product_id = l.product_id
+              AND s.lot = l.lot
+    ) line
+    WHERE (line.lot = 'NO_LOT' AND line.expiration_date IS NOT NULL)
+       OR (line.lot <> 'NO_LOT' AND line.lot_exists AND line.lot_expiration <> line.expiration_date)
+       OR (line.move_type = 'outgoing' AND (NOT line.lot_exists OR line.available < line.quantity))
+    ORDER BY line.move_id, line.line_id
+    LIMIT 1;
 
-    -- If lot is not specified, assign 'NO_LOT'
-    processed_lot := COALESCE(NEW.lot, 'NO_LOT'); -- Replace NULL with 'NO_LOT'
-
-    -- If the lot is 'NO_LOT' but an expiration date is provided, raise exception
-    IF processed_lot = 'NO_LOT' AND NEW.expiration_date IS NOT NULL THEN
-        RAISE EXCEPTION 'Cannot assign an expiration date to a product with no lot';
+    IF FOUND THEN
+        -- Same order of checks as the per-row trigger for a single line.
+        -- If the lot is 'NO_LOT' (or not specified) but an expiration date is provided, raise exception
+        IF bad.lot = 'NO_LOT' AND bad.expiration_date IS NOT NULL THEN
+            RAISE EXCEPTION 'Cannot assign an expiration date to a product with no lot';
+        END IF;
+        -- If the lot exists but with a different expiration date, raise exception
+        IF bad.lot <> 'NO_LOT' AND bad.lot_exists AND bad.lot_expiration <> bad.expiration_date THEN
+            RAISE EXCEPTION 'Lot % already exists with a different expiration date', bad.lot;
+        END IF;
+        RAISE EXCEPTION 'Insufficient stock for product % in warehouse % with lot %',
+                        bad.product_id, bad.warehouse_id, bad.lot;
     END IF;
 
-    -- If the lot exists but with a different expiration date, raise exception
-    IF processed_lot <> 'NO_LOT' AND (
-        SELECT COUNT(*) FROM "stock" WHERE warehouse_id = NEW.warehouse_id 
-                                    AND product_id = NEW.product_id
-                                    AND lot = processed_lot
-                                    AND expiration_date <> NEW.expiration_date) > 0 THEN
-        RAISE EXCEPTION 'Lot % already exists with a different expiration date', processed_lot;
-    END IF;
+    -- Incoming movements: one upsert per (warehouse, product, lot)
+    INSERT INTO "stock" (warehouse_id, product_id, lot, expiration_date, quantity)
+    SELECT l.warehouse_id, l.product_id, COALESCE(l.lot, 'NO_LOT'),
+           (array_agg(l.expiration_date ORDER BY l.move_id, l.line_id))[1],
+           SUM(l.quantity)
+    FROM new_lines l
+    JOIN stock_move m ON m.id = l.move_id
+    WHERE m.move_type = 'incoming'
+    GROUP BY l.warehouse_id, l.product_id, COALESCE(l.lot, 'NO_LOT')
+    ON CONFLICT (warehouse_id, product_id, lot)
+    DO UPDATE SET quantity = "stock".quantity + EXCLUDED.quantity;
 
-    -- If it's an incoming movement, increase stock quantity
-    IF move_type_value = 'incoming' THEN
-        INSERT INTO "stock" (warehouse_id, product_id, lot, expiration_date, quantity)
-        VALUES (NEW.warehouse_id, NEW.product_id, processed_lot, NEW.expiration_date, NEW.quantity)
-        ON CONFLICT (warehouse_id, product_id, lot)
-        DO UPDATE SET quantity = "stock".quantity + NEW.quantity;
-
-    -- If it's an outgoing movement, decrease stock quantity
-    ELSIF move_type_value = 'outgoing' THEN
-
-        -- Check if there is enough stock before subtracting
-        IF (SELECT quantity FROM "stock" WHERE warehouse_id = NEW.warehouse_id 
-                                        AND product_id = NEW.product_id
-                                        AND lot = processed_lot) < NEW.quantity OR 
-           (SELECT COUNT(*) FROM "stock" WHERE warehouse_id = NEW.warehouse_id 
-                                        AND product_id = NEW.product_id
-                                        AND lot = processed_lot) = 0 THEN
-            RAISE EXCEPTION 'Insufficient stock for product % in warehouse % with lot %', 
-                            NEW.product_id, NEW.warehouse_id, processed_lot;
-        END IF;
+    -- Outgoing movements: one guarded update per (warehouse, product, lot).
+    -- The lines were checked above; the guard catches stock taken by a concurrent
+    -- transaction since then (the update waits for it and re-reads the row).
+    WITH needed AS (
+        SELECT l.warehouse_id, l.product_id, COALESCE(l.lot, 'NO_LOT') AS lot,
+               SUM(l.quantity) AS quantity
+        FROM new_lines l
+        JOIN stock_move m ON m.id = l.move_id
+        WHERE m.move_type = 'outgoing'
+        GROUP BY l.warehouse_id, l.product_id, COALESCE(l.lot, 'NO_LOT')
+    ),
+    updated AS (
+        UPDATE "stock" s
+        SET quantity = s.quantity - n.quantity
+        FROM needed n
+        WHERE s.warehouse_id = n.warehouse_id
+          AND s.product_id = n.product_id
+          AND s.lot = n.lot
+          AND s.quantity >= n.quantity
+        RETURNING s.warehouse_id, s.product_id, s.lot
+    )
+    SELECT n.warehouse_id, n.product_id, n.lot INTO bad
+    FROM needed n
+    WHERE NOT EXISTS (
+        SELECT 1 FROM updated u
+        WHERE u.warehouse_id = n.warehouse_id
+          AND u.product_id = n.product_id
+          AND u.lot = n.lot
+    )
+    LIMIT 1;
 
-        -- Subtract the quantity from stock
-        UPDATE "stock"
-        SET quantity = GREATEST(0, quantity - NEW.quantity)
-        WHERE warehouse_id = NEW.warehouse_id 
-          AND product_id = NEW.product_id
-          AND lot = processed_lot;
+    IF FOUND THEN
+        RAISE EXCEPTION 'Insufficient stock for product % in warehouse % with lot %',
+                        bad.product_id, bad.warehouse_id, bad.lot;
     END IF;
 
-    RETURN NEW;
+    RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
 -- CREATION OF THE TRIGGER
 CREATE TRIGGER trg_update_stock
 AFTER INSERT ON stock_move_line
-FOR EACH ROW
+REFERENCING NEW TABLE AS new_lines
+FOR EACH STATEMENT
 EXECUTE FUNCTION update_stock();
 
+-- CREATION OF THE FUNCTION update_stock_daily_snapshot()
+-- Statement-level trigger function keeping stock_daily_snapshot up to date. Its trigger is
+-- named after trg_update_stock, so it fires right after it on the same INSERT, once the
+-- stock rows of the lines are locked: movements on the same keys write their snapshots
+-- one after the other.
+-- Every snapshot from the first day of the new lines onwards is recomputed as the latest
+-- snapshot up to that day (before these lines) plus the new lines up to that day, so
+-- lines dated in the past also correct the later days.
+CREATE OR REPLACE FUNCTION update_stock_daily_snapshot() RETURNS TRIGGER AS $$
+BEGIN
+    WITH deltas AS (
+        SELECT l.warehouse_id, l.product_id, COALESCE(l.lot, 'NO_LOT') AS lot,
+               (m.created_at AT TIME ZONE 'UTC')::date AS snapshot_date,
+               SUM(CASE WHEN m.move_type = 'incoming' THEN l.quantity ELSE -l.quantity END) AS delta
+        FROM new_lines l
+        JOIN stock_move m ON m.id = l.move_id
+        GROUP BY 1, 2, 3, 4
+    ),
+    first_days AS (
+        SELECT warehouse_id, product_id, lot, MIN(snapshot_date) AS snapshot_date
+        FROM deltas
+        GROUP BY 1, 2, 3
+    ),
+    days AS (
+        SELECT warehouse_id, product_id, lot, snapshot_date FROM deltas
+        UNION
+        SELECT s.warehouse_id, s.product_id, s.lot, s.snapshot_date
+        FROM stock_daily_snapshot s
+        JOIN first_days f
+          ON f.warehouse_id = s.warehouse_id
+         AND f.product_id = s.product_id
+         AND f.lot = s.lot
+         AND s.snapshot_date > f.snapshot_date
+    )
+    INSERT INTO stock_daily_snapshot (warehouse_id, product_id, lot, snapshot_date, quantity)
+    SELECT d.warehouse_id, d.product_id, d.lot, d.snapshot_date,
+           COALESCE(previous.quantity, 0) + moved.quantity
+    FROM days d
+    LEFT JOIN LATERAL (
+        SELECT s.quantity
+        FROM stock_daily_snapshot s
+        WHERE s.warehouse_id = d.warehouse_id
+          AND s.product_id = d.product_id
+          AND s.lot = d.lot
+          AND s.snapshot_date <= d.snapshot_date
+        ORDER BY s.snapshot_date DESC
+        LIMIT 1
+    ) previous ON TRUE
+    CROSS JOIN LATERAL (
+        SELECT SUM(n.delta) AS quantity
+        FROM deltas n
+        WHERE n.warehouse_id = d.warehouse_id
+          AND n.product_id = d.product_id
+          AND n.lot = d.lot
+          AND n.snapshot_date <= d.snapshot_date
+    ) moved
+    ON CONFLICT (warehouse_id, product_id, lot, snapshot_date)
+    DO UPDATE SET quantity = EXCLUDED.quantity;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- CREATION OF THE TRIGGER
+CREATE TRIGGER trg_update_stock_daily_snapshot
+AFTER INSERT ON stock_move_line
+REFERENCING NEW TABLE AS new_lines
+FOR EACH STATEMENT
+EXECUTE FUNCTION update_stock_daily_snapshot();
+
+-- CREATION OF THE FUNCTIONS rollup_stock_moves() AND rollup_stock_move_lines()
+-- Statement-level trigger functions keeping stock_move_daily_rollup up to date: one adds the
+-- inserted movements, the other the inserted lines and their units, per UTC day, user and
+-- move type. Rows are upserted in key order, so concurrent movements of the same user wait
+-- on each other's rollup rows instead of deadlocking.
+CREATE OR REPLACE FUNCTION rollup_stock_moves() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO stock_move_daily_rollup (day, user_id, move_type, move_count, line_count, units)
+    SELECT (created_at AT TIME ZONE 'UTC')::date, user_id, move_type, COUNT(*), 0, 0
+    FROM new_moves
+    WHERE move_type IS NOT NULL AND created_at IS NOT NULL
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (day, user_id, move_type)
+    DO UPDATE SET move_count = stock_move_daily_rollup.move_count + EXCLUDED.move_count;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rollup_stock_move_lines() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO stock_move_daily_rollup (day, user_id, move_type, move_count, line_count, units)
+    SELECT (m.created_at AT TIME ZONE 'UTC')::date, m.user_id, m.move_type,
+           0, COUNT(*), SUM(l.quantity)
+    FROM new_lines l
+    JOIN stock_move m ON m.id = l.move_id
+    WHERE m.move_type IS NOT NULL AND m.created_at IS NOT NULL
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (day, user_id, move_type)
+    DO UPDATE SET line_count = stock_move_daily_rollup.line_count + EXCLUDED.line_count,
+                  units = stock_move_daily_rollup.units + EXCLUDED.units;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- CREATION OF THE TRIGGERS
+CREATE TRIGGER trg_rollup_stock_moves
+AFTER INSERT ON stock_move
+REFERENCING NEW TABLE AS new_moves
+FOR EACH STATEMENT
+EXECUTE FUNCTION rollup_stock_moves();
+
+CREATE TRIGGER trg_rollup_stock_move_lines
+AFTER INSERT ON stock_move_line
+REFERENCING NEW TABLE AS new_lines
+FOR EACH STATEMENT
+EXECUTE FUNCTION rollup_stock_move_lines();
+
 -- INDEXES
 -- These indexes cover the most frequently filtered and sorted columns across the API:
 --   - stock_move: filtered by user_id, move_type, and date range in GET /stock-movements/
@@ -150,6 +365,8 @@ EXECUTE FUNCTION update_stock();
 CREATE INDEX ix_stock_move_user_id    ON stock_move (user_id);
 CREATE INDEX ix_stock_move_created_at ON stock_move (created_at);
 CREATE INDEX ix_stock_move_move_type  ON stock_move (move_type);
+-- Matches the (created_at, id) DESC order used by keyset pagination in the stock history endpoints.
+CREATE INDEX ix_stock_move_created_at_id ON stock_move (created_at DESC, id DESC);
 
 CREATE INDEX ix_stock_move_line_warehouse_id ON stock_move_line (warehouse_id);
 CREATE INDEX ix_stock_move_line_product_id   ON stock_move_line (product_id);
@@ -159,5 +376,6 @@ CREATE INDEX ix_stock_move_line_product_id   ON stock_move_line (product_id);
 -- CREATE INDEX IF NOT EXISTS ix_stock_move_user_id      ON stock_move (user_id);
 -- CREATE INDEX IF NOT EXISTS ix_stock_move_created_at   ON stock_move (created_at);
 -- CREATE INDEX IF NOT EXISTS ix_stock_move_move_type    ON stock_move (move_type);
+-- CREATE INDEX IF NOT EXISTS ix_stock_move_created_at_id ON stock_move (created_at DESC, id DESC);
 -- CREATE INDEX IF NOT EXISTS ix_stock_move_line_warehouse_id ON stock_move_line (warehouse_id);
 -- CREATE INDEX IF NOT EXISTS ix_stock_move_line_product_id   ON stock_move_line (product_id);
\ No newline at end of file
@@ -1,4 +1,8 @@
 -- 1. Delete dependent data
+DELETE FROM stock_daily_snapshot;
+
+DELETE FROM stock_move_daily_rollup;
+
 DELETE FROM stock_move_line;
 
 DELETE FROM stock_move;
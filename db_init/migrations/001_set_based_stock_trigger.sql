@@ -0,0 +1,142 @@
+-- MIGRATION 001 - Set-based stock update trigger
+--
+-- Replaces the FOR EACH ROW trigger on stock_move_line with a FOR EACH STATEMENT
+-- trigger that reads the inserted lines from a transition table and updates "stock"
+-- with one upsert/update per (warehouse, product, lot).
+-- Lines are still validated in insertion order, so the error raised for an invalid
+-- movement is the one the per-row trigger would have raised.
+--
+-- db_init/01_db_tables_trigger.sql already creates the new trigger on fresh volumes.
+-- For an existing database, apply it once with:
+--   psql "$DATABASE_URL" -f db_init/migrations/001_set_based_stock_trigger.sql
+-- To go back to the per-row trigger, run 001_set_based_stock_trigger_down.sql.
+--
+-- Scripts in this folder are NOT executed automatically by the PostgreSQL image
+-- (subdirectories of /docker-entrypoint-initdb.d are ignored).
+
+BEGIN;
+
+DROP TRIGGER IF EXISTS trg_update_stock ON stock_move_line;
+
+-- CREATION OF THE FUNCTION update_stock()
+-- Statement-level trigger function: it runs once per INSERT on stock_move_line and
+-- works on all inserted lines at once through the "new_lines" transition table.
+-- Lines are aggregated per (warehouse, product, lot), so a 100-line movement costs a
+-- handful of set-based statements instead of up to four lookups per line.
+CREATE OR REPLACE FUNCTION update_stock() RETURNS TRIGGER AS $$
+DECLARE
+    bad RECORD;
+BEGIN
+    -- Validate the lines in insertion order, as the per-row trigger did: the first line that
+    -- breaks a rule raises that rule's error. Each line is checked against the stock left by
+    -- the lines before it (the existing row plus this statement's earlier lines for the same
+    -- warehouse, product and lot).
+    SELECT * INTO bad
+    FROM (
+        SELECT l.move_id, l.line_id, l.warehouse_id, l.product_id, l.lot,
+               l.expiration_date, l.quantity, l.move_type,
+               -- A lot that is not in stock yet is created by its first incoming line.
+               s.lot IS NOT NULL OR COALESCE(l.incoming_before, FALSE) AS lot_exists,
+               CASE WHEN s.lot IS NULL THEN l.created_expiration ELSE s.expiration_date END AS lot_expiration,
+               COALESCE(s.quantity, 0) + COALESCE(l.net_before, 0) AS available
+        FROM (
+            SELECT nl.move_id, nl.line_id, nl.warehouse_id, nl.product_id,
+                   COALESCE(nl.lot, 'NO_LOT') AS lot, nl.expiration_date, nl.quantity, m.move_type,
+                   bool_or(m.move_type = 'incoming') OVER earlier AS incoming_before,
+                   (array_agg(nl.expiration_date) FILTER (WHERE m.move_type = 'incoming') OVER earlier)[1]
+                       AS created_expiration,
+                   SUM(CASE WHEN m.move_type = 'incoming' THEN nl.quantity ELSE -nl.quantity END)
+                       OVER earlier AS net_before
+            FROM new_lines nl
+            JOIN stock_move m ON m.id = nl.move_id
+            WINDOW earlier AS (
+                PARTITION BY nl.warehouse_id, nl.product_id, COALESCE(nl.lot, 'NO_LOT')
+                ORDER BY nl.move_id, nl.line_id
+                ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+            )
+        ) l
+        LEFT JOIN "stock" s
+               ON s.warehouse_id = l.warehouse_id
+              AND s.product_id = l.product_id
+              AND s.lot = l.lot
+    ) line
+    WHERE (line.lot = 'NO_LOT' AND line.expiration_date IS NOT NULL)
+       OR (line.lot <> 'NO_LOT' AND line.lot_exists AND line.lot_expiration <> line.expiration_date)
+       OR (line.move_type = 'outgoing' AND (NOT line.lot_exists OR line.available < line.quantity))
+    ORDER BY line.move_id, line.line_id
+    LIMIT 1;
+
+    IF FOUND THEN
+        -- Same order of checks as the per-row trigger for a single line.
+        -- If the lot is 'NO_LOT' (or not specified) but an expiration date is provided, raise exception
+        IF bad.lot = 'NO_LOT' AND bad.expiration_date IS NOT NULL THEN
+            RAISE EXCEPTION 'Cannot assign an expiration date to a product with no lot';
+        END IF;
+        -- If the lot exists but with a different expiration date, raise exception
+        IF bad.lot <> 'NO_LOT' AND bad.lot_exists AND bad.lot_expiration <> bad.expiration_date THEN
+            RAISE EXCEPTION 'Lot % already exists with a different expiration date', bad.lot;
+        END IF;
+        RAISE EXCEPTION 'Insufficient stock for product % in warehouse % with lot %',
+                        bad.product_id, bad.warehouse_id, bad.lot;
+    END IF;
+
+    -- Incoming movements: one upsert per (warehouse, product, lot)
+    INSERT INTO "stock" (warehouse_id, product_id, lot, expiration_date, quantity)
+    SELECT l.warehouse_id, l.product_id, COALESCE(l.lot, 'NO_LOT'),
+           (array_agg(l.expiration_date ORDER BY l.move_id, l.line_id))[1],
+           SUM(l.quantity)
+    FROM new_lines l
+    JOIN stock_move m ON m.id = l.move_id
+    WHERE m.move_type = 'incoming'
+    GROUP BY l.warehouse_id, l.product_id, COALESCE(l.lot, 'NO_LOT')
+    ON CONFLICT (warehouse_id, product_id, lot)
+    DO UPDATE SET quantity = "stock".quantity + EXCLUDED.quantity;
+
+    -- Outgoing movements: one guarded update per (warehouse, product, lot).
+    -- The lines were checked above; the guard catches stock taken by a concurrent
+    -- transaction since then (the update waits for it and re-reads the row).
+    WITH needed AS (
+        SELECT l.warehouse_id, l.product_id, COALESCE(l.lot, 'NO_LOT') AS lot,
+               SUM(l.quantity) AS quantity
+        FROM new_lines l
+        JOIN stock_move m ON m.id = l.move_id
+        WHERE m.move_type = 'outgoing'
+        GROUP BY l.warehouse_id, l.product_id, COALESCE(l.lot, 'NO_LOT')
+    ),
+    updated AS (
+        UPDATE "stock" s
+        SET quantity = s.quantity - n.quantity
+        FROM needed n
+        WHERE s.warehouse_id = n.warehouse_id
+          AND s.product_id = n.product_id
+          AND s.lot = n.lot
+          AND s.quantity >= n.quantity
+        RETURNING s.warehouse_id, s.product_id, s.lot
+    )
+    SELECT n.warehouse_id, n.product_id, n.lot INTO bad
+    FROM needed n
+    WHERE NOT EXISTS (
+        SELECT 1 FROM updated u
+        WHERE u.warehouse_id = n.warehouse_id
+          AND u.product_id = n.product_id
+          AND u.lot = n.lot
+    )
+    LIMIT 1;
+
+    IF FOUND THEN
+        RAISE EXCEPTION 'Insufficient stock for product % in warehouse % with lot %',
+                        bad.product_id, bad.warehouse_id, bad.lot;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- CREATION OF THE TRIGGER
+CREATE TRIGGER trg_update_stock
+AFTER INSERT ON stock_move_line
+REFERENCING NEW TABLE AS new_lines
+FOR EACH STATEMENT
+EXECUTE FUNCTION update_stock();
+
+COMMIT;
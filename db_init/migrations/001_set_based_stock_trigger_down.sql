@@ -0,0 +1,81 @@
+-- MIGRATION 001 (rollback) - Per-row stock update trigger
+--
+-- Restores the original FOR EACH ROW version of update_stock()/trg_update_stock.
+-- It is also used by backend/app/tests/test_stock_trigger.py as the reference
+-- behavior the set-based trigger is compared against.
+--
+--   psql "$DATABASE_URL" -f db_init/migrations/001_set_based_stock_trigger_down.sql
+
+BEGIN;
+
+DROP TRIGGER IF EXISTS trg_update_stock ON stock_move_line;
+
+-- CREATION OF THE FUNCTION update_stock()
+CREATE OR REPLACE FUNCTION update_stock() RETURNS TRIGGER AS $$
+DECLARE 
+    move_type_value VARCHAR(10);
+    move_user INT;
+    processed_lot VARCHAR(50);
+BEGIN
+    -- Retrieve the move type and user who created the stock move
+    SELECT move_type, user_id INTO move_type_value, move_user 
+    FROM stock_move 
+    WHERE id = NEW.move_id;
+
+    -- If lot is not specified, assign 'NO_LOT'
+    processed_lot := COALESCE(NEW.lot, 'NO_LOT'); -- Replace NULL with 'NO_LOT'
+
+    -- If the lot is 'NO_LOT' but an expiration date is provided, raise exception
+    IF processed_lot = 'NO_LOT' AND NEW.expiration_date IS NOT NULL THEN
+        RAISE EXCEPTION 'Cannot assign an expiration date to a product with no lot';
+    END IF;
+
+    -- If the lot exists but with a different expiration date, raise exception
+    IF processed_lot <> 'NO_LOT' AND (
+        SELECT COUNT(*) FROM "stock" WHERE warehouse_id = NEW.warehouse_id 
+                                    AND product_id = NEW.product_id
+                                    AND lot = processed_lot
+                                    AND expiration_date <> NEW.expiration_date) > 0 THEN
+        RAISE EXCEPTION 'Lot % already exists with a different expiration date', processed_lot;
+    END IF;
+
+    -- If it's an incoming movement, increase stock quantity
+    IF move_type_value = 'incoming' THEN
+        INSERT INTO "stock" (warehouse_id, product_id, lot, expiration_date, quantity)
+        VALUES (NEW.warehouse_id, NEW.product_id, processed_lot, NEW.expiration_date, NEW.quantity)
+        ON CONFLICT (warehouse_id, product_id, lot)
+        DO UPDATE SET quantity = "stock".quantity + NEW.quantity;
+
+    -- If it's an outgoing movement, decrease stock quantity
+    ELSIF move_type_value = 'outgoing' THEN
+
+        -- Check if there is enough stock before subtracting
+        IF (SELECT quantity FROM "stock" WHERE warehouse_id = NEW.warehouse_id 
+                                        AND product_id = NEW.product_id
+                                        AND lot = processed_lot) < NEW.quantity OR 
+           (SELECT COUNT(*) FROM "stock" WHERE warehouse_id = NEW.warehouse_id 
+                                        AND product_id = NEW.product_id
+                                        AND lot = processed_lot) = 0 THEN
+            RAISE EXCEPTION 'Insufficient stock for product % in warehouse % with lot %', 
+                            NEW.product_id, NEW.warehouse_id, processed_lot;
+        END IF;
+
+        -- Subtract the quantity from stock
+        UPDATE "stock"
+        SET quantity = GREATEST(0, quantity - NEW.quantity)
+        WHERE warehouse_id = NEW.warehouse_id 
+          AND product_id = NEW.product_id
+          AND lot = processed_lot;
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- CREATION OF THE TRIGGER
+CREATE TRIGGER trg_update_stock
+AFTER INSERT ON stock_move_line
+FOR EACH ROW
+EXECUTE FUNCTION update_stock();
+
+COMMIT;
@@ -0,0 +1,113 @@
+-- MIGRATION 002 - Daily stock snapshots for GET /stock/as-of
+--
+-- Creates stock_daily_snapshot (the API also creates it on startup if it is missing) and
+-- fills it from the existing movements: one row per (warehouse, product, lot) and UTC day
+-- with movements, holding the running total at the end of that day. Then installs
+-- trg_update_stock_daily_snapshot, which keeps it up to date for every INSERT on
+-- stock_move_line, through the API or not.
+--
+-- db_init/01_db_tables_trigger.sql already creates the table and the trigger on fresh
+-- volumes. For an existing database run:
+--   psql "$DATABASE_URL" -f db_init/migrations/002_stock_daily_snapshot.sql
+-- It can be re-run: snapshots are recomputed from stock_move_line.
+-- To remove the table, run 002_stock_daily_snapshot_down.sql.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS stock_daily_snapshot (
+    warehouse_id INT REFERENCES warehouse(id),
+    product_id INT REFERENCES product(id),
+    lot VARCHAR(50) DEFAULT 'NO_LOT',
+    snapshot_date DATE NOT NULL,
+    quantity INT NOT NULL,
+    PRIMARY KEY (warehouse_id, product_id, lot, snapshot_date)
+);
+
+-- Block new movements while the history is replayed.
+LOCK TABLE stock_move_line IN SHARE MODE;
+
+INSERT INTO stock_daily_snapshot (warehouse_id, product_id, lot, snapshot_date, quantity)
+SELECT warehouse_id, product_id, lot, snapshot_date,
+       SUM(delta) OVER (PARTITION BY warehouse_id, product_id, lot ORDER BY snapshot_date)
+FROM (
+    SELECT l.warehouse_id, l.product_id, COALESCE(l.lot, 'NO_LOT') AS lot,
+           (m.created_at AT TIME ZONE 'UTC')::date AS snapshot_date,
+           SUM(CASE WHEN m.move_type = 'incoming' THEN l.quantity ELSE -l.quantity END) AS delta
+    FROM stock_move_line l
+    JOIN stock_move m ON m.id = l.move_id
+    GROUP BY 1, 2, 3, 4
+) daily
+ON CONFLICT (warehouse_id, product_id, lot, snapshot_date)
+DO UPDATE SET quantity = EXCLUDED.quantity;
+
+-- CREATION OF THE FUNCTION update_stock_daily_snapshot()
+-- Statement-level trigger function keeping stock_daily_snapshot up to date. Its trigger is
+-- named after trg_update_stock, so it fires right after it on the same INSERT, once the
+-- stock rows of the lines are locked: movements on the same keys write their snapshots
+-- one after the other.
+-- Every snapshot from the first day of the new lines onwards is recomputed as the latest
+-- snapshot up to that day (before these lines) plus the new lines up to that day, so
+-- lines dated in the past also correct the later days.
+CREATE OR REPLACE FUNCTION update_stock_daily_snapshot() RETURNS TRIGGER AS $$
+BEGIN
+    WITH deltas AS (
+        SELECT l.warehouse_id, l.product_id, COALESCE(l.lot, 'NO_LOT') AS lot,
+               (m.created_at AT TIME ZONE 'UTC')::date AS snapshot_date,
+               SUM(CASE WHEN m.move_type = 'incoming' THEN l.quantity ELSE -l.quantity END) AS delta
+        FROM new_lines l
+        JOIN stock_move m ON m.id = l.move_id
+        GROUP BY 1, 2, 3, 4
+    ),
+    first_days AS (
+        SELECT warehouse_id, product_id, lot, MIN(snapshot_date) AS snapshot_date
+        FROM deltas
+        GROUP BY 1, 2, 3
+    ),
+    days AS (
+        SELECT warehouse_id, product_id, lot, snapshot_date FROM deltas
+        UNION
+        SELECT s.warehouse_id, s.product_id, s.lot, s.snapshot_date
+        FROM stock_daily_snapshot s
+        JOIN first_days f
+          ON f.warehouse_id = s.warehouse_id
+         AND f.product_id = s.product_id
+         AND f.lot = s.lot
+         AND s.snapshot_date > f.snapshot_date
+    )
+    INSERT INTO stock_daily_snapshot (warehouse_id, product_id, lot, snapshot_date, quantity)
+    SELECT d.warehouse_id, d.product_id, d.lot, d.snapshot_date,
+           COALESCE(previous.quantity, 0) + moved.quantity
+    FROM days d
+    LEFT JOIN LATERAL (
+        SELECT s.quantity
+        FROM stock_daily_snapshot s
+        WHERE s.warehouse_id = d.warehouse_id
+          AND s.product_id = d.product_id
+          AND s.lot = d.lot
+          AND s.snapshot_date <= d.snapshot_date
+        ORDER BY s.snapshot_date DESC
+        LIMIT 1
+    ) previous ON TRUE
+    CROSS JOIN LATERAL (
+        SELECT SUM(n.delta) AS quantity
+        FROM deltas n
+        WHERE n.warehouse_id = d.warehouse_id
+          AND n.product_id = d.product_id
+          AND n.lot = d.lot
+          AND n.snapshot_date <= d.snapshot_date
+    ) moved
+    ON CONFLICT (warehouse_id, product_id, lot, snapshot_date)
+    DO UPDATE SET quantity = EXCLUDED.quantity;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_update_stock_daily_snapshot ON stock_move_line;
+CREATE TRIGGER trg_update_stock_daily_snapshot
+AFTER INSERT ON stock_move_line
+REFERENCING NEW TABLE AS new_lines
+FOR EACH STATEMENT
+EXECUTE FUNCTION update_stock_daily_snapshot();
+
+COMMIT;
@@ -0,0 +1,14 @@
+-- MIGRATION 002 (rollback) - Daily stock snapshots
+--
+-- Drops trg_update_stock_daily_snapshot, its function and stock_daily_snapshot. Stop the
+-- API first: it recreates the table on startup.
+--
+--   psql "$DATABASE_URL" -f db_init/migrations/002_stock_daily_snapshot_down.sql
+
+BEGIN;
+
+DROP TRIGGER IF EXISTS trg_update_stock_daily_snapshot ON stock_move_line;
+DROP FUNCTION IF EXISTS update_stock_daily_snapshot();
+DROP TABLE IF EXISTS stock_daily_snapshot;
+
+COMMIT;
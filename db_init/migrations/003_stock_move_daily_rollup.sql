@@ -0,0 +1,96 @@
+-- MIGRATION 003 - Daily movement rollup for GET /stock-movements/last-year
+--
+-- Creates stock_move_daily_rollup (the API also creates it on startup if it is missing)
+-- and fills it from the existing movements. Then installs trg_rollup_stock_moves and
+-- trg_rollup_stock_move_lines, which increment it for every INSERT on stock_move and
+-- stock_move_line, through the API or not.
+--
+-- db_init/01_db_tables_trigger.sql already creates the table and the triggers on fresh
+-- volumes. For an existing database run:
+--   psql "$DATABASE_URL" -f db_init/migrations/003_stock_move_daily_rollup.sql
+-- It can be re-run: the rollup is recomputed from stock_move and stock_move_line.
+-- To remove the table, run 003_stock_move_daily_rollup_down.sql.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS stock_move_daily_rollup (
+    day DATE NOT NULL,
+    user_id INT NOT NULL REFERENCES "user"(id),
+    move_type VARCHAR(10) NOT NULL,
+    move_count INT NOT NULL DEFAULT 0,
+    line_count INT NOT NULL DEFAULT 0,
+    units INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user_id, move_type)
+);
+
+-- Block new movements while the history is counted.
+LOCK TABLE stock_move, stock_move_line IN SHARE MODE;
+
+INSERT INTO stock_move_daily_rollup (day, user_id, move_type, move_count, line_count, units)
+SELECT (m.created_at AT TIME ZONE 'UTC')::date, m.user_id, m.move_type,
+       COUNT(*), COALESCE(SUM(l.line_count), 0), COALESCE(SUM(l.units), 0)
+FROM stock_move m
+LEFT JOIN (
+    SELECT move_id, COUNT(*) AS line_count, SUM(quantity) AS units
+    FROM stock_move_line
+    GROUP BY move_id
+) l ON l.move_id = m.id
+GROUP BY 1, 2, 3
+ON CONFLICT (day, user_id, move_type)
+DO UPDATE SET move_count = EXCLUDED.move_count,
+              line_count = EXCLUDED.line_count,
+              units = EXCLUDED.units;
+
+-- CREATION OF THE FUNCTIONS rollup_stock_moves() AND rollup_stock_move_lines()
+-- Statement-level trigger functions keeping stock_move_daily_rollup up to date: one adds the
+-- inserted movements, the other the inserted lines and their units, per UTC day, user and
+-- move type. Rows are upserted in key order, so concurrent movements of the same user wait
+-- on each other's rollup rows instead of deadlocking.
+CREATE OR REPLACE FUNCTION rollup_stock_moves() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO stock_move_daily_rollup (day, user_id, move_type, move_count, line_count, units)
+    SELECT (created_at AT TIME ZONE 'UTC')::date, user_id, move_type, COUNT(*), 0, 0
+    FROM new_moves
+    WHERE move_type IS NOT NULL AND created_at IS NOT NULL
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (day, user_id, move_type)
+    DO UPDATE SET move_count = stock_move_daily_rollup.move_count + EXCLUDED.move_count;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rollup_stock_move_lines() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO stock_move_daily_rollup (day, user_id, move_type, move_count, line_count, units)
+    SELECT (m.created_at AT TIME ZONE 'UTC')::date, m.user_id, m.move_type,
+           0, COUNT(*), SUM(l.quantity)
+    FROM new_lines l
+    JOIN stock_move m ON m.id = l.move_id
+    WHERE m.move_type IS NOT NULL AND m.created_at IS NOT NULL
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (day, user_id, move_type)
+    DO UPDATE SET line_count = stock_move_daily_rollup.line_count + EXCLUDED.line_count,
+                  units = stock_move_daily_rollup.units + EXCLUDED.units;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_rollup_stock_moves ON stock_move;
+CREATE TRIGGER trg_rollup_stock_moves
+AFTER INSERT ON stock_move
+REFERENCING NEW TABLE AS new_moves
+FOR EACH STATEMENT
+EXECUTE FUNCTION rollup_stock_moves();
+
+DROP TRIGGER IF EXISTS trg_rollup_stock_move_lines ON stock_move_line;
+CREATE TRIGGER trg_rollup_stock_move_lines
+AFTER INSERT ON stock_move_line
+REFERENCING NEW TABLE AS new_lines
+FOR EACH STATEMENT
+EXECUTE FUNCTION rollup_stock_move_lines();
+
+COMMIT;
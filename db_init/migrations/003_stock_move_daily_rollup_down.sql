@@ -0,0 +1,16 @@
+-- MIGRATION 003 (rollback) - Daily movement rollup
+--
+-- Drops the rollup triggers, their functions and stock_move_daily_rollup. Stop the API
+-- first: it recreates the table on startup.
+--
+--   psql "$DATABASE_URL" -f db_init/migrations/003_stock_move_daily_rollup_down.sql
+
+BEGIN;
+
+DROP TRIGGER IF EXISTS trg_rollup_stock_moves ON stock_move;
+DROP TRIGGER IF EXISTS trg_rollup_stock_move_lines ON stock_move_line;
+DROP FUNCTION IF EXISTS rollup_stock_moves();
+DROP FUNCTION IF EXISTS rollup_stock_move_lines();
+DROP TABLE IF EXISTS stock_move_daily_rollup;
+
+COMMIT;
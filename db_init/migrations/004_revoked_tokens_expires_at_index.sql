@@ -0,0 +1,13 @@
+-- MIGRATION 004 - Index on revoked_tokens.expires_at for the background purge
+--
+-- The API deletes expired revoked tokens in batches (REVOKED_TOKENS_PURGE_BATCH_SIZE)
+-- every REVOKED_TOKENS_PURGE_INTERVAL_SECONDS; each batch looks them up by expires_at.
+-- The API creates the index itself on databases where revoked_tokens doesn't exist yet.
+-- For an existing database run:
+--   psql "$DATABASE_URL" -f db_init/migrations/004_revoked_tokens_expires_at_index.sql
+-- CONCURRENTLY keeps logouts going while the index builds, so this file has no
+-- transaction block. It can be re-run.
+-- To remove the index, run 004_revoked_tokens_expires_at_index_down.sql.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_revoked_tokens_expires_at
+    ON revoked_tokens (expires_at);
@@ -0,0 +1,8 @@
+-- MIGRATION 004 (rollback) - Index on revoked_tokens.expires_at
+--
+-- Drops the index. The purge keeps working, scanning the whole table instead.
+-- Note that the API recreates the index only when it creates the table.
+--
+--   psql "$DATABASE_URL" -f db_init/migrations/004_revoked_tokens_expires_at_index_down.sql
+
+DROP INDEX CONCURRENTLY IF EXISTS ix_revoked_tokens_expires_at;
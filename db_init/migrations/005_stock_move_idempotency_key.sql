@@ -0,0 +1,27 @@
+-- MIGRATION 005 - Idempotency keys for POST /stock-movements/
+--
+-- Creates stock_move_idempotency_key (the API also creates it on startup if it is missing).
+-- A retried movement request with the same Idempotency-Key replays the movement stored here.
+-- Keys expire after IDEMPOTENCY_KEY_TTL_HOURS and are purged in the background; the
+-- expires_at index serves that purge.
+--
+-- db_init/01_db_tables_trigger.sql already creates the table on fresh volumes.
+-- For an existing database run:
+--   psql "$DATABASE_URL" -f db_init/migrations/005_stock_move_idempotency_key.sql
+-- It can be re-run.
+-- To remove the table, run 005_stock_move_idempotency_key_down.sql.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS stock_move_idempotency_key (
+    user_id INT NOT NULL REFERENCES "user"(id),
+    key VARCHAR(255) NOT NULL,
+    request_hash VARCHAR(64) NOT NULL,
+    move_id INT NOT NULL REFERENCES stock_move(id),
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, key)
+);
+CREATE INDEX IF NOT EXISTS ix_stock_move_idempotency_key_expires_at
+    ON stock_move_idempotency_key (expires_at);
+
+COMMIT;
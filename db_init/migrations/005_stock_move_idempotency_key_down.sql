@@ -0,0 +1,13 @@
+-- MIGRATION 005 (rollback) - Idempotency keys for POST /stock-movements/
+--
+-- Drops stock_move_idempotency_key. Stop the API first: it stores a key with every
+-- movement sent with an Idempotency-Key header and recreates the table on startup.
+-- Retries of movements sent before the rollback are then processed as new movements.
+--
+--   psql "$DATABASE_URL" -f db_init/migrations/005_stock_move_idempotency_key_down.sql
+
+BEGIN;
+
+DROP TABLE IF EXISTS stock_move_idempotency_key;
+
+COMMIT;